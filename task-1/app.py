@@ -1,19 +1,47 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import os
 import sqlite3
+import time
+import base64
+import io
 import json
-import re
-from typing import Dict, List, Union, Tuple
+from typing import Dict, Iterator, List, Optional, Union, Tuple
 from flask_cors import CORS
+from rule_compiler import compile_rule
+from rule_cache import RuleCache
+from rule_stats import PredicateStats
+from rule_optimizer import build_balanced, optimize_rule
+from rule_parser import RuleParser
+from rule_bdd import DecisionDiagram, compile_bdd
+from rule_program import RuleProgram, compile_program, encode_rule, ensure_program_column
+from sql_translator import create_indexes, get_indexed_columns, get_user_columns, recommend_indexes, translate_rule
+from db_pool import ConnectionPool
+from bulk_ingest import IngestAborted, ingest_users, read_records, validate_user
+from eligibility import EligibilityStore
+from result_cache import ResultCache
+from metrics import Metrics
 
 app = Flask(__name__)
 CORS(app)  # This will enable CORS for all routes
 
+# Connections are opened once, in WAL mode, and returned to the pool by conn.close();
+# RULES_DATABASE points the app at another database file (the tests use a scratch one)
+db_pool = ConnectionPool(os.environ.get('RULES_DATABASE', 'database.db'), row_factory=sqlite3.Row)
+
+# Route latencies and time in SQLite, parsing and evaluation, served on /metrics; RULES_METRICS=0 turns it off
+metrics = Metrics(enabled=os.environ.get('RULES_METRICS', '1') != '0')
+if metrics.enabled:
+    db_pool.observer = metrics.observe_sqlite
+# RULES_PROFILE=<seconds between samples> starts the sampling profiler with the app
+if os.environ.get('RULES_PROFILE'):
+    metrics.start_profiler(float(os.environ['RULES_PROFILE']))
+
 def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.acquire()
 
 class Node:
+    __slots__ = ('type', 'value', 'left', 'right')
+
     def __init__(self, node_type, value=None, left=None, right=None):
         self.type = node_type
         self.value = value
@@ -28,73 +56,52 @@ class Node:
         else:
             return f"Node({self.type}, {self.value}, {self.left}, {self.right})"
 
+# Parsed rules keyed by their tokens, shared by create_rule_fun callers (combine_rules, the rule cache, ...)
+rule_parser = RuleParser(Node, max_size=4096)
+
 def create_rule_fun(rule_string: str) -> Node:
-    def parse_expression(tokens: List[str]) -> Node:
-        output_queue = []
-        operator_stack = []
-        
-        precedence = {
-            'OR': 1,
-            'AND': 2,
-            '>': 3, '<': 3, '>=': 3, '<=': 3, '=': 3, '==': 3
-        }
-
-        def pop_greater_precedence(op):
-            while (operator_stack and operator_stack[-1] != '(' and 
-                   precedence.get(operator_stack[-1], 0) >= precedence.get(op, 0)):
-                output_queue.append(operator_stack.pop())
-
-        for token in tokens:
-            if token == '(':
-                operator_stack.append(token)
-            elif token == ')':
-                while operator_stack and operator_stack[-1] != '(':
-                    output_queue.append(operator_stack.pop())
-                if operator_stack and operator_stack[-1] == '(':
-                    operator_stack.pop()
-                else:
-                    raise ValueError("Mismatched parentheses")
-            elif token in precedence:
-                pop_greater_precedence(token)
-                operator_stack.append(token)
-            else:
-                output_queue.append(Node("operand", value=token))
+    # Returns a cached tree shared with other callers; build new nodes rather than modifying it
+    with metrics.phase('parse'):
+        return rule_parser.parse(rule_string)
 
-        while operator_stack:
-            if operator_stack[-1] == '(':
-                raise ValueError("Mismatched parentheses")
-            output_queue.append(operator_stack.pop())
+def combine_rules(rules: List[str], operator="OR") -> Node:
+    if not rules:
+        return None
 
-        stack = []
-        for item in output_queue:
-            if isinstance(item, Node):
-                stack.append(item)
-            else:  # operator
-                if len(stack) < 2:
-                    raise ValueError(f"Invalid expression: not enough operands for {item}")
-                right = stack.pop()
-                left = stack.pop()
-                stack.append(Node("operator", value=item, left=left, right=right))
+    rule_asts = [create_rule_fun(rule) for rule in rules]
 
-        if len(stack) != 1:
-            raise ValueError("Invalid expression")
+    # Balanced rather than left-deep, so thousands of rules stay shallow to walk
+    return build_balanced(operator, rule_asts, Node)
 
-        return stack[0]
+# Pass rates and costs of rule predicates, persisted in the predicate_stats table
+predicate_stats = PredicateStats()
 
-    tokens = re.findall(r'\(|\)|\w+|[<>=]+|\'[^\']*\'', rule_string)
-    return parse_expression(tokens)
+def load_predicate_stats():
+    conn = get_db_connection()
+    predicate_stats.load(conn)
+    conn.close()
 
-def combine_rules(rules: List[str], operator="OR") -> Node:
-    if not rules:
-        return None
+def flush_predicate_stats(conn=None):
+    if not predicate_stats.due_for_flush():
+        return
+    if conn is not None:
+        predicate_stats.flush(conn)
+        return
+    conn = get_db_connection()
+    predicate_stats.flush(conn)
+    conn.close()
 
-    rule_asts = [create_rule_fun(rule) for rule in rules]
+load_predicate_stats()
 
-    combined_ast = rule_asts[0]
-    for ast in rule_asts[1:]:
-        combined_ast = Node("operator", value=operator, left=combined_ast, right=ast)
+def load_rule_programs():
+    conn = get_db_connection()
+    ensure_program_column(conn, create_rule_fun)
+    conn.close()
 
-    return combined_ast
+load_rule_programs()
+
+# Parsed and compiled rules shared by all requests, invalidated whenever a rule is added
+rule_cache = RuleCache(create_rule_fun, max_size=4096, stats=predicate_stats, node_class=Node)
 
 def evaluate_rule(ast: Node, data: Dict[str, Union[int, str, float]]) -> bool:
     def convert_value(value):
@@ -154,50 +161,357 @@ def evaluate_rule(ast: Node, data: Dict[str, Union[int, str, float]]) -> bool:
 
     raise ValueError(f"Invalid AST node type: {ast.type}")
 
-@app.route('/users', methods=['POST'])
-def create_user():
-    data = request.get_json()
-    data = data["data"]
+# Per-user /evaluate results, dropped by every user or rule write made through this app
+result_cache = ResultCache(ttl=30.0)
+
+# The work behind each route, shared by the Flask views and the ASGI app (asgi.py)
+
+def insert_user(data) -> int:
     conn = get_db_connection()
-    conn.execute('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
-                 (data['name'], data['age'], data['department'], data['income'], data['experience']))
+    cursor = conn.execute('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
+                          (data['name'], data['age'], data['department'], data['income'], data['experience']))
+    # Commits the new user together with its eligibility rows
+    eligibility_store.refresh_user(conn, cursor.lastrowid)
+    conn.close()
+    result_cache.invalidate_user(cursor.lastrowid)
+    return cursor.lastrowid
+
+def replace_user(user_id: int, values: Tuple) -> bool:
+    conn = get_db_connection()
+    cursor = conn.execute('UPDATE users SET name = ?, age = ?, department = ?, income = ?, experience = ? WHERE id = ?',
+                          (*values, user_id))
+    if cursor.rowcount == 0:
+        conn.rollback()
+        conn.close()
+        return False
+    eligibility_store.refresh_user(conn, user_id)
+    conn.close()
+    result_cache.invalidate_user(user_id)
+    return True
+
+def insert_rule(name: str, condition: str) -> int:
+    conn = get_db_connection()
+    cursor = conn.execute('INSERT INTO rules (name, condition, program) VALUES (?, ?, ?)',
+                          (name, condition, encode_rule(condition, create_rule_fun)))
     conn.commit()
+    rule_cache.bump_version()
+    result_cache.invalidate_rules()
+    # Existing users are evaluated against the new rule in the background
+    eligibility_store.add_rule(conn, cursor.lastrowid)
     conn.close()
+    return cursor.lastrowid
+
+def lookup_user(user_id: int):
+    return result_cache.get_or_compute(user_id, lambda: _lookup_user(user_id))
+
+def _lookup_user(user_id: int):
+    conn = get_db_connection()
+    result = eligibility_store.lookup(conn, user_id)
+    flush_predicate_stats(conn)
+    conn.close()
+    return result
+
+def parse_rule(rule_string: str) -> Dict[str, str]:
+    rule_ast = create_rule_fun(rule_string)
+    # The program, unlike the repr, can be sent back to /evaluate_rule
+    program = base64.b64encode(compile_program(rule_ast).to_bytes(rule_string)).decode('ascii')
+    return {'rule_ast': repr(rule_ast), 'rule_program': program}
+
+def combine_rule_strings(rules: List[str], optimize: bool = False) -> Node:
+    combined_ast = combine_rules(rules)
+    if optimize:
+        combined_ast = optimize_rule(combined_ast)
+    return combined_ast
+
+def describe_diagram(rule_ast: Node) -> Dict[str, int]:
+    evaluate = compile_bdd(rule_ast)
+    return {'predicates': len(evaluate.diagram.predicates), 'nodes': evaluate.diagram.size(evaluate.root)}
+
+def compare_rules(rule_a: str, rule_b: str) -> Dict[str, bool]:
+    diagram = DecisionDiagram()
+    a = diagram.compile(create_rule_fun(rule_a))
+    b = diagram.compile(create_rule_fun(rule_b))
+    return {
+        'equivalent': diagram.equivalent(a, b),
+        'a_implies_b': diagram.implies(a, b),
+        'b_implies_a': diagram.implies(b, a),
+    }
+
+def run_rule(rule_ast_json, rule_program, user_data, decision_diagram=False):
+    with metrics.phase('evaluate'):
+        if rule_program:
+            return RuleProgram.from_bytes(base64.b64decode(rule_program)).run(user_data)
+        rule_ast = json.loads(rule_ast_json, object_hook=lambda d: Node(**d))
+        if decision_diagram:
+            return compile_bdd(rule_ast)(user_data)
+        return compile_rule(rule_ast)(user_data)
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_started = (time.perf_counter(), time.thread_time())
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe_request(request.method, request.endpoint or 'unmatched', response.status_code,
+                                time.perf_counter() - started[0], time.thread_time() - started[1])
+    return response
+
+@app.route('/users', methods=['POST'])
+def create_user():
+    data = request.get_json()
+    insert_user(data["data"])
     return jsonify({'status': 'User created successfully'}), 201
 
+@app.route('/users/<int:user_id>', methods=['PUT'])
+def update_user(user_id):
+    data = request.get_json()
+    try:
+        values = validate_user(data.get('data', data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not replace_user(user_id, values):
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify({'status': 'User updated successfully'}), 200
+
+@app.route('/users/bulk', methods=['POST'])
+def create_users_bulk():
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        batch_size = int(request.args.get('batch_size', 10000))
+    except ValueError:
+        batch_size = 0
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+
+    # Parse the body as it arrives rather than buffering millions of rows
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    conn = get_db_connection()
+    try:
+        report = ingest_users(conn, read_records(lines, fmt), batch_size=batch_size)
+    except IngestAborted as e:
+        # Earlier batches stay committed; the report says how many rows made it
+        return jsonify(e.report), 400
+    finally:
+        conn.close()
+    return jsonify(report), 200
+
 @app.route('/rules', methods=['POST'])
 def create_rule():
     data = request.get_json()
     data = data['data']
-    conn = get_db_connection()
-    conn.execute('INSERT INTO rules (name, condition) VALUES (?, ?)',
-                 (data['name'], data['condition']))
-    conn.commit()
-    conn.close()
+    insert_rule(data['name'], data['condition'])
     return jsonify({'status': 'Rule created successfully'}), 201
 
+def prepare_user_data(user) -> Dict[str, Union[int, str, float]]:
+    user_dict = dict(user)
+    # Add 'salary' and 'experience' to user_dict if not present
+    if 'salary' not in user_dict:
+        user_dict['salary'] = user_dict.get('income', 0)
+    if 'experience' not in user_dict:
+        user_dict['experience'] = 0  # Assume 0 if not provided
+    return user_dict
+
+# Materialized per-user results, read by /evaluate/<user_id>
+eligibility_store = EligibilityStore(get_db_connection, rule_cache, prepare_user_data, metrics=metrics)
+eligibility_store.start()
+
+def query_flag(value: Optional[str]) -> bool:
+    # ?all=0 and ?all=false turn a flag off, so only these spellings turn it on
+    return (value or '').lower() in ('1', 'true', 'yes')
+
 @app.route('/evaluate/<int:user_id>', methods=['GET'])
 def evaluate_user(user_id):
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    if user is None:
+    result = lookup_user(user_id)
+    if result is None:
         return jsonify({'error': 'User not found'}), 404
-    
-    rules = conn.execute('SELECT * FROM rules').fetchall()
+
+    matched, version = result
+    if query_flag(request.args.get('all')):
+        return jsonify({'eligible': bool(matched), 'matched_rules': matched, 'version': version}), 200
+    return jsonify({'eligible': bool(matched), 'version': version}), 200
+
+BATCH_CHUNK_SIZE = 500
+
+def iter_user_chunks(conn, user_ids=None, start_id=None, end_id=None, chunk_size=BATCH_CHUNK_SIZE):
+    if user_ids is not None:
+        for i in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[i:i + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT * FROM users WHERE id IN ({placeholders})', chunk).fetchall()
+            yield chunk, rows
+        return
+
+    # Keyset pagination keeps every query an index range scan, however far into the table we are
+    last_id = start_id - 1 if start_id is not None else -1
+    while True:
+        if end_id is not None:
+            rows = conn.execute('SELECT * FROM users WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                                (last_id, end_id, chunk_size)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?',
+                                (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield None, rows
+        last_id = rows[-1]['id']
+
+def parse_batch_request(data) -> Dict:
+    # Keyword arguments for iter_user_chunks; ValueError describes a malformed request
+    user_ids = data.get('user_ids')
+    id_range = data.get('id_range')
+    if user_ids is not None:
+        if not isinstance(user_ids, list) or not all(isinstance(i, int) for i in user_ids):
+            raise ValueError('user_ids must be a list of integers')
+        return {'user_ids': user_ids}
+    if id_range is not None:
+        if not isinstance(id_range, list) or len(id_range) != 2 or not all(isinstance(i, int) for i in id_range):
+            raise ValueError('id_range must be [start_id, end_id]')
+        return {'start_id': id_range[0], 'end_id': id_range[1]}
+    if data.get('all', False):
+        return {}
+    raise ValueError('one of user_ids, id_range or all is required')
+
+def evaluate_batch_lines(chunk_args: Dict) -> Iterator[str]:
+    # The rules are read now; users are read and evaluated a chunk at a time as the NDJSON lines are consumed
+    conn = get_db_connection()
+    rules = conn.execute('SELECT id, condition, program FROM rules').fetchall()
+    ruleset = rule_cache.get_ruleset((rule['id'], rule['condition'], rule['program']) for rule in rules)
+
+    def generate():
+        try:
+            for requested_ids, rows in iter_user_chunks(conn, **chunk_args):
+                users = {row['id']: row for row in rows}
+                for user_id in (requested_ids if requested_ids is not None else users):
+                    user = users.get(user_id)
+                    if user is None:
+                        yield json.dumps({'user_id': user_id, 'error': 'User not found'}) + '\n'
+                        continue
+                    user_dict = prepare_user_data(user)
+                    matched = ruleset.matching_rules(user_dict)
+                    yield json.dumps({'user_id': user_id, 'eligible': bool(matched), 'matched_rules': matched}) + '\n'
+                flush_predicate_stats(conn)
+        finally:
+            conn.close()
+
+    return generate()
+
+@app.route('/evaluate/batch', methods=['POST'])
+def evaluate_batch():
+    try:
+        chunk_args = parse_batch_request(request.get_json() or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(stream_with_context(evaluate_batch_lines(chunk_args)), mimetype='application/x-ndjson')
+
+def find_rule_users(rule_id: int) -> Optional[Dict]:
+    # Ids of the users a stored rule matches, or None for an unknown rule
+    conn = get_db_connection()
+    rule = conn.execute('SELECT id, condition, program FROM rules WHERE id = ?', (rule_id,)).fetchone()
+    if rule is None:
+        conn.close()
+        return None
+
+    rule_ast, rule_fn = rule_cache.get_entry(rule['id'], rule['condition'], rule['program'])
+    where, params, exact = translate_rule(rule_ast, get_user_columns(conn))
+
+    if where is not None and exact:
+        rows = conn.execute(f'SELECT id FROM users WHERE {where} ORDER BY id', params)
+        user_ids = [row['id'] for row in rows]
+        pushdown = 'full'
+    else:
+        # Let SQLite narrow the candidates where it can and finish the rule in Python
+        query = 'SELECT * FROM users' + (f' WHERE {where}' if where is not None else '') + ' ORDER BY id'
+        rows = conn.execute(query, params)
+        user_ids = [row['id'] for row in rows if rule_fn(prepare_user_data(row))]
+        pushdown = 'partial' if where is not None else 'none'
     conn.close()
-    
-    user_dict = dict(user)
+    return {'rule_id': rule_id, 'user_ids': user_ids, 'pushdown': pushdown}
+
+@app.route('/rules/<int:rule_id>/users', methods=['GET'])
+def rule_matching_users(rule_id):
+    result = find_rule_users(rule_id)
+    if result is None:
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify(result), 200
+
+def valid_index_limit(limit) -> bool:
+    return isinstance(limit, int) and not isinstance(limit, bool) and limit >= 0
+
+def index_report(create_limit: Optional[int] = None) -> Dict:
+    # Recommended indexes; with create_limit, up to that many of the missing ones are created first
+    conn = get_db_connection()
+    columns = get_user_columns(conn)
+    rules = conn.execute('SELECT id, condition, program FROM rules').fetchall()
+    rule_asts = []
     for rule in rules:
-        rule_ast = create_rule_fun(rule["condition"])
-        
-        # Add 'salary' and 'experience' to user_dict if not present
-        if 'salary' not in user_dict:
-            user_dict['salary'] = user_dict.get('income', 0)
-        if 'experience' not in user_dict:
-            user_dict['experience'] = 0  # Assume 0 if not provided
-        if evaluate_rule(rule_ast, user_dict):
-            return jsonify({'eligible': True}), 200
-    return jsonify({'eligible': False}), 200
+        try:
+            rule_asts.append(rule_cache.get_entry(rule['id'], rule['condition'], rule['program'])[0])
+        except ValueError:
+            continue  # an unparseable rule cannot use any index
+    recommendations = recommend_indexes(rule_asts, columns)
+
+    created = []
+    if create_limit is not None:
+        indexed = set(get_indexed_columns(conn))
+        to_create = [column for column, _ in recommendations if column not in indexed][:create_limit]
+        created = create_indexes(conn, to_create)
+
+    indexed = set(get_indexed_columns(conn))
+    conn.close()
+    return {
+        'recommendations': [
+            {'column': column, 'references': count, 'indexed': column in indexed}
+            for column, count in recommendations
+        ],
+        'created': created,
+    }
+
+@app.route('/rules/indexes', methods=['GET', 'POST'])
+def rule_indexes():
+    if request.method == 'GET':
+        return jsonify(index_report()), 200
+    limit = (request.get_json(silent=True) or {}).get('limit', 3)
+    if not valid_index_limit(limit):
+        return jsonify({'error': 'limit must be a non-negative integer'}), 400
+    return jsonify(index_report(limit)), 200
+
+@app.route('/rules/stats', methods=['GET'])
+def rule_predicate_stats():
+    return jsonify({'predicates': predicate_stats.snapshot()}), 200
+
+def cache_stats() -> Dict:
+    stats = rule_cache.stats()
+    stats['parser'] = rule_parser.stats()
+    stats['results'] = result_cache.stats()
+    return stats
+
+@app.route('/rules/cache', methods=['GET'])
+def rule_cache_stats():
+    return jsonify(cache_stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profile', methods=['GET', 'POST', 'DELETE'])
+def metrics_profile():
+    # POST starts the sampling profiler, GET reports what it has seen so far, DELETE stops it and reports
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        metrics.start_profiler(float(data.get('interval', 0.005)))
+    elif request.method == 'DELETE':
+        metrics.stop_profiler()
+    report = metrics.profile_report(request.args.get('top', 20, type=int))
+    if report is None:
+        return jsonify({'error': 'The profiler has not been started'}), 404
+    return jsonify(report), 200
 
 @app.route('/create_rule', methods=['POST'])
 def create_rule_api():
@@ -207,8 +521,7 @@ def create_rule_api():
         return jsonify({'error': 'rule_string is required'}), 400
 
     try:
-        rule_ast = create_rule_fun(rule_string)
-        return jsonify({'rule_ast': repr(rule_ast)}), 200
+        return jsonify(parse_rule(rule_string)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -220,8 +533,11 @@ def combine_rules_api():
         return jsonify({'error': 'rules list is required'}), 400
 
     try:
-        combined_ast = combine_rules(rules)
-        return jsonify({'combined_rule_ast': repr(combined_ast)}), 200
+        combined_ast = combine_rule_strings(rules, data.get('optimize', False))
+        response = {'combined_rule_ast': repr(combined_ast)}
+        if data.get('decision_diagram'):
+            response['decision_diagram'] = describe_diagram(combined_ast)
+        return jsonify(response), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -229,16 +545,29 @@ def combine_rules_api():
 def evaluate_rule_api():
     data = request.get_json()
     rule_ast_json = data.get('rule_ast')
+    rule_program = data.get('rule_program')
     user_data = data.get('data')
-    if not rule_ast_json or not user_data:
-        return jsonify({'error': 'rule_ast and data are required'}), 400
+    if not (rule_ast_json or rule_program) or not user_data:
+        return jsonify({'error': 'rule_ast or rule_program, and data are required'}), 400
 
     try:
-        rule_ast = json.loads(rule_ast_json, object_hook=lambda d: Node(**d))
-        result = evaluate_rule(rule_ast, user_data)
+        result = run_rule(rule_ast_json, rule_program, user_data, data.get('decision_diagram', False))
         return jsonify({'result': result}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/rules/compare', methods=['POST'])
+def compare_rules_api():
+    data = request.get_json()
+    rule_a = data.get('rule_a')
+    rule_b = data.get('rule_b')
+    if not rule_a or not rule_b:
+        return jsonify({'error': 'rule_a and rule_b are required'}), 400
+
+    try:
+        return jsonify(compare_rules(rule_a, rule_b)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 if __name__ == '__main__':
     app.run(debug=True)
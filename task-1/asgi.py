@@ -0,0 +1,312 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import GeneratorType
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import app as rule_app
+from bulk_ingest import validate_user
+
+# SQLite calls block, so they run on a pool sized like the connection pool;
+# rule parsing and evaluation get their own bounded pool so they cannot starve I/O
+db_executor = ThreadPoolExecutor(max_workers=rule_app.db_pool.max_idle, thread_name_prefix='rules-db')
+cpu_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='rules-cpu')
+
+_CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'content-type'),
+    (b'access-control-allow-methods', b'GET, POST, PUT, DELETE, OPTIONS'),
+]
+
+# A str payload is sent as plain text, a generator of str as streamed NDJSON, anything else as JSON
+Response = Tuple[int, Union[Dict, str, Iterator[str]]]
+
+# NDJSON lines produced per trip to the database executor
+STREAM_LINES = 100
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, fn, *args)
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, fn, *args)
+
+class Coalescer:
+    """Lets concurrent callers asking for the same key share one in-flight computation."""
+
+    def __init__(self):
+        self._inflight: Dict[object, asyncio.Future] = {}
+        self.shared = 0
+
+    async def run(self, key, compute: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(compute())
+        self._inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+evaluations = Coalescer()
+
+async def create_user(body, query) -> Response:
+    await run_db(rule_app.insert_user, body['data'])
+    return 201, {'status': 'User created successfully'}
+
+async def update_user(body, query, user_id) -> Response:
+    try:
+        values = validate_user(body.get('data', body))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    if not await run_db(rule_app.replace_user, user_id, values):
+        raise HTTPError(404, 'User not found')
+    return 200, {'status': 'User updated successfully'}
+
+async def create_rule(body, query) -> Response:
+    data = body['data']
+    await run_db(rule_app.insert_rule, data['name'], data['condition'])
+    return 201, {'status': 'Rule created successfully'}
+
+async def evaluate_user(body, query, user_id) -> Response:
+    result = await evaluations.run(user_id, lambda: run_db(rule_app.lookup_user, user_id))
+    if result is None:
+        raise HTTPError(404, 'User not found')
+    matched, version = result
+    if rule_app.query_flag(query.get('all')):
+        return 200, {'eligible': bool(matched), 'matched_rules': matched, 'version': version}
+    return 200, {'eligible': bool(matched), 'version': version}
+
+async def create_rule_api(body, query) -> Response:
+    rule_string = body.get('rule_string')
+    if not rule_string:
+        raise HTTPError(400, 'rule_string is required')
+    try:
+        return 200, await run_cpu(rule_app.parse_rule, rule_string)
+    except Exception as e:
+        raise HTTPError(400, str(e))
+
+async def combine_rules_api(body, query) -> Response:
+    rules = body.get('rules')
+    if not rules:
+        raise HTTPError(400, 'rules list is required')
+    try:
+        combined_ast = await run_cpu(rule_app.combine_rule_strings, rules, body.get('optimize', False))
+        response = {'combined_rule_ast': repr(combined_ast)}
+        if body.get('decision_diagram'):
+            response['decision_diagram'] = await run_cpu(rule_app.describe_diagram, combined_ast)
+        return 200, response
+    except Exception as e:
+        raise HTTPError(400, str(e))
+
+async def evaluate_rule_api(body, query) -> Response:
+    rule_ast_json = body.get('rule_ast')
+    rule_program = body.get('rule_program')
+    user_data = body.get('data')
+    if not (rule_ast_json or rule_program) or not user_data:
+        raise HTTPError(400, 'rule_ast or rule_program, and data are required')
+    try:
+        return 200, {'result': await run_cpu(rule_app.run_rule, rule_ast_json, rule_program, user_data,
+                                             body.get('decision_diagram', False))}
+    except Exception as e:
+        raise HTTPError(400, str(e))
+
+async def compare_rules_api(body, query) -> Response:
+    rule_a = body.get('rule_a')
+    rule_b = body.get('rule_b')
+    if not rule_a or not rule_b:
+        raise HTTPError(400, 'rule_a and rule_b are required')
+    try:
+        return 200, await run_cpu(rule_app.compare_rules, rule_a, rule_b)
+    except Exception as e:
+        raise HTTPError(400, str(e))
+
+async def evaluate_batch(body, query) -> Response:
+    try:
+        chunk_args = rule_app.parse_batch_request(body)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    return 200, await run_db(rule_app.evaluate_batch_lines, chunk_args)
+
+async def rule_matching_users(body, query, rule_id) -> Response:
+    result = await run_db(rule_app.find_rule_users, rule_id)
+    if result is None:
+        raise HTTPError(404, 'Rule not found')
+    return 200, result
+
+async def rule_indexes(body, query) -> Response:
+    return 200, await run_db(rule_app.index_report)
+
+async def create_rule_indexes(body, query) -> Response:
+    limit = body.get('limit', 3)
+    if not rule_app.valid_index_limit(limit):
+        raise HTTPError(400, 'limit must be a non-negative integer')
+    return 200, await run_db(rule_app.index_report, limit)
+
+# Both methods share the Flask view's name, so metrics report one route
+create_rule_indexes.__name__ = 'rule_indexes'
+
+async def rule_predicate_stats(body, query) -> Response:
+    return 200, {'predicates': await run_cpu(rule_app.predicate_stats.snapshot)}
+
+async def rule_cache_stats(body, query) -> Response:
+    return 200, rule_app.cache_stats()
+
+async def metrics_endpoint(body, query) -> Response:
+    return 200, rule_app.metrics.render()
+
+def _profile_handler(action: Optional[str]) -> Callable:
+    # GET reports what the sampling profiler has seen so far, POST starts it, DELETE stops it and reports
+    async def metrics_profile(body, query) -> Response:
+        if action == 'start':
+            rule_app.metrics.start_profiler(float(body.get('interval', 0.005)))
+        elif action == 'stop':
+            rule_app.metrics.stop_profiler()
+        report = await run_cpu(rule_app.metrics.profile_report, int(query.get('top', 20)))
+        if report is None:
+            raise HTTPError(404, 'The profiler has not been started')
+        return 200, report
+    return metrics_profile
+
+# Every Flask route except POST /users/bulk, which parses the request body as it streams in
+# and commits it batch by batch on one thread; a handler here would have to buffer the body
+ROUTES: List[Tuple[str, re.Pattern, Callable]] = [
+    ('POST', re.compile(r'/users'), create_user),
+    ('PUT', re.compile(r'/users/(\d+)'), update_user),
+    ('POST', re.compile(r'/rules'), create_rule),
+    ('POST', re.compile(r'/rules/compare'), compare_rules_api),
+    ('GET', re.compile(r'/evaluate/(\d+)'), evaluate_user),
+    ('POST', re.compile(r'/evaluate/batch'), evaluate_batch),
+    ('GET', re.compile(r'/rules/(\d+)/users'), rule_matching_users),
+    ('GET', re.compile(r'/rules/indexes'), rule_indexes),
+    ('POST', re.compile(r'/rules/indexes'), create_rule_indexes),
+    ('GET', re.compile(r'/rules/stats'), rule_predicate_stats),
+    ('GET', re.compile(r'/rules/cache'), rule_cache_stats),
+    ('POST', re.compile(r'/create_rule'), create_rule_api),
+    ('POST', re.compile(r'/combine_rules'), combine_rules_api),
+    ('POST', re.compile(r'/evaluate_rule'), evaluate_rule_api),
+    ('GET', re.compile(r'/metrics'), metrics_endpoint),
+    ('GET', re.compile(r'/metrics/profile'), _profile_handler(None)),
+    ('POST', re.compile(r'/metrics/profile'), _profile_handler('start')),
+    ('DELETE', re.compile(r'/metrics/profile'), _profile_handler('stop')),
+]
+
+def _match(method: str, path: str) -> Tuple[Optional[Callable], List[int], bool]:
+    # (handler, path arguments, whether the path exists under another method)
+    path_known = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.fullmatch(path)
+        if match:
+            if route_method == method:
+                return handler, [int(arg) for arg in match.groups()], True
+            path_known = True
+    return None, [], path_known
+
+def _parse_query(query_string: bytes) -> Dict[str, str]:
+    query = {}
+    for pair in query_string.decode('latin-1').split('&'):
+        if pair:
+            key, _, value = pair.partition('=')
+            query[key] = value
+    return query
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+def _take(lines: Iterator[str]) -> List[str]:
+    return list(itertools.islice(lines, STREAM_LINES))
+
+async def _stream(send, lines: Iterator[str]):
+    headers = [(b'content-type', b'application/x-ndjson')]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers + _CORS_HEADERS})
+    try:
+        # The generator reads SQLite, so it only ever advances on the database executor
+        while True:
+            chunk = await run_db(_take, lines)
+            if not chunk:
+                break
+            await send({'type': 'http.response.body', 'body': ''.join(chunk).encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        # Returns the generator's connection to the pool, also when the client went away
+        await run_db(lines.close)
+
+async def _send(send, status: int, payload):
+    if isinstance(payload, GeneratorType):
+        await _stream(send, payload)
+        return
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), b'text/plain; version=0.0.4'
+    else:
+        body, content_type = json.dumps(payload).encode('utf-8'), b'application/json'
+    headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers + _CORS_HEADERS})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=True)
+            cpu_executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point serving the rule API routes from one event loop."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    if method == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': _CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    started = time.perf_counter()
+    handler, args, path_known = _match(method, scope['path'])
+    if handler is None:
+        status = 405 if path_known else 404
+        await _send(send, status, {'error': 'Method not allowed' if path_known else 'Not found'})
+        rule_app.metrics.observe_request(method, 'unmatched', status, time.perf_counter() - started)
+        return
+
+    try:
+        raw = await _read_body(receive)
+        body = json.loads(raw) if raw else {}
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'request body must be a JSON object')
+        status, payload = await handler(body, _parse_query(scope.get('query_string', b'')), *args)
+    except HTTPError as e:
+        status, payload = e.status, {'error': str(e)}
+    except (ValueError, KeyError, TypeError) as e:
+        status, payload = 400, {'error': str(e)}
+    await _send(send, status, payload)
+    # Handlers share names with the Flask views, so both front ends report the same routes.
+    # Their work runs on executor threads, so no per-request CPU time is recorded here.
+    rule_app.metrics.observe_request(method, handler.__name__, status, time.perf_counter() - started)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=5000)
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from rule_compiler import compile_rule
+from rule_parser import parse_rule
+
+ATTRIBUTES = ['age', 'department', 'income', 'experience', 'salary']
+DEPARTMENTS = ['Sales', 'Marketing', 'HR', 'IT', 'Finance']
+
+# Sizes used unless --quick is given; width, overlap and attributes shape the generated rules
+FULL = {'rules': 1000, 'users': 5000, 'depth': 4, 'width': 2, 'overlap': 0.5, 'attributes': len(ATTRIBUTES),
+        'combine_sizes': [10, 100, 1000, 10000], 'requests': 2000}
+QUICK = {'rules': 100, 'users': 500, 'depth': 3, 'width': 2, 'overlap': 0.5, 'attributes': len(ATTRIBUTES),
+         'combine_sizes': [10, 100, 1000], 'requests': 200}
+
+def generate_predicate(rng: random.Random, attributes: List[str], literals: Dict[str, List]) -> str:
+    attribute = rng.choice(attributes)
+    if attribute == 'department':
+        return f"department = '{rng.choice(literals['department'])}'"
+    return f"{attribute} {rng.choice(['>', '<', '>=', '<='])} {rng.choice(literals[attribute])}"
+
+def generate_rule(rng: random.Random, depth: int, width: int = 2, attributes: Optional[List[str]] = None,
+                  overlap: float = 0.5) -> str:
+    """A random rule string: AND/OR trees `depth` levels deep with `width` operands per level.
+
+    Lower overlap draws literals from a wider range, so fewer predicates repeat across rules.
+    """
+    attributes = attributes or ATTRIBUTES
+    spread = max(1, int(10 / max(overlap, 0.01)))
+    literals = {
+        'age': [18 + 5 * i for i in range(spread)],
+        'income': [20000 + 5000 * i for i in range(spread)],
+        'salary': [20000 + 5000 * i for i in range(spread)],
+        'experience': list(range(spread)),
+        'department': DEPARTMENTS,
+    }
+
+    def build(level: int) -> str:
+        if level == depth or (level > 0 and rng.random() < 0.2):
+            return generate_predicate(rng, attributes, literals)
+        op = rng.choice(['AND', 'OR'])
+        return '(' + f' {op} '.join(build(level + 1) for _ in range(width)) + ')'
+    return build(0)
+
+def generate_users(rng: random.Random, count: int) -> List[Dict]:
+    return [{
+        'name': f'user{i}',
+        'age': rng.randint(18, 70),
+        'department': rng.choice(DEPARTMENTS),
+        'income': rng.randint(20, 200) * 1000,
+        'experience': rng.randint(0, 40),
+    } for i in range(count)]
+
+def _user_data(user: Dict) -> Dict:
+    # What /evaluate feeds the rules for a stored user
+    data = dict(user)
+    data['salary'] = data['income']
+    return data
+
+def _throughput(fn, items: List, min_seconds: float = 0.5) -> float:
+    # Items processed per second, repeating the pass until min_seconds have elapsed
+    done = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        done += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return done / elapsed
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _metric(value: float, unit: str, higher_is_better: bool) -> Dict:
+    return {'value': round(value, 3), 'unit': unit, 'higher_is_better': higher_is_better}
+
+def bench_parse(rule_strings: List[str], node_class) -> Dict[str, Dict]:
+    # The parser itself: create_rule_fun goes through the app's parse cache, so after the
+    # first pass this would only time dictionary lookups
+    return {
+        'parse': _metric(_throughput(lambda s: parse_rule(s, node_class), rule_strings), 'rules/s', True),
+    }
+
+def bench_evaluate(asts: List, users: List[Dict], evaluate_rule) -> Dict[str, Dict]:
+    pairs = [(ast, _user_data(user)) for ast in asts[:50] for user in users[:50]]
+    compiled = [(compile_rule(ast), data) for ast, data in pairs]
+    return {
+        'evaluate_rule': _metric(_throughput(lambda p: evaluate_rule(*p), pairs), 'evaluations/s', True),
+        'evaluate_compiled': _metric(_throughput(lambda p: p[0](p[1]), compiled), 'evaluations/s', True),
+    }
+
+def bench_combine(rule_strings: List[str], sizes: List[int], combine_rules) -> Dict[str, Dict]:
+    results = {}
+    for size in sizes:
+        rules = [rule_strings[i % len(rule_strings)] for i in range(size)]
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            combine_rules(rules)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[f'combine_rules_{size}'] = _metric(min(timings), 'ms', False)
+    return results
+
+def _create_database(path: str, rule_strings: List[str], users: List[Dict]):
+    from setup_database import create_database
+
+    create_database(path)
+    conn = sqlite3.connect(path)
+    # Replace the sample rows, restarting ids at 1
+    conn.execute('DELETE FROM users')
+    conn.execute('DELETE FROM rules')
+    conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('users', 'rules')")
+    conn.executemany('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
+                     [(u['name'], u['age'], u['department'], u['income'], u['experience']) for u in users])
+    conn.executemany('INSERT INTO rules (name, condition) VALUES (?, ?)',
+                     [(f'rule{i}', condition) for i, condition in enumerate(rule_strings)])
+    conn.commit()
+    conn.close()
+
+def bench_endpoint(client, user_count: int, requests: int, rng: random.Random) -> Dict[str, Dict]:
+    results = {}
+    for name, query in (('evaluate_endpoint', ''), ('evaluate_endpoint_all', '?all=1')):
+        samples = []
+        for _ in range(requests):
+            path = f'/evaluate/{rng.randint(1, user_count)}{query}'
+            start = time.perf_counter()
+            response = client.get(path)
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        results[f'{name}_p50'] = _metric(_percentile(samples, 0.5), 'ms', False)
+        results[f'{name}_p99'] = _metric(_percentile(samples, 0.99), 'ms', False)
+    return results
+
+def run(sizes: Dict, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    attributes = ATTRIBUTES[:sizes['attributes']]
+    rule_strings = [generate_rule(rng, sizes['depth'], sizes['width'], attributes, sizes['overlap'])
+                    for _ in range(sizes['rules'])]
+    users = generate_users(rng, sizes['users'])
+
+    # app opens RULES_DATABASE on import, so point it at a scratch copy
+    workdir = tempfile.mkdtemp(prefix='rule-bench-')
+    rule_app = None
+    try:
+        path = os.path.join(workdir, 'database.db')
+        _create_database(path, rule_strings, users)
+        os.environ['RULES_DATABASE'] = path
+        import app as rule_app
+
+        asts = [rule_app.create_rule_fun(s) for s in rule_strings]
+        results = {}
+        results.update(bench_parse(rule_strings, rule_app.Node))
+        results.update(bench_evaluate(asts, users, rule_app.evaluate_rule))
+        results.update(bench_combine(rule_strings, sizes['combine_sizes'], rule_app.combine_rules))
+        # Measure the steady state, not the eligibility backfill that starts with the app
+        rule_app.eligibility_store.join()
+        results.update(bench_endpoint(rule_app.app.test_client(), len(users), sizes['requests'], rng))
+    finally:
+        if rule_app is not None:
+            rule_app.db_pool.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'sizes': sizes,
+        },
+        'results': results,
+    }
+
+def _settings(report: Dict) -> Dict:
+    meta = report.get('meta', {})
+    return {'seed': meta.get('seed'), **meta.get('sizes', {})}
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than threshold (a fraction).
+
+    Raises ValueError when the two runs used different sizes or seeds, as their numbers are not comparable.
+    """
+    ours, theirs = _settings(current), _settings(baseline)
+    differences = [f"{name} {theirs.get(name)!r} -> {ours.get(name)!r}"
+                   for name in sorted(set(ours) | set(theirs)) if ours.get(name) != theirs.get(name)]
+    if differences:
+        raise ValueError("baseline was run with different settings: " + ', '.join(differences))
+
+    regressions = []
+    for name, metric in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if not base['value']:
+            # No relative change from zero; anything above it is worse when lower is better
+            if not metric['higher_is_better'] and metric['value'] > 0:
+                regressions.append(f"{name}: 0 -> {metric['value']} {metric['unit']}")
+            continue
+        change = (metric['value'] - base['value']) / base['value']
+        worse = -change if metric['higher_is_better'] else change
+        if worse > threshold:
+            regressions.append(f"{name}: {base['value']} -> {metric['value']} {metric['unit']} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rule engine on synthetic rules and users.')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, as a fraction')
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, help='operands per AND/OR level (default 2)')
+    parser.add_argument('--overlap', type=float,
+                        help='how often predicates repeat across rules, from 0.01 (rarely) to 1 (default 0.5)')
+    parser.add_argument('--attributes', type=int, choices=range(1, len(ATTRIBUTES) + 1),
+                        help=f'number of user attributes the rules refer to (default {len(ATTRIBUTES)})')
+    args = parser.parse_args()
+    if args.width is not None and args.width < 2:
+        parser.error('--width must be at least 2')
+    if args.overlap is not None and not 0 < args.overlap <= 1:
+        parser.error('--overlap must be in (0, 1]')
+
+    sizes = dict(QUICK if args.quick else FULL)
+    for name in ('width', 'overlap', 'attributes'):
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    report = run(sizes, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, metric in report['results'].items():
+        print(f"{name:32} {metric['value']:>14} {metric['unit']}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as e:
+            parser.error(f"{args.baseline}: {e}")
+        if regressions:
+            print('Regressions:')
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('No regressions against', args.baseline)
+
+if __name__ == "__main__":
+    main()
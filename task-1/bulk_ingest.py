@@ -0,0 +1,174 @@
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Columns of the users table and how each value is validated
+USER_FIELDS = (
+    ('name', str),
+    ('age', int),
+    ('department', str),
+    ('income', float),
+    ('experience', float),
+)
+
+INSERT_USER = 'INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)'
+
+def _convert(field: str, kind, value):
+    if value is None or value == '':
+        raise ValueError(f"missing field '{field}'")
+    if isinstance(value, bool):
+        raise ValueError(f"'{field}' must be {kind.__name__}, got {value!r}")
+    if kind is str:
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"'{field}' must be a non-empty string")
+        return value
+    try:
+        if kind is int and isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError
+            return int(value)
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be {kind.__name__}, got {value!r}") from None
+
+def validate_user(record) -> Tuple:
+    if not isinstance(record, dict):
+        raise ValueError("row must be an object")
+    # Accept the {"data": {...}} body of POST /users as well as flat rows
+    if isinstance(record.get('data'), dict):
+        record = record['data']
+    return tuple(_convert(field, kind, record.get(field)) for field, kind in USER_FIELDS)
+
+def iter_ndjson(lines: Iterable[str]) -> Iterator[Tuple[int, object]]:
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+
+def iter_csv(lines: Iterable[str]) -> Iterator[Tuple[int, object]]:
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+class IngestAborted(ValueError):
+    """The input could not be read to the end; report describes what was committed before that."""
+
+    def __init__(self, message: str, report: Dict):
+        super().__init__(message)
+        self.report = report
+
+def ingest_users(conn: sqlite3.Connection, records: Iterable[Tuple[int, object]],
+                 batch_size: int = 10000, max_errors: int = 1000) -> Dict:
+    """Validate and insert (line number, record) pairs, one transaction per batch.
+
+    Invalid rows are skipped and reported by line; they never abort the batch.
+    If the input itself breaks off (bad encoding, malformed CSV), the rows read
+    so far are committed and IngestAborted is raised with the report.
+    """
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    inserted = failed = 0
+    aborted = None
+    errors: List[Dict] = []
+    start = time.perf_counter()
+
+    def record_error(line_no, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append({'line': line_no, 'error': message})
+
+    def flush(batch):
+        nonlocal inserted
+        try:
+            with conn:
+                conn.executemany(INSERT_USER, [values for _, values in batch])
+            inserted += len(batch)
+        except sqlite3.IntegrityError:
+            # Retry row by row so one bad row only loses itself
+            with conn:
+                for line_no, values in batch:
+                    try:
+                        conn.execute(INSERT_USER, values)
+                        inserted += 1
+                    except sqlite3.IntegrityError as e:
+                        record_error(line_no, str(e))
+
+    batch = []
+    records = iter(records)
+    line_no = 0
+    while True:
+        try:
+            line_no, record = next(records)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            # Decoding or CSV errors end the input; what was read before them is still committed
+            aborted = f"unreadable input after line {line_no}: {e}"
+            break
+        if isinstance(record, Exception):
+            record_error(line_no, str(record))
+            continue
+        try:
+            batch.append((line_no, validate_user(record)))
+        except ValueError as e:
+            record_error(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    seconds = time.perf_counter() - start
+    report = {
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(inserted / seconds) if seconds else 0,
+    }
+    if aborted is not None:
+        report['error'] = aborted
+        raise IngestAborted(aborted, report)
+    return report
+
+def detect_format(name: str) -> str:
+    return 'csv' if name.lower().endswith('.csv') else 'ndjson'
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, object]]:
+    return iter_csv(stream) if fmt == 'csv' else iter_ndjson(stream)
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load users from an NDJSON or CSV file.')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('ndjson', 'csv'))
+    parser.add_argument('--database', default='database.db')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error('--batch-size must be a positive integer')
+
+    conn = sqlite3.connect(args.database)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    try:
+        with io.open(args.path, encoding='utf-8', newline='') as f:
+            report = ingest_users(conn, read_records(f, args.format or detect_format(args.path)), args.batch_size)
+    except IngestAborted as e:
+        print(json.dumps(e.report, indent=2))
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
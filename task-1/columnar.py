@@ -0,0 +1,234 @@
+import sqlite3
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from rule_compiler import apply_operator, convert_value, is_attribute
+
+# Same defaults evaluate_user applies to a user row
+_ALIASES = {'salary': 'income'}
+_DEFAULTS = {'salary': 0, 'experience': 0}
+
+_NUMPY_OPS = {
+    "==": np.equal,
+    "=": np.equal,
+    ">": np.greater,
+    "<": np.less,
+    ">=": np.greater_equal,
+    "<=": np.less_equal,
+}
+
+class EncodedColumn:
+    """Dictionary-encoded column: one small code per row plus the distinct values."""
+
+    def __init__(self, codes: np.ndarray, categories: List):
+        self.codes = codes
+        self.categories = categories
+        # Operands are converted once per distinct value instead of once per row
+        self.values = [convert_value(c) for c in categories]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def slice(self, start: int, stop: int) -> 'EncodedColumn':
+        # Shares the categories and their converted values with this column
+        column = EncodedColumn.__new__(EncodedColumn)
+        column.codes = self.codes[start:stop]
+        column.categories = self.categories
+        column.values = self.values
+        return column
+
+    def decode(self) -> np.ndarray:
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values[self.codes]
+
+class _Constant:
+    def __init__(self, value):
+        self.value = value
+
+Column = Union[np.ndarray, EncodedColumn]
+
+class ColumnTable:
+    def __init__(self, ids: np.ndarray, columns: Dict[str, Column]):
+        self.ids = ids
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.ids)
+
+    def slice(self, start: int, stop: int) -> 'ColumnTable':
+        # Rows start..stop as views, without copying the underlying arrays
+        return ColumnTable(self.ids[start:stop],
+                           {name: column.slice(start, stop) if isinstance(column, EncodedColumn) else column[start:stop]
+                            for name, column in self.columns.items()})
+
+    def column(self, name: str):
+        if name in self.columns:
+            return self.columns[name]
+        alias = _ALIASES.get(name)
+        if alias in self.columns:
+            return self.columns[alias]
+        if name in _DEFAULTS:
+            return _Constant(_DEFAULTS[name])
+        return None
+
+class _ColumnBuilder:
+    def __init__(self):
+        self.chunks: List[np.ndarray] = []
+        self.encoding: Optional[Dict] = None
+        self.categories: List = []
+
+    def _encode(self, values) -> np.ndarray:
+        encoding = self.encoding
+        categories = self.categories
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = encoding.get(value)
+            if code is None:
+                code = encoding[value] = len(categories)
+                categories.append(value)
+            codes[i] = code
+        return codes
+
+    def append(self, values):
+        if self.encoding is None:
+            array = np.array(values)
+            if array.dtype.kind in 'if':
+                self.chunks.append(array)
+                return
+            # Text (or mixed/NULL) data: switch this column to dictionary encoding for good
+            self.encoding = {}
+            self.chunks = [self._encode(chunk.tolist()) for chunk in self.chunks]
+        self.chunks.append(self._encode(values))
+
+    def build(self) -> Column:
+        if self.encoding is None:
+            return np.concatenate(self.chunks) if self.chunks else np.empty(0)
+        codes = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.int32)
+        return EncodedColumn(codes, self.categories)
+
+def referenced_columns(attributes, known) -> List[str]:
+    # The users columns a set of rule attributes reads, following the salary -> income alias
+    wanted = set(attributes) | {_ALIASES[name] for name in attributes if name in _ALIASES}
+    return [name for name in known if name in wanted]
+
+def load_user_columns(conn: sqlite3.Connection, columns: Optional[List[str]] = None,
+                      chunk_size: int = 100000) -> ColumnTable:
+    if columns is None:
+        columns = ['age', 'department', 'income', 'experience']
+    known = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    for name in columns:
+        if name not in known:
+            raise ValueError(f"Unknown users column: {name}")
+
+    cursor = conn.execute(f'SELECT id, {", ".join(columns)} FROM users ORDER BY id')
+    ids = []
+    builders = {name: _ColumnBuilder() for name in columns}
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        values = list(zip(*rows))
+        ids.append(np.array(values[0], dtype=np.int64))
+        for name, column_values in zip(columns, values[1:]):
+            builders[name].append(column_values)
+
+    id_array = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    return ColumnTable(id_array, {name: builder.build() for name, builder in builders.items()})
+
+def _truth(value, size: int) -> np.ndarray:
+    if isinstance(value, _Constant):
+        return np.full(size, bool(value.value))
+    if isinstance(value, EncodedColumn):
+        return np.array([bool(v) for v in value.values], dtype=bool)[value.codes]
+    if value.dtype == bool:
+        return value
+    return value != 0
+
+def _objects(value, size: int) -> np.ndarray:
+    if isinstance(value, _Constant):
+        values = np.empty(size, dtype=object)
+        values[:] = [value.value] * size
+        return values
+    if isinstance(value, EncodedColumn):
+        return value.decode()
+    return value.astype(object)
+
+def _compare(op: str, left, right, size: int):
+    left_constant = isinstance(left, _Constant)
+    right_constant = isinstance(right, _Constant)
+    if left_constant and right_constant:
+        return _Constant(apply_operator(op, left.value, right.value))
+
+    # Column against a literal: the common "age > 30" / "department = 'Sales'" shape
+    if left_constant or right_constant:
+        column, constant = (right, left.value) if left_constant else (left, right.value)
+        if left_constant:
+            scalar = lambda v: apply_operator(op, constant, v)
+        else:
+            scalar = lambda v: apply_operator(op, v, constant)
+
+        if isinstance(column, EncodedColumn):
+            lookup = np.array([scalar(v) for v in column.values], dtype=bool)
+            return lookup[column.codes]
+
+        if isinstance(constant, (int, float)):
+            if left_constant:
+                return _NUMPY_OPS[op](constant, column)
+            return _NUMPY_OPS[op](column, constant)
+        if op in ("==", "="):
+            # A number never equals a string
+            return np.zeros(size, dtype=bool)
+        # Numbers compared as strings: evaluate once per distinct value
+        distinct, inverse = np.unique(column, return_inverse=True)
+        lookup = np.array([scalar(v.item()) for v in distinct], dtype=bool)
+        return lookup[inverse]
+
+    if isinstance(left, np.ndarray) and isinstance(right, np.ndarray):
+        return _NUMPY_OPS[op](left, right)
+
+    pairwise = np.frompyfunc(lambda a, b: apply_operator(op, a, b), 2, 1)
+    return pairwise(_objects(left, size), _objects(right, size)).astype(bool)
+
+def _compile(node) -> Callable[[ColumnTable], object]:
+    if node.type == "operand":
+        key = node.value
+        constant = _Constant(convert_value(key))
+        if not is_attribute(key):
+            return lambda table: constant
+
+        def load(table):
+            column = table.column(key)
+            return constant if column is None else column
+        return load
+
+    if node.type == "operator":
+        op = node.value
+        if op not in ("AND", "OR") and op not in _NUMPY_OPS:
+            raise ValueError(f"Unknown operator: {op}")
+        left = _compile(node.left)
+        right = _compile(node.right)
+
+        if op == "AND":
+            return lambda table: _truth(left(table), len(table)) & _truth(right(table), len(table))
+        if op == "OR":
+            return lambda table: _truth(left(table), len(table)) | _truth(right(table), len(table))
+        return lambda table: _compare(op, left(table), right(table), len(table))
+
+    raise ValueError(f"Invalid AST node type: {node.type}")
+
+def compile_columnar(ast) -> Callable[[ColumnTable], np.ndarray]:
+    """Compile a Node tree into mask operations that score a whole ColumnTable at once.
+
+    Row i of the returned boolean mask is truthy exactly when evaluate_rule
+    accepts user table.ids[i].
+    """
+    fn = _compile(ast)
+
+    def evaluate(table: ColumnTable) -> np.ndarray:
+        return _truth(fn(table), len(table))
+    return evaluate
+
+def evaluate_columnar(ast, table: ColumnTable) -> np.ndarray:
+    return compile_columnar(ast)(table)
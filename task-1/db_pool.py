@@ -0,0 +1,157 @@
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+# Applied once per connection rather than once per request
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',       # readers no longer block on a writer (persisted in the file)
+    'PRAGMA synchronous=NORMAL',     # durable at checkpoints, which is safe under WAL
+    'PRAGMA busy_timeout=5000',      # wait for a competing writer instead of failing immediately
+    'PRAGMA cache_size=-16000',      # 16 MB page cache per connection
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor reporting the seconds spent in each execute and fetch call to an observer."""
+
+    observer: Callable[[float], None]
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self.observer(time.perf_counter() - start)
+
+    def execute(self, *args):
+        return self._timed(sqlite3.Cursor.execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(sqlite3.Cursor.executemany, *args)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    pool: Optional['ConnectionPool'] = None
+    checked_out = False
+
+    def _observer(self) -> Optional[Callable[[float], None]]:
+        return self.pool.observer if self.pool is not None else None
+
+    def execute(self, *args):
+        observer = self._observer()
+        if observer is None:
+            return super().execute(*args)
+        cursor = self.cursor(TimedCursor)
+        cursor.observer = observer
+        return cursor.execute(*args)
+
+    def executemany(self, *args):
+        observer = self._observer()
+        if observer is None:
+            return super().executemany(*args)
+        cursor = self.cursor(TimedCursor)
+        cursor.observer = observer
+        return cursor.executemany(*args)
+
+    def commit(self):
+        observer = self._observer()
+        if observer is None:
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            observer(time.perf_counter() - start)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.pool.release(self)
+        # else: already back in the pool, closing it twice is a no-op
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+class ConnectionPool:
+    """Keeps up to max_idle open connections to one SQLite database.
+
+    Connections are handed out most-recently-used first, so each keeps
+    a warm page cache and prepared statement cache. Callers that leak a
+    connection never block others: the pool only bounds how many idle
+    connections it holds on to.
+
+    Setting observer to a callable makes connections report the seconds
+    spent in every execute, fetch and commit to it (rows read by iterating
+    over a cursor are not timed).
+    """
+
+    def __init__(self, path: str, max_idle: int = 8, row_factory=sqlite3.Row,
+                 cached_statements: int = 256, timeout: float = 5.0):
+        self.path = path
+        self.max_idle = max_idle
+        self.row_factory = row_factory
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.observer: Optional[Callable[[float], None]] = None
+
+    def _open(self) -> PooledConnection:
+        # check_same_thread is off because a connection may serve different request threads in turn
+        conn = sqlite3.connect(self.path, timeout=self.timeout, factory=PooledConnection,
+                               cached_statements=self.cached_statements, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        self.opened += 1
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        if conn is None:
+            conn = self._open()
+        conn.pool = self
+        conn.checked_out = True
+        conn.row_factory = self.row_factory
+        return conn
+
+    def release(self, conn: PooledConnection):
+        if conn.pool is not self or not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            # Never hand the next request a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.discard()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
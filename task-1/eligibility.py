@@ -0,0 +1,205 @@
+import queue
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+
+def ensure_eligibility_tables(conn: sqlite3.Connection):
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS eligibility (
+        user_id INTEGER NOT NULL,
+        rule_id INTEGER NOT NULL,
+        matched INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, rule_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS eligibility_backfill (
+        rule_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        complete INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS eligibility_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO eligibility_version (id, version) VALUES (1, 0);
+    ''')
+
+def bump_version(conn: sqlite3.Connection) -> int:
+    conn.execute('UPDATE eligibility_version SET version = version + 1 WHERE id = 1')
+    return conn.execute('SELECT version FROM eligibility_version WHERE id = 1').fetchone()[0]
+
+class EligibilityStore:
+    """Materialized (user_id, rule_id, matched) results, kept up to date incrementally.
+
+    A changed user is re-evaluated against every rule straight away; a new
+    rule is evaluated against all users by a background thread, a chunk of
+    users per transaction. Each row carries the eligibility version it was
+    computed at. Rows not materialized yet are evaluated on read.
+    """
+
+    def __init__(self, connect: Callable, rule_cache, prepare: Callable, chunk_size: int = 1000, metrics=None):
+        self.connect = connect
+        self.rule_cache = rule_cache
+        self.prepare = prepare
+        self.chunk_size = chunk_size
+        self.metrics = metrics
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def _rule_fn(self, rule) -> Optional[Callable]:
+        try:
+            return self.rule_cache.get_entry(rule['id'], rule['condition'], rule['program'])[1]
+        except ValueError:
+            return None  # an unparseable rule matches nobody
+
+    def _phase(self, name: str):
+        return self.metrics.phase(name) if self.metrics is not None else nullcontext()
+
+    def _matching_rules(self, rules, user_dict) -> List[int]:
+        try:
+            ruleset = self.rule_cache.get_ruleset((rule['id'], rule['condition'], rule['program']) for rule in rules)
+        except ValueError:
+            return [rule['id'] for rule in rules if self._evaluate(rule, user_dict)]
+        matched = ruleset.matching_rules(user_dict)
+        if self.metrics is not None:
+            matched_ids = set(matched)
+            for rule in rules:
+                self.metrics.record_rule(rule['id'], rule['id'] in matched_ids)
+        return matched
+
+    def _evaluate(self, rule, user_dict) -> bool:
+        fn = self._rule_fn(rule)
+        result = fn is not None and bool(fn(user_dict))
+        if self.metrics is not None:
+            self.metrics.record_rule(rule['id'], result)
+        return result
+
+    def refresh_user(self, conn: sqlite3.Connection, user_id: int) -> int:
+        # Re-evaluate one user against every rule; the caller's pending writes are committed with it
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        rules = conn.execute('SELECT id, condition, program FROM rules').fetchall()
+        version = bump_version(conn)
+        if user is not None:
+            with self._phase('evaluate'):
+                matched = set(self._matching_rules(rules, self.prepare(user)))
+            conn.executemany(
+                'INSERT OR REPLACE INTO eligibility (user_id, rule_id, matched, version) VALUES (?, ?, ?, ?)',
+                [(user_id, rule['id'], int(rule['id'] in matched), version) for rule in rules])
+        conn.commit()
+        return version
+
+    def lookup(self, conn: sqlite3.Connection, user_id: int) -> Optional[Tuple[List[int], int]]:
+        # (matched rule ids, oldest version among the results), or None for an unknown user
+        user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        if user is None:
+            return None
+        rows = conn.execute('''
+            SELECT r.id, r.condition, r.program, e.matched, e.version
+            FROM rules r LEFT JOIN eligibility e ON e.user_id = ? AND e.rule_id = r.id
+            ORDER BY r.id
+        ''', (user_id,)).fetchall()
+
+        matched = []
+        versions = []
+        missing = []
+        for row in rows:
+            if row['matched'] is None:
+                missing.append(row)
+                continue
+            versions.append(row['version'])
+            if row['matched']:
+                matched.append(row['id'])
+        if missing:
+            # Rules still being backfilled (or users loaded in bulk): evaluate now and keep the result
+            user_dict = self.prepare(user)
+            version = conn.execute('SELECT version FROM eligibility_version WHERE id = 1').fetchone()[0]
+            results = []
+            with self._phase('evaluate'):
+                for rule in missing:
+                    result = self._evaluate(rule, user_dict)
+                    results.append((user_id, rule['id'], int(result), version))
+                    if result:
+                        matched.append(rule['id'])
+            conn.executemany('INSERT OR IGNORE INTO eligibility (user_id, rule_id, matched, version) VALUES (?, ?, ?, ?)',
+                             results)
+            conn.commit()
+            versions.append(version)
+            matched.sort()
+        return matched, min(versions) if versions else 0
+
+    def add_rule(self, conn: sqlite3.Connection, rule_id: int):
+        version = bump_version(conn)
+        conn.execute('INSERT OR REPLACE INTO eligibility_backfill (rule_id, version) VALUES (?, ?)',
+                     (rule_id, version))
+        conn.commit()
+        self._queue.put(rule_id)
+
+    def backfill_rule(self, rule_id: int):
+        conn = self.connect()
+        try:
+            while True:
+                # Reading the chunk and writing its results in one write transaction
+                # keeps a concurrent refresh_user from being overwritten with stale data
+                conn.execute('BEGIN IMMEDIATE')
+                progress = conn.execute('SELECT version, last_user_id, complete FROM eligibility_backfill WHERE rule_id = ?',
+                                        (rule_id,)).fetchone()
+                rule = conn.execute('SELECT id, condition, program FROM rules WHERE id = ?', (rule_id,)).fetchone()
+                if progress is None or progress['complete'] or rule is None:
+                    conn.commit()
+                    return
+                users = conn.execute('SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?',
+                                     (progress['last_user_id'], self.chunk_size)).fetchall()
+                if not users:
+                    conn.execute('UPDATE eligibility_backfill SET complete = 1 WHERE rule_id = ?', (rule_id,))
+                    conn.commit()
+                    return
+                with self._phase('evaluate'):
+                    results = [(user['id'], rule_id, int(self._evaluate(rule, self.prepare(user))), progress['version'])
+                               for user in users]
+                conn.executemany(
+                    'INSERT OR IGNORE INTO eligibility (user_id, rule_id, matched, version) VALUES (?, ?, ?, ?)',
+                    results)
+                conn.execute('UPDATE eligibility_backfill SET last_user_id = ? WHERE rule_id = ?',
+                             (users[-1]['id'], rule_id))
+                conn.commit()
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            rule_id = self._queue.get()
+            try:
+                self.backfill_rule(rule_id)
+            except sqlite3.Error:
+                # Left incomplete; picked up again on the next start
+                pass
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        # Block until every queued backfill has been attempted
+        self._queue.join()
+
+    def start(self):
+        # Resume unfinished backfills and register rules that predate the table
+        conn = self.connect()
+        ensure_eligibility_tables(conn)
+        version = conn.execute('SELECT version FROM eligibility_version WHERE id = 1').fetchone()[0]
+        conn.execute('''
+            INSERT INTO eligibility_backfill (rule_id, version)
+            SELECT id, ? FROM rules WHERE id NOT IN (SELECT rule_id FROM eligibility_backfill)
+        ''', (version,))
+        conn.commit()
+        pending = [row[0] for row in conn.execute('SELECT rule_id FROM eligibility_backfill WHERE complete = 0')]
+        conn.close()
+        for rule_id in pending:
+            self._queue.put(rule_id)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='eligibility-backfill', daemon=True)
+            self._worker.start()
@@ -0,0 +1,286 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, as in the Prometheus client defaults with sub-millisecond buckets added
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Leaf frames in these files are threads parked on a lock, queue or socket (or an idle executor worker)
+_IDLE_FILES = ('threading.py', 'queue.py', 'thread.py', 'selectors.py', 'socket.py', 'socketserver.py')
+
+_NULL_PHASE = nullcontext()
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Phase:
+    # Times one block as self time: phases nested inside it (and SQLite calls) are not counted twice
+    __slots__ = ('metrics', 'name', 'start', 'nested', 'parent')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        local = self.metrics._local
+        self.parent = getattr(local, 'phase', None)
+        local.phase = self
+        self.nested = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics._local.phase = self.parent
+        self.metrics._record_phase(self.name, elapsed - self.nested)
+        if self.parent is not None:
+            self.parent.nested += elapsed
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread at a fixed interval from a background thread.
+
+    Threads waiting in the standard library's locks, queues and sockets are
+    skipped, so the samples show where busy threads spend their time. Readers
+    go through snapshot(), since the sampling thread keeps adding stacks.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 48):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self, own_id: int):
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            stack.reverse()
+            stacks.append(';'.join(stack))
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += len(stacks)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own_id)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name='rules-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def snapshot(self) -> Counter:
+        # A copy of the stack counts that the sampling thread cannot change underneath the caller
+        with self._lock:
+            return Counter(self.stacks)
+
+    def hottest_functions(self, top: int = 20) -> List[Tuple[str, int]]:
+        # Samples with the function on the stack (inclusive), each function counted once per stack
+        counts: Counter = Counter()
+        for stack, samples in self.snapshot().items():
+            for frame in set(frame.rsplit(':', 1)[0] for frame in stack.split(';')):
+                counts[frame] += samples
+        return counts.most_common(top)
+
+    def collapsed(self) -> str:
+        # "frame;frame;frame count" lines, the input format of flame graph tools
+        return ''.join(f'{stack} {samples}\n' for stack, samples in self.snapshot().most_common())
+
+class Metrics:
+    """Request latencies, time per phase (sqlite, parse, evaluate) and per-rule outcomes.
+
+    Updates are plain counter increments without a lock: they are statistics,
+    and a rare lost update under contention is fine. Only adding a new key
+    takes the lock, which render and the reports also hold while copying the
+    tables, so they never iterate a dict that is growing.
+    When disabled every recording call returns straight away.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # (method, route, status) -> latency histogram; (method, route) -> CPU seconds
+        self.requests: Dict[Tuple[str, str, int], Histogram] = {}
+        self.request_cpu: Dict[Tuple[str, str], float] = {}
+        # phase -> [seconds, calls]
+        self.phases: Dict[str, List] = {}
+        # rule id -> [evaluations, matches]
+        self.rules: Dict[int, List[int]] = {}
+        self.profiler: Optional[SamplingProfiler] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _entry(self, table: Dict, key, default):
+        # The value under key, added under the lock if missing; existing keys need no lock
+        value = table.get(key)
+        if value is None:
+            with self._lock:
+                value = table.setdefault(key, default())
+        return value
+
+    def _items(self, table: Dict) -> List:
+        with self._lock:
+            return list(table.items())
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        cpu_seconds: Optional[float] = None):
+        if not self.enabled:
+            return
+        self._entry(self.requests, (method, route, status), Histogram).observe(seconds)
+        if cpu_seconds is not None:
+            self._entry(self.request_cpu, (method, route), float)
+            self.request_cpu[method, route] += cpu_seconds
+
+    def phase(self, name: str):
+        """Context manager adding the block's duration to the named phase."""
+        return _Phase(self, name) if self.enabled else _NULL_PHASE
+
+    def _record_phase(self, name: str, seconds: float):
+        totals = self._entry(self.phases, name, lambda: [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def add_time(self, name: str, seconds: float):
+        # For time measured elsewhere, e.g. by the connection pool; taken out of the enclosing phase
+        if not self.enabled:
+            return
+        self._record_phase(name, seconds)
+        parent = getattr(self._local, 'phase', None)
+        if parent is not None:
+            parent.nested += seconds
+
+    def observe_sqlite(self, seconds: float):
+        self.add_time('sqlite', seconds)
+
+    def record_rule(self, rule_id: int, matched: bool):
+        if not self.enabled:
+            return
+        counts = self._entry(self.rules, rule_id, lambda: [0, 0])
+        counts[0] += 1
+        counts[1] += matched
+
+    def hottest_rules(self, top: int = 20) -> List[Dict]:
+        ranked = sorted(self._items(self.rules), key=lambda item: item[1][0], reverse=True)[:top]
+        return [{'rule_id': rule_id, 'evaluations': evaluations, 'matches': matches,
+                 'match_rate': matches / evaluations if evaluations else 0.0}
+                for rule_id, (evaluations, matches) in ranked]
+
+    def start_profiler(self, interval: float = 0.005) -> SamplingProfiler:
+        if self.profiler is None or not self.profiler.running:
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def profile_report(self, top: int = 20) -> Optional[Dict]:
+        profiler = self.profiler
+        if profiler is None:
+            return None
+        stacks = profiler.snapshot()
+        return {
+            'running': profiler.running,
+            'interval': profiler.interval,
+            'samples': profiler.samples,
+            'seconds': time.time() - profiler.started,
+            'hottest_rules': self.hottest_rules(top),
+            'hottest_functions': [{'function': name, 'samples': samples}
+                                  for name, samples in profiler.hottest_functions(top)],
+            'stacks': [{'stack': stack, 'samples': samples} for stack, samples in stacks.most_common(top)],
+        }
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP rules_request_duration_seconds Request latency by route.',
+            '# TYPE rules_request_duration_seconds histogram',
+        ]
+        for (method, route, status), histogram in sorted(self._items(self.requests)):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                labels = _labels(method=method, route=route, status=status, le=bound)
+                lines.append(f'rules_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(method=method, route=route, status=status)
+            lines.append(f'rules_request_duration_seconds_sum{labels} {histogram.sum}')
+            lines.append(f'rules_request_duration_seconds_count{labels} {histogram.count}')
+
+        lines += [
+            '# HELP rules_request_cpu_seconds_total CPU time of the threads serving each route.',
+            '# TYPE rules_request_cpu_seconds_total counter',
+        ]
+        for (method, route), seconds in sorted(self._items(self.request_cpu)):
+            lines.append(f'rules_request_cpu_seconds_total{_labels(method=method, route=route)} {seconds}')
+
+        lines += [
+            '# HELP rules_phase_seconds_total Time spent in SQLite, rule parsing and rule evaluation.',
+            '# TYPE rules_phase_seconds_total counter',
+        ]
+        phases = sorted(self._items(self.phases))
+        lines += [f'rules_phase_seconds_total{_labels(phase=name)} {seconds}'
+                  for name, (seconds, calls) in phases]
+        lines += ['# TYPE rules_phase_calls_total counter']
+        lines += [f'rules_phase_calls_total{_labels(phase=name)} {calls}'
+                  for name, (seconds, calls) in phases]
+
+        lines += [
+            '# HELP rules_rule_evaluations_total Evaluations of each stored rule against a user.',
+            '# TYPE rules_rule_evaluations_total counter',
+        ]
+        rules = sorted(self._items(self.rules))
+        lines += [f'rules_rule_evaluations_total{_labels(rule_id=rule_id)} {evaluations}'
+                  for rule_id, (evaluations, matches) in rules]
+        lines += ['# TYPE rules_rule_matches_total counter']
+        lines += [f'rules_rule_matches_total{_labels(rule_id=rule_id)} {matches}'
+                  for rule_id, (evaluations, matches) in rules]
+
+        lines += [
+            '# HELP process_cpu_seconds_total Total user and system CPU time of the process.',
+            '# TYPE process_cpu_seconds_total counter',
+            f'process_cpu_seconds_total {time.process_time()}',
+        ]
+        return '\n'.join(lines) + '\n'
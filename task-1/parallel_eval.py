@@ -0,0 +1,178 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from columnar import ColumnTable, EncodedColumn, compile_columnar, load_user_columns, referenced_columns
+from rule_engine import Node
+from rule_program import RuleProgram
+
+# (shared memory block name, dtype, shape)
+ArraySpec = Tuple[str, str, Tuple[int, ...]]
+
+# Per-worker state, set once by _init_worker
+_table: Optional[ColumnTable] = None
+_rules: List = []
+_segments: List[shared_memory.SharedMemory] = []
+
+def _share(array: np.ndarray, segments: List[shared_memory.SharedMemory]) -> ArraySpec:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    segments.append(shm)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm.name, array.dtype.str, array.shape
+
+def _open_untracked(name: str) -> shared_memory.SharedMemory:
+    # Attaching registers the block with the resource tracker as if this worker owned it.
+    # Workers share the parent's tracker, so unregistering afterwards would also drop the
+    # parent's registration (and make its unlink fail in the tracker); skip registering
+    # instead. The parent creates and unlinks every block.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda resource, rtype: None if rtype == 'shared_memory' else register(resource, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _attach(spec: ArraySpec) -> np.ndarray:
+    name, dtype, shape = spec
+    shm = _open_untracked(name)
+    _segments.append(shm)  # the array is only valid while the block stays mapped
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+class SharedColumnTable:
+    """A ColumnTable copied once into shared memory, so workers map it instead of unpickling rows."""
+
+    def __init__(self, table: ColumnTable):
+        self.segments: List[shared_memory.SharedMemory] = []
+        columns = {}
+        for name, column in table.columns.items():
+            if isinstance(column, EncodedColumn):
+                columns[name] = (_share(column.codes, self.segments), column.categories)
+            else:
+                columns[name] = (_share(column, self.segments), None)
+        self.spec = {'ids': _share(table.ids, self.segments), 'columns': columns}
+
+    def close(self):
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+        self.segments = []
+
+def attach_table(spec) -> ColumnTable:
+    columns = {}
+    for name, (array_spec, categories) in spec['columns'].items():
+        array = _attach(array_spec)
+        columns[name] = array if categories is None else EncodedColumn(array, categories)
+    return ColumnTable(_attach(spec['ids']), columns)
+
+def _compile_programs(programs: Sequence[Tuple[int, bytes]]) -> List:
+    return [(rule_id, compile_columnar(RuleProgram.from_bytes(blob).to_ast(Node))) for rule_id, blob in programs]
+
+def _init_worker(spec, programs: Sequence[Tuple[int, bytes]]):
+    # Runs once per worker: the ruleset arrives serialized and is compiled here, not per chunk
+    global _table, _rules
+    _table = attach_table(spec)
+    _rules = _compile_programs(programs)
+
+def _evaluate_chunk(bounds: Tuple[int, int]) -> List[np.ndarray]:
+    # Positions (into the full table) of the rows each rule accepts
+    start, stop = bounds
+    chunk = _table.slice(start, stop)
+    return [np.flatnonzero(fn(chunk)) + start for _, fn in _rules]
+
+def _chunk_bounds(size: int, workers: int, chunk_rows: int) -> List[Tuple[int, int]]:
+    # Several chunks per worker so an unlucky chunk does not leave the other cores idle
+    chunk_rows = max(1, min(chunk_rows, math.ceil(size / (workers * 4)) if size else 1))
+    return [(start, min(start + chunk_rows, size)) for start in range(0, size, chunk_rows)]
+
+def evaluate_parallel(table: ColumnTable, programs: Sequence[Tuple[int, bytes]],
+                      workers: Optional[int] = None, chunk_rows: int = 50000) -> Dict[int, np.ndarray]:
+    """Score every user in the table against every (rule_id, program blob) pair.
+
+    Returns the ids of the matching users per rule, in table order.
+    """
+    global _table, _rules
+    workers = workers or os.cpu_count() or 1
+    bounds = _chunk_bounds(len(table), workers, chunk_rows)
+
+    if workers == 1:
+        _table, _rules = table, _compile_programs(programs)
+        try:
+            parts = [_evaluate_chunk(b) for b in bounds]
+        finally:
+            _table, _rules = None, []
+    else:
+        shared = SharedColumnTable(table)
+        try:
+            with get_context().Pool(workers, initializer=_init_worker, initargs=(shared.spec, programs)) as pool:
+                # imap keeps chunk order, so the merged results stay sorted by user id
+                parts = list(pool.imap(_evaluate_chunk, bounds))
+        finally:
+            shared.close()
+
+    results = {}
+    for i, (rule_id, _) in enumerate(programs):
+        positions = [part[i] for part in parts]
+        results[rule_id] = table.ids[np.concatenate(positions)] if positions else table.ids[:0]
+    return results
+
+def _is_valid(program: bytes) -> bool:
+    try:
+        RuleProgram.from_bytes(program)
+    except ValueError:
+        return False
+    return True
+
+def load_programs(conn: sqlite3.Connection) -> Tuple[List[Tuple[int, bytes]], List[int]]:
+    # (rule_id, program) pairs, and the ids of rules stored without a valid program
+    programs, skipped = [], []
+    for rule_id, program in conn.execute('SELECT id, program FROM rules ORDER BY id'):
+        if program is not None and _is_valid(program):
+            programs.append((rule_id, program))
+        else:
+            skipped.append(rule_id)
+    return programs, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description='Score all users against all rules on several cores.')
+    parser.add_argument('--database', default='database.db')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--output', help='write {"rule_id", "user_ids"} lines to this NDJSON file')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    programs, skipped = load_programs(conn)
+    attributes = {name for _, blob in programs for name in RuleProgram.from_bytes(blob).attributes}
+    known = [row[1] for row in conn.execute('PRAGMA table_info(users)') if row[1] != 'id']
+    table = load_user_columns(conn, referenced_columns(attributes, known) or None)
+    conn.close()
+
+    start = time.perf_counter()
+    results = evaluate_parallel(table, programs, args.workers, args.chunk_rows)
+    seconds = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for rule_id, user_ids in results.items():
+                f.write(json.dumps({'rule_id': rule_id, 'user_ids': user_ids.tolist()}) + '\n')
+    print(json.dumps({
+        'users': len(table),
+        'rules': len(programs),
+        'skipped_rules': skipped,
+        'workers': args.workers,
+        'seconds': round(seconds, 3),
+        'matches': {rule_id: len(user_ids) for rule_id, user_ids in results.items()},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple, Union
+
+class MemoryBackend:
+    """In-process store: size-bounded LRU with per-entry expiry, plus version counters.
+
+    Counters are kept in a second LRU of the same size. An evicted counter reads
+    as the highest value evicted so far rather than 0, so a version never goes
+    back and entries written under an older one cannot be addressed again.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self._counters: "OrderedDict[str, int]" = OrderedDict()
+        self._counter_floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            value = self._counters.get(key)
+            if value is None:
+                return self._counter_floor
+            self._counters.move_to_end(key)
+            return value
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, self._counter_floor) + 1
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_size:
+                _, evicted = self._counters.popitem(last=False)
+                self._counter_floor = max(self._counter_floor, evicted)
+            return value
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class RedisBackend:
+    """Shared store on a Redis-compatible client (get / set(..., ex=) / incr), e.g. redis.Redis.
+
+    Eviction is left to the server's maxmemory policy. Any object with
+    those three methods works, so a fake can stand in locally.
+    """
+
+    def __init__(self, client, prefix: str = 'rules:'):
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def counter(self, key: str) -> int:
+        raw = self.client.get(self.prefix + key)
+        return int(raw) if raw is not None else 0
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def size(self) -> Optional[int]:
+        return None  # unknown without scanning the server
+
+class ResultCache:
+    """Evaluation results keyed by (user_id, user row version, ruleset version).
+
+    Writes bump the version counters instead of deleting entries, so stale
+    results simply stop being addressed and age out through the TTL or LRU.
+    The TTL also bounds staleness for writes the app does not see.
+    """
+
+    def __init__(self, backend=None, ttl: float = 30.0):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, user_id: int) -> str:
+        user_version = self.backend.counter(f'user:{user_id}:version')
+        ruleset_version = self.backend.counter('ruleset:version')
+        return f'eval:{user_id}:{user_version}:{ruleset_version}'
+
+    def get_or_compute(self, user_id: int, compute: Callable):
+        key = self._key(user_id)
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return tuple(value)
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        # Unknown users are not cached, so one created by another process shows up right away
+        if value is not None:
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate_user(self, user_id: int):
+        self.backend.incr(f'user:{user_id}:version')
+
+    def invalidate_rules(self):
+        self.backend.incr('ruleset:version')
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'size': self.backend.size(),
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'evictions': self.backend.evictions,
+            'expirations': self.backend.expirations,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
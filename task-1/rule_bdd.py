@@ -0,0 +1,187 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rule_compiler import compile_rule, convert_value, is_attribute
+from rule_index import predicate_key
+from rule_network import node_key
+
+FALSE = 0
+TRUE = 1
+
+# Binary operators the diagram can combine
+AND = "AND"
+OR = "OR"
+IMPLIES = "IMPLIES"
+
+def _variable_key(node):
+    # Comparisons written differently but evaluated identically ("age > 30", "30 < age", "age > '30'")
+    # share one variable; the literal's type is kept since 30 and 30.0 compare differently as strings
+    key = predicate_key(node)
+    if key is not None:
+        attribute, op, literal = key
+        return attribute, op, type(literal).__name__, literal
+    return node_key(node)
+
+def _terminal(op: str, u: int, v: int) -> Optional[int]:
+    # The result when it follows without expanding u and v any further
+    if op == AND:
+        if u == FALSE or v == FALSE:
+            return FALSE
+        if u == TRUE or u == v:
+            return v
+        if v == TRUE:
+            return u
+    elif op == OR:
+        if u == TRUE or v == TRUE:
+            return TRUE
+        if u == FALSE or u == v:
+            return v
+        if v == FALSE:
+            return u
+    else:
+        if u == FALSE or v == TRUE or u == v:
+            return TRUE
+        if u == TRUE:
+            return v
+    return None
+
+class DecisionDiagram:
+    """Reduced ordered binary decision diagrams over rule predicates.
+
+    All rules compiled into one diagram share its variable order and
+    node table, so equal node ids mean equal boolean functions. Each
+    comparison (or bare operand under AND/OR) is one variable, treated as
+    independent of the others: equivalence and implication answers are
+    exact when they hold, but may miss facts like "age > 30 implies age > 25".
+    """
+
+    def __init__(self):
+        # Nodes 0 and 1 are the terminals
+        self.variables: List[int] = [-1, -1]
+        self.lows: List[int] = [FALSE, TRUE]
+        self.highs: List[int] = [FALSE, TRUE]
+        self.predicates: List[Callable] = []
+        self._variable_ids: Dict[object, int] = {}
+        self._unique: Dict[Tuple[int, int, int], int] = {}
+        self._computed: Dict[Tuple[str, int, int], int] = {}
+
+    def _node(self, variable: int, low: int, high: int) -> int:
+        if low == high:
+            return low
+        key = (variable, low, high)
+        node = self._unique.get(key)
+        if node is None:
+            node = self._unique[key] = len(self.variables)
+            self.variables.append(variable)
+            self.lows.append(low)
+            self.highs.append(high)
+        return node
+
+    def _variable(self, node) -> int:
+        key = _variable_key(node)
+        variable = self._variable_ids.get(key)
+        if variable is None:
+            variable = self._variable_ids[key] = len(self.predicates)
+            compiled = compile_rule(node)
+            self.predicates.append(lambda data: bool(compiled(data)))
+        return self._node(variable, FALSE, TRUE)
+
+    def _level(self, node: int) -> int:
+        return self.variables[node] if node > TRUE else len(self.predicates)
+
+    def apply(self, op: str, u: int, v: int) -> int:
+        # Iterative, since the recursion depth would grow with the number of predicates
+        computed = self._computed
+        stack = [(u, v)]
+        while stack:
+            u, v = stack[-1]
+            if (op, u, v) in computed:
+                stack.pop()
+                continue
+            result = _terminal(op, u, v)
+            if result is not None:
+                computed[(op, u, v)] = result
+                stack.pop()
+                continue
+            variable = min(self._level(u), self._level(v))
+            u_low, u_high = (self.lows[u], self.highs[u]) if self._level(u) == variable else (u, u)
+            v_low, v_high = (self.lows[v], self.highs[v]) if self._level(v) == variable else (v, v)
+            low = computed.get((op, u_low, v_low))
+            high = computed.get((op, u_high, v_high))
+            if low is None:
+                stack.append((u_low, v_low))
+            if high is None:
+                stack.append((u_high, v_high))
+            if low is not None and high is not None:
+                computed[(op, u, v)] = self._node(variable, low, high)
+                stack.pop()
+        return computed[(op, u, v)]
+
+    def compile(self, ast) -> int:
+        """Add a rule to the diagram and return its root node."""
+        # Post-order over the AND/OR structure with an explicit stack, so tree depth is not bounded
+        # by the recursion limit (left-deep trees built outside the parser can be thousands deep)
+        results: List[int] = []
+        stack = [(ast, False)]
+        while stack:
+            node, combine = stack.pop()
+            if node.type == "operator" and node.value in (AND, OR):
+                if combine:
+                    right = results.pop()
+                    results.append(self.apply(node.value, results.pop(), right))
+                else:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+            else:
+                results.append(self._truth(node))
+        return results[0]
+
+    def _truth(self, node) -> int:
+        # A leaf of the AND/OR structure: a constant or one variable
+        if node.type == "operand" and not is_attribute(node.value):
+            return TRUE if convert_value(node.value) else FALSE
+        if (node.type == "operator" and node.left.type == "operand" and node.right.type == "operand" and
+                not is_attribute(node.left.value) and not is_attribute(node.right.value)):
+            # Literal against literal: known at compile time
+            return TRUE if compile_rule(node)({}) else FALSE
+        return self._variable(node)
+
+    def evaluate(self, root: int, data) -> bool:
+        # One root-to-leaf walk: each predicate is evaluated at most once
+        node = root
+        variables, lows, highs, predicates = self.variables, self.lows, self.highs, self.predicates
+        while node > TRUE:
+            node = highs[node] if predicates[variables[node]](data) else lows[node]
+        return node == TRUE
+
+    def equivalent(self, u: int, v: int) -> bool:
+        return u == v
+
+    def implies(self, u: int, v: int) -> bool:
+        return self.apply(IMPLIES, u, v) == TRUE
+
+    def size(self, root: int) -> int:
+        # Decision nodes reachable from root
+        seen = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node > TRUE and node not in seen:
+                seen.add(node)
+                stack.append(self.lows[node])
+                stack.append(self.highs[node])
+        return len(seen)
+
+def compile_bdd(ast) -> Callable:
+    """Compile a rule AST into a decision diagram evaluator with the compile_rule calling convention.
+
+    Results are the truth value evaluate_rule would return.
+    """
+    diagram = DecisionDiagram()
+    root = diagram.compile(ast)
+
+    def evaluate(data) -> bool:
+        return diagram.evaluate(root, data)
+    evaluate.diagram = diagram
+    evaluate.root = root
+    return evaluate
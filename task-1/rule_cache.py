@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from rule_compiler import CompiledRule, compile_rule
+from rule_index import RuleIndex
+from rule_program import RuleProgram, source_matches
+from rule_stats import PredicateStats, reorder_rule
+
+class RuleCache:
+    """Process-wide LRU cache of parsed and compiled rules.
+
+    Entries are keyed by (rule_id, ruleset version); bumping the version
+    invalidates everything cached so far.
+    """
+
+    def __init__(self, parser: Callable, max_size: int = 1024, stats: Optional[PredicateStats] = None,
+                 node_class=None):
+        self.parser = parser
+        # Needed to rebuild ASTs from stored rule programs instead of re-parsing the condition
+        self.node_class = node_class
+        self.predicate_stats = stats
+        self.max_size = max_size
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[str, object, CompiledRule]]" = OrderedDict()
+        self._ruleset = None
+        self._ruleset_key = None
+        self._lock = threading.Lock()
+
+    def get(self, rule_id: int, condition: str) -> CompiledRule:
+        return self.get_entry(rule_id, condition)[1]
+
+    def get_ast(self, rule_id: int, condition: str):
+        return self.get_entry(rule_id, condition)[0]
+
+    def get_entry(self, rule_id: int, condition: str, program: Optional[bytes] = None) -> Tuple[object, CompiledRule]:
+        with self._lock:
+            key = (rule_id, self.version)
+            entry = self._entries.get(key)
+            # The condition is kept alongside so rows edited outside the app are not served stale
+            if entry is not None and entry[0] == condition:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        ast = None
+        if program is not None and self.node_class is not None and source_matches(program, condition):
+            try:
+                ast = RuleProgram.from_bytes(program).to_ast(self.node_class)
+            except ValueError:
+                pass  # a damaged blob: parse the condition instead
+        if ast is None:
+            ast = self.parser(condition)
+        compiled = compile_rule(ast)
+
+        with self._lock:
+            if key[1] == self.version:
+                self._entries[key] = (condition, ast, compiled)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return ast, compiled
+
+    def get_ruleset(self, rules: Iterable[Tuple]) -> RuleIndex:
+        # One indexed, shared-predicate view of the whole ruleset, rebuilt when the rules change.
+        # Rules are (rule_id, condition) or (rule_id, condition, stored program blob).
+        rules = tuple((rule[0], rule[1], rule[2] if len(rule) > 2 else None) for rule in rules)
+        with self._lock:
+            # With statistics enabled the ruleset is also re-ordered as they accumulate
+            epoch = self.predicate_stats.epoch if self.predicate_stats is not None else 0
+            key = (self.version, epoch, tuple((rule_id, condition) for rule_id, condition, _ in rules))
+            if self._ruleset is not None and self._ruleset_key == key:
+                return self._ruleset
+
+        stats = self.predicate_stats
+        ruleset = RuleIndex(((rule_id, reorder_rule(self.get_entry(rule_id, condition, program)[0], stats))
+                             for rule_id, condition, program in rules), stats)
+        with self._lock:
+            if key[0] == self.version:
+                self._ruleset = ruleset
+                self._ruleset_key = key
+        return ruleset
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._ruleset = None
+            self._ruleset_key = None
+            return self.version
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
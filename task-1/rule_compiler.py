@@ -0,0 +1,141 @@
+import operator
+from typing import Any, Callable, Dict, Union
+
+# A compiled rule takes the same user dict as evaluate_rule and returns the same result
+CompiledRule = Callable[[Dict[str, Union[int, str, float]]], Any]
+
+_MISSING = object()
+_NUMBER = (int, float)
+
+_COMPARISONS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+def convert_value(value):
+    # Same coercion evaluate_rule applies to every operand
+    if isinstance(value, str):
+        value = value.strip("'\"")
+        if value.lower() == 'true':
+            return True
+        elif value.lower() == 'false':
+            return False
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+    return value
+
+def apply_operator(op: str, left_value, right_value):
+    # Scalar form of one evaluate_rule step, for already converted operands
+    if op == "AND":
+        return bool(left_value) and bool(right_value)
+    if op == "OR":
+        return bool(left_value) or bool(right_value)
+    if op in ("==", "="):
+        return left_value == right_value
+    compare = _COMPARISONS.get(op)
+    if compare is None:
+        raise ValueError(f"Unknown operator: {op}")
+    if isinstance(left_value, _NUMBER) and isinstance(right_value, _NUMBER):
+        return compare(left_value, right_value)
+    return compare(str(left_value), str(right_value))
+
+def is_attribute(value) -> bool:
+    # Numbers and quoted strings can never name a user attribute, so they are folded to constants
+    return isinstance(value, str) and value.isidentifier()
+
+def _compile_operand(node) -> CompiledRule:
+    key = node.value
+    if not is_attribute(key):
+        constant = convert_value(key)
+        fn = lambda data: constant
+        fn.constant = constant
+        return fn
+
+    default = convert_value(key)
+
+    def lookup(data):
+        value = data.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        if value.__class__ is str:
+            return convert_value(value)
+        return value
+    return lookup
+
+def _compile_comparison(op: str, left: CompiledRule, right: CompiledRule) -> CompiledRule:
+    if op in ("==", "="):
+        if hasattr(right, "constant"):
+            constant = right.constant
+            return lambda data: left(data) == constant
+        if hasattr(left, "constant"):
+            constant = left.constant
+            return lambda data: constant == right(data)
+        return lambda data: left(data) == right(data)
+
+    compare = _COMPARISONS[op]
+
+    # Literal on the right (the usual "age > 30" shape): decide numeric vs string once
+    if hasattr(right, "constant"):
+        constant = right.constant
+        if isinstance(constant, _NUMBER):
+            constant_str = str(constant)
+
+            def compare_number(data):
+                value = left(data)
+                if isinstance(value, _NUMBER):
+                    return compare(value, constant)
+                return compare(str(value), constant_str)
+            return compare_number
+
+        constant_str = str(constant)
+        return lambda data: compare(str(left(data)), constant_str)
+
+    def compare_values(data):
+        left_value = left(data)
+        right_value = right(data)
+        if isinstance(left_value, _NUMBER) and isinstance(right_value, _NUMBER):
+            return compare(left_value, right_value)
+        return compare(str(left_value), str(right_value))
+    return compare_values
+
+def _compile(node) -> CompiledRule:
+    if node.type == "operand":
+        return _compile_operand(node)
+
+    if node.type == "operator":
+        op = node.value
+        if op not in ("AND", "OR", "==", "=") and op not in _COMPARISONS:
+            raise ValueError(f"Unknown operator: {op}")
+
+        left = _compile(node.left)
+        right = _compile(node.right)
+
+        if op == "AND":
+            return lambda data: bool(left(data)) and bool(right(data))
+        if op == "OR":
+            return lambda data: bool(left(data)) or bool(right(data))
+
+        fn = _compile_comparison(op, left, right)
+        if hasattr(left, "constant") and hasattr(right, "constant"):
+            # Both sides are literals, so the comparison itself is a constant
+            constant = fn(None)
+            fn = lambda data: constant
+            fn.constant = constant
+        return fn
+
+    raise ValueError(f"Invalid AST node type: {node.type}")
+
+def compile_rule(ast) -> CompiledRule:
+    """Turn a Node tree into a single callable equivalent to app.evaluate_rule(ast, data).
+
+    Operators are resolved and literals converted once at compile time, and
+    AND/OR short-circuit. Works with the Node classes from app.py and rule_engine.py.
+    """
+    return _compile(ast)
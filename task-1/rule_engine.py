@@ -1,6 +1,8 @@
 import re
 from typing import Dict, List, Union, Tuple
 
+from rule_optimizer import build_balanced
+
 class Node:
     def __init__(self, node_type, value=None, left=None, right=None):
         self.type = node_type
@@ -73,11 +75,8 @@ def combine_rules(rules: List[str], operator="OR") -> Node:
 
     rule_asts = [create_rule(rule) for rule in rules]
 
-    combined_ast = rule_asts[0]
-    for ast in rule_asts[1:]:
-        combined_ast = Node("operator", value=operator, left=combined_ast, right=ast)
-
-    return combined_ast
+    # Balanced rather than left-deep, so thousands of rules stay shallow to walk
+    return build_balanced(operator, rule_asts, Node)
 
 def evaluate_rule(ast: Node, data: Dict[str, Union[int, str]]) -> bool:
     def convert_value(value):
@@ -0,0 +1,169 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from rule_compiler import convert_value, is_attribute
+from rule_network import RuleNetwork
+
+_MISSING = object()
+_FLIPPED = {"==": "==", ">": "<", "<": ">", ">=": "<=", "<=": ">="}
+
+# (attribute, operator, converted literal)
+PredicateKey = Tuple[str, str, object]
+
+def predicate_key(node) -> Optional[PredicateKey]:
+    if node.type != "operator" or node.value not in ("==", "=", ">", "<", ">=", "<="):
+        return None
+    op = "==" if node.value == "=" else node.value
+    left, right = node.left, node.right
+    if left.type != "operand" or right.type != "operand":
+        return None
+
+    if is_attribute(left.value) and not is_attribute(right.value):
+        attribute, literal = left.value, convert_value(right.value)
+    elif is_attribute(right.value) and not is_attribute(left.value):
+        attribute, literal, op = right.value, convert_value(left.value), _FLIPPED[op]
+    else:
+        return None
+
+    if op != "==" and not isinstance(literal, (int, float)):
+        return None
+    try:
+        hash(literal)
+    except TypeError:
+        return None
+    return attribute, op, literal
+
+def _access_set(node) -> Optional[FrozenSet[PredicateKey]]:
+    # Indexable predicates of which at least one must hold whenever the rule holds
+    if node.type == "operator" and node.value == "AND":
+        left = _access_set(node.left)
+        right = _access_set(node.right)
+        if left is None or right is None:
+            return left if right is None else right
+        return left if len(left) <= len(right) else right
+
+    if node.type == "operator" and node.value == "OR":
+        left = _access_set(node.left)
+        right = _access_set(node.right)
+        if left is None or right is None:
+            return None
+        return left | right
+
+    key = predicate_key(node)
+    return None if key is None else frozenset([key])
+
+class RuleIndex:
+    """Inverted index from attribute values to the rules they can satisfy.
+
+    Range predicates are kept as sorted threshold lists per attribute and
+    equality predicates as hash maps, so the predicates a user satisfies
+    are found with a few binary searches. Only rules reachable from those
+    predicates (plus rules with nothing indexable) are then evaluated.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[int, object]], stats=None):
+        rules = list(rules)
+        self.network = RuleNetwork(rules, stats)
+        self._predicate_ids: Dict[PredicateKey, int] = {}
+        self._postings: List[List[int]] = []
+        self._always: List[int] = []
+        self._equality: Dict[str, Dict[object, List[int]]] = {}
+        self._ranges: Dict[str, Dict[str, Tuple[List, List[int]]]] = {}
+        self._attribute_predicates: Dict[str, List[int]] = {}
+
+        for position, (_, ast) in enumerate(rules):
+            access = _access_set(ast)
+            if access is None:
+                self._always.append(position)
+                continue
+            for key in access:
+                self._postings[self._predicate_id(key)].append(position)
+
+        for attribute, by_op in self._ranges.items():
+            for op, (thresholds, predicate_ids) in by_op.items():
+                ordered = sorted(zip(thresholds, predicate_ids))
+                by_op[op] = ([t for t, _ in ordered], [p for _, p in ordered])
+
+    def _predicate_id(self, key: PredicateKey) -> int:
+        predicate_id = self._predicate_ids.get(key)
+        if predicate_id is not None:
+            return predicate_id
+        predicate_id = self._predicate_ids[key] = len(self._postings)
+        self._postings.append([])
+
+        attribute, op, literal = key
+        self._attribute_predicates.setdefault(attribute, []).append(predicate_id)
+        if op == "==":
+            self._equality.setdefault(attribute, {}).setdefault(literal, []).append(predicate_id)
+        else:
+            thresholds, predicate_ids = self._ranges.setdefault(attribute, {}).setdefault(op, ([], []))
+            thresholds.append(literal)
+            predicate_ids.append(predicate_id)
+        return predicate_id
+
+    def _satisfied_predicates(self, data) -> Iterable[int]:
+        for attribute, predicate_ids in self._attribute_predicates.items():
+            value = data.get(attribute, _MISSING)
+            if value is _MISSING:
+                # The evaluator would compare the attribute name itself; don't try to predict that
+                yield from predicate_ids
+                continue
+            value = convert_value(value)
+
+            equality = self._equality.get(attribute)
+            if equality:
+                try:
+                    yield from equality.get(value, ())
+                except TypeError:
+                    yield from (p for ids in equality.values() for p in ids)
+
+            ranges = self._ranges.get(attribute)
+            if not ranges:
+                continue
+            if not isinstance(value, (int, float)):
+                # Non-numeric values are compared as strings; leave those to full evaluation
+                for _, range_ids in ranges.values():
+                    yield from range_ids
+                continue
+            for op, (thresholds, range_ids) in ranges.items():
+                if op == ">":
+                    yield from range_ids[:bisect_left(thresholds, value)]
+                elif op == ">=":
+                    yield from range_ids[:bisect_right(thresholds, value)]
+                elif op == "<":
+                    yield from range_ids[bisect_right(thresholds, value):]
+                else:
+                    yield from range_ids[bisect_left(thresholds, value):]
+
+    def candidates(self, data) -> List[int]:
+        # Positions (in ruleset order) of the rules that may match this user
+        positions = set(self._always)
+        postings = self._postings
+        for predicate_id in self._satisfied_predicates(data):
+            positions.update(postings[predicate_id])
+        return sorted(positions)
+
+    def matching_rules(self, data) -> List[int]:
+        rules = self.network.rules
+        memo = self.network.new_memo()
+        matched = []
+        for position in self.candidates(data):
+            rule_id, evaluate = rules[position]
+            if evaluate(data, memo):
+                matched.append(rule_id)
+        return matched
+
+    def first_match(self, data) -> Optional[int]:
+        rules = self.network.rules
+        memo = self.network.new_memo()
+        for position in self.candidates(data):
+            rule_id, evaluate = rules[position]
+            if evaluate(data, memo):
+                return rule_id
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.network.stats()
+        stats['indexed_predicates'] = len(self._postings)
+        stats['unindexed_rules'] = len(self._always)
+        return stats
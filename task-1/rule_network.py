@@ -0,0 +1,132 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from rule_compiler import compile_rule
+
+# Child order of these operators does not change the result, so "a AND b" and "b AND a" share a node
+_COMMUTATIVE = ("AND", "OR", "==", "=")
+
+def node_key(node) -> Tuple:
+    # Structural key: identical subtrees in different rules get the same key
+    if node.type == "operand":
+        return ("operand", node.value)
+    if node.type == "operator":
+        left = node_key(node.left)
+        right = node_key(node.right)
+        op = "==" if node.value == "=" else node.value
+        if op in _COMMUTATIVE and repr(right) < repr(left):
+            left, right = right, left
+        return (op, left, right)
+    raise ValueError(f"Invalid AST node type: {node.type}")
+
+def _count_predicates(ast) -> int:
+    count = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node.type == "operator" and node.value in ("AND", "OR"):
+            stack.extend((node.left, node.right))
+        else:
+            count += 1
+    return count
+
+class RuleNetwork:
+    """Hash-consed evaluation network over a whole ruleset.
+
+    Every distinct comparison appears once in a shared predicate layer and
+    AND/OR nodes are combined on top of it, so a predicate used by many
+    rules is evaluated at most once per user.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[int, object]], stats=None):
+        # stats, if given, is a rule_stats.PredicateStats fed every predicate evaluation
+        self.stats = stats
+        self._ids: Dict[Tuple, int] = {}
+        self._nodes: List[Callable] = []
+        self.predicate_count = 0
+        self.predicate_references = 0
+        self.rules: List[Tuple[int, Callable]] = []
+        for rule_id, ast in rules:
+            self.predicate_references += _count_predicates(ast)
+            self.rules.append((rule_id, self._add(ast)))
+
+    def _add(self, node) -> Callable:
+        key = node_key(node)
+        index = self._ids.get(key)
+        if index is not None:
+            return self._nodes[index]
+
+        if node.type == "operator" and node.value in ("AND", "OR"):
+            left = self._add(node.left)
+            right = self._add(node.right)
+            index = len(self._nodes)
+            if node.value == "AND":
+                def evaluate(data, memo):
+                    value = memo[index]
+                    if value is None:
+                        value = memo[index] = left(data, memo) and right(data, memo)
+                    return value
+            else:
+                def evaluate(data, memo):
+                    value = memo[index]
+                    if value is None:
+                        value = memo[index] = left(data, memo) or right(data, memo)
+                    return value
+        else:
+            predicate = compile_rule(node)
+            self.predicate_count += 1
+            index = len(self._nodes)
+
+            if self.stats is None:
+                def evaluate(data, memo):
+                    value = memo[index]
+                    if value is None:
+                        value = memo[index] = bool(predicate(data))
+                    return value
+            else:
+                record = self.stats.record
+                name = repr(key)
+                clock = time.perf_counter_ns
+                sample_every = self.stats.sample_every
+                # Evaluations left until the next timed one; an unlocked countdown, so threads may skew it slightly
+                countdown = [sample_every]
+
+                def evaluate(data, memo):
+                    value = memo[index]
+                    if value is None:
+                        countdown[0] -= 1
+                        if countdown[0] > 0:
+                            value = memo[index] = bool(predicate(data))
+                        else:
+                            countdown[0] = sample_every
+                            start = clock()
+                            value = memo[index] = bool(predicate(data))
+                            record(name, value, clock() - start)
+                    return value
+
+        self._ids[key] = index
+        self._nodes.append(evaluate)
+        return evaluate
+
+    def new_memo(self) -> List[Optional[bool]]:
+        # Per-user scratch space holding each node's result once computed
+        return [None] * len(self._nodes)
+
+    def matching_rules(self, data) -> List[int]:
+        memo = self.new_memo()
+        return [rule_id for rule_id, evaluate in self.rules if evaluate(data, memo)]
+
+    def first_match(self, data) -> Optional[int]:
+        memo = self.new_memo()
+        for rule_id, evaluate in self.rules:
+            if evaluate(data, memo):
+                return rule_id
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'rules': len(self.rules),
+            'nodes': len(self._nodes),
+            'predicates': self.predicate_count,
+            'predicate_references': self.predicate_references,
+        }
@@ -0,0 +1,165 @@
+from typing import List, Optional, Sequence
+
+from rule_compiler import apply_operator, convert_value, is_attribute
+from rule_index import predicate_key
+from rule_network import node_key
+
+# Literal operands the optimizer produces for folded subtrees
+TRUE = "'true'"
+FALSE = "'false'"
+
+_LOWER = (">", ">=")
+_UPPER = ("<", "<=")
+
+def build_balanced(op: str, nodes: Sequence, node_class):
+    # Pairwise combination keeps an n-way AND/OR at depth log2(n) instead of n
+    nodes = list(nodes)
+    if not nodes:
+        return None
+    while len(nodes) > 1:
+        paired = [node_class("operator", value=op, left=nodes[i], right=nodes[i + 1])
+                  for i in range(0, len(nodes) - 1, 2)]
+        if len(nodes) % 2:
+            paired.append(nodes[-1])
+        nodes = paired
+    return nodes[0]
+
+def flatten(node, op: str) -> List:
+    # Children of a chain of same-operator nodes, left to right, without recursion
+    children = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.type == "operator" and current.value == op:
+            stack.append(current.right)
+            stack.append(current.left)
+        else:
+            children.append(current)
+    return children
+
+def _is_constant(node) -> bool:
+    return node.type == "operand" and not is_attribute(node.value)
+
+def _constant(value: bool, node_class):
+    return node_class("operand", value=TRUE if value else FALSE)
+
+def _tightest(bounds, pick, numeric_key, string_key) -> Optional[list]:
+    # Attributes compare as numbers or, for non-numeric values, as strings.
+    # A bound only replaces the others if it wins under both orderings.
+    numeric = pick(bounds, key=lambda b: numeric_key(b[0], b[1]))
+    string = pick(bounds, key=lambda b: string_key(b[0], b[1]))
+    if (numeric_key(numeric[0], numeric[1]) == numeric_key(string[0], string[1]) and
+            string_key(numeric[0], numeric[1]) == string_key(string[0], string[1])):
+        return [numeric]
+    return None
+
+def _empty_range(lower, upper, key) -> bool:
+    (low_op, low), (high_op, high) = (lower[0], key(lower[1])), (upper[0], key(upper[1]))
+    return low > high or (low == high and not (low_op == ">=" and high_op == "<="))
+
+def _merge_ranges(op: str, children: List) -> Optional[List]:
+    # Returns the reduced children, or None when an AND can never hold
+    by_attribute = {}
+    others = []
+    for child in children:
+        key = predicate_key(child)
+        if key is None:
+            others.append(child)
+        else:
+            by_attribute.setdefault(key[0], []).append((key[1], key[2], child))
+
+    merged = []
+    for attribute, predicates in by_attribute.items():
+        lower = [(p_op, value, child) for p_op, value, child in predicates if p_op in _LOWER]
+        upper = [(p_op, value, child) for p_op, value, child in predicates if p_op in _UPPER]
+        equal = [(p_op, value, child) for p_op, value, child in predicates if p_op == "=="]
+
+        # At equal thresholds ">" is tighter than ">=" and "<" tighter than "<="
+        numeric_low = lambda p_op, value: (value, 1 if p_op == ">" else 0)
+        string_low = lambda p_op, value: (str(value), 1 if p_op == ">" else 0)
+        numeric_high = lambda p_op, value: (value, 0 if p_op == "<" else 1)
+        string_high = lambda p_op, value: (str(value), 0 if p_op == "<" else 1)
+
+        if op == "AND":
+            if equal:
+                target = equal[0][1]
+                if any(value != target for _, value, _ in equal[1:]):
+                    return None
+                # Anything equal to the literal compares exactly like the literal itself
+                if not all(apply_operator(p_op, target, value) for p_op, value, _ in lower + upper):
+                    return None
+                merged.append(equal[0][2])
+                continue
+            if lower:
+                lower = _tightest(lower, max, numeric_low, string_low) or lower
+            if upper:
+                upper = _tightest(upper, min, numeric_high, string_high) or upper
+            if len(lower) == 1 and len(upper) == 1:
+                low, high = lower[0][:2], upper[0][:2]
+                if (_empty_range(low, high, lambda v: v) and
+                        _empty_range(low, high, lambda v: str(v))):
+                    return None
+        else:
+            if lower:
+                lower = _tightest(lower, min, numeric_low, string_low) or lower
+            if upper:
+                upper = _tightest(upper, max, numeric_high, string_high) or upper
+            merged.extend(child for _, _, child in equal)
+        merged.extend(child for _, _, child in lower + upper)
+
+    # Keep the caller's ordering for whatever survives
+    survivors = {id(child) for child in merged} | {id(child) for child in others}
+    return [child for child in children if id(child) in survivors]
+
+def _optimize_connective(op: str, node, node_class):
+    children = []
+    for child in flatten(node, op):
+        optimized = optimize_rule(child)
+        # Folding may expose another node of the same operator
+        children.extend(flatten(optimized, op))
+
+    absorbing = op == "OR"  # the constant that decides the whole node
+    reduced = []
+    seen = set()
+    for child in children:
+        if _is_constant(child):
+            if bool(convert_value(child.value)) == absorbing:
+                return _constant(absorbing, node_class)
+            continue
+        key = node_key(child)
+        if key not in seen:
+            seen.add(key)
+            reduced.append(child)
+
+    reduced = _merge_ranges(op, reduced)
+    if reduced is None:
+        return _constant(False, node_class)
+    if not reduced:
+        return _constant(not absorbing, node_class)
+    if len(reduced) == 1 and reduced[0].type == "operand":
+        # AND/OR coerce to bool; keep that for a lone attribute operand
+        reduced.append(_constant(not absorbing, node_class))
+    return build_balanced(op, reduced, node_class)
+
+def optimize_rule(ast):
+    """Return a simplified, balanced copy of a rule AST with the same results.
+
+    AND/OR chains are flattened and rebuilt as balanced trees, duplicate
+    operands removed, literal comparisons folded, and range or equality
+    predicates on the same attribute merged, so contradictions fold to false.
+    The input tree is left untouched.
+    """
+    node_class = type(ast)
+    if ast.type == "operator" and ast.value in ("AND", "OR"):
+        return _optimize_connective(ast.value, ast, node_class)
+
+    if ast.type == "operator":
+        left = optimize_rule(ast.left)
+        right = optimize_rule(ast.right)
+        if _is_constant(left) and _is_constant(right):
+            return _constant(apply_operator(ast.value, convert_value(left.value),
+                                            convert_value(right.value)), node_class)
+        if left is not ast.left or right is not ast.right:
+            return node_class("operator", value=ast.value, left=left, right=right)
+
+    return ast
@@ -0,0 +1,198 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+from rule_optimizer import build_balanced
+
+# Same token grammar create_rule_fun has always used; characters matching none of it are skipped
+_TOKEN = re.compile(r"\(|\)|\w+|[<>=]+|'[^']*'")
+
+PRECEDENCE = {
+    'OR': 1,
+    'AND': 2,
+    '>': 3, '<': 3, '>=': 3, '<=': 3, '=': 3, '==': 3
+}
+
+class RuleSyntaxError(ValueError):
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+def tokenize(rule_string: str) -> List[str]:
+    return _TOKEN.findall(rule_string)
+
+def token_positions(rule_string: str) -> List[int]:
+    # Offsets of the tokens; only needed to report an error, so not computed while parsing
+    return [match.start() for match in _TOKEN.finditer(rule_string)]
+
+class _Chain:
+    # Operands of consecutive AND (or OR) reductions, built into a balanced tree once complete
+    __slots__ = ('op', 'children')
+
+    def __init__(self, op: str, children: List):
+        self.op = op
+        self.children = children
+
+def _node(operand, node_class):
+    if isinstance(operand, _Chain):
+        return build_balanced(operand.op, operand.children, node_class)
+    return operand
+
+def _parse(tokens: List[str], node_class):
+    # One shunting-yard pass that reduces operators as they leave the stack.
+    # Returns the AST, or (message, token index) for the first error.
+    operands = []
+    operand_starts = []  # index of the first token of each operand
+    operators = []
+    operator_indexes = []
+    error = None  # operand errors wait until the parentheses are known to balance, as before
+
+    def reduce():
+        nonlocal error
+        op = operators.pop()
+        index = operator_indexes.pop()
+        if error is not None:
+            return
+        if len(operands) < 2:
+            error = (f"Invalid expression: not enough operands for {op}", index)
+            return
+        right = operands.pop()
+        operand_starts.pop()
+        left = operands[-1]
+        if op not in ('AND', 'OR'):
+            operands[-1] = node_class("operator", value=op, left=_node(left, node_class), right=_node(right, node_class))
+            return
+        # "a AND b AND c ..." (however parenthesized) becomes one balanced chain rather than a left-deep tree,
+        # so long rules stay shallow for the recursive walkers (compilers, repr, node keys)
+        if not (isinstance(left, _Chain) and left.op == op):
+            left = operands[-1] = _Chain(op, [_node(left, node_class)])
+        if isinstance(right, _Chain) and right.op == op:
+            left.children.extend(right.children)
+        else:
+            left.children.append(_node(right, node_class))
+
+    for index, token in enumerate(tokens):
+        if token == '(':
+            operators.append(token)
+            operator_indexes.append(index)
+        elif token == ')':
+            while operators and operators[-1] != '(':
+                reduce()
+            if not operators:
+                return "Mismatched parentheses", index
+            operators.pop()
+            operator_indexes.pop()
+        elif token in PRECEDENCE:
+            precedence = PRECEDENCE[token]
+            while operators and operators[-1] != '(' and PRECEDENCE[operators[-1]] >= precedence:
+                reduce()
+            operators.append(token)
+            operator_indexes.append(index)
+        elif error is None:
+            operands.append(node_class("operand", value=token))
+            operand_starts.append(index)
+
+    while operators:
+        if operators[-1] == '(':
+            return "Mismatched parentheses", operator_indexes[-1]
+        reduce()
+
+    if error is not None:
+        return error
+    if len(operands) != 1:
+        return "Invalid expression", operand_starts[1] if operands else len(tokens)
+    return _node(operands[0], node_class)
+
+def parse_rule(rule_string: str, node_class, tokens: Optional[List[str]] = None):
+    """Parse a rule string into a tree of node_class instances.
+
+    Produces the same error messages as the former two-stage parser, with
+    the offending position appended. Trees are the same too, except that
+    chains of one connective are balanced: "a AND b AND c AND d" parses as
+    "(a AND b) AND (c AND d)", which evaluates identically.
+    """
+    if tokens is None:
+        tokens = tokenize(rule_string)
+    result = _parse(tokens, node_class)
+    if isinstance(result, tuple):
+        message, index = result
+        positions = token_positions(rule_string)
+        raise RuleSyntaxError(message, positions[index] if index < len(positions) else len(rule_string))
+    return result
+
+class RuleParser:
+    """Parses rule strings, keeping a bounded LRU cache of the resulting ASTs.
+
+    ASTs are cached by token sequence, so rules differing only in whitespace
+    share an entry, and max_size counts those distinct rules. A second LRU of
+    the same size maps each exact text seen to its token sequence, saving the
+    tokenizer on repeated texts. Cached trees are shared between callers and
+    must not be modified.
+    """
+
+    def __init__(self, node_class, max_size: int = 4096):
+        self.node_class = node_class
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, ...], object]" = OrderedDict()
+        self._texts: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        ast = self._entries.get(key)
+        if ast is not None:
+            self._entries.move_to_end(key)
+        return ast
+
+    def _put(self, key, ast):
+        self._entries[key] = ast
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _remember_text(self, rule_string: str, key):
+        self._texts[rule_string] = key
+        self._texts.move_to_end(rule_string)
+        while len(self._texts) > self.max_size:
+            self._texts.popitem(last=False)
+
+    def parse(self, rule_string: str):
+        with self._lock:
+            key = self._texts.get(rule_string)
+            if key is not None:
+                self._texts.move_to_end(rule_string)
+                ast = self._get(key)
+                if ast is not None:
+                    self.hits += 1
+                    return ast
+
+        if key is None:
+            key = tuple(tokenize(rule_string))
+            with self._lock:
+                ast = self._get(key)
+                if ast is not None:
+                    self.hits += 1
+                    self._remember_text(rule_string, key)
+                    return ast
+        with self._lock:
+            self.misses += 1
+
+        ast = parse_rule(rule_string, self.node_class, list(key))
+        with self._lock:
+            self._put(key, ast)
+            self._remember_text(rule_string, key)
+        return ast
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'texts': len(self._texts),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,247 @@
+import json
+import sqlite3
+import struct
+import sys
+import zlib
+from array import array
+from typing import List, Optional
+
+from rule_compiler import apply_operator, convert_value, is_attribute
+
+# Opcodes of the postfix rule program
+LOAD_ATTR = 0   # push the user's attribute attributes[arg] (or the converted name if absent)
+LOAD_CONST = 1  # push constants[arg]
+AND_JUMP = 2    # pop; if falsy push False and jump to arg
+OR_JUMP = 3     # pop; if truthy push True and jump to arg
+TO_BOOL = 4     # replace the top of the stack with its truth value
+COMPARE = 5     # pop right and left, push left <op> right for op = COMPARISON_OPS[arg]
+
+COMPARISON_OPS = ("==", "=", ">", "<", ">=", "<=")
+
+_MAGIC = b'RPG2'
+# magic, CRC32 of the source condition, CRC32 of everything after the header,
+# length of the JSON name/literal tables, instruction count
+_HEADER = struct.Struct('<4sIIII')
+_MISSING = object()
+
+class RuleProgram:
+    """Flat, array-backed form of a rule AST.
+
+    Opcodes and arguments live in two arrays, next to a table of attribute
+    names and a pool of literal tokens, so a rule costs a handful of objects
+    instead of one per node and can be stored as a compact binary blob.
+    """
+
+    __slots__ = ('opcodes', 'args', 'attributes', 'constants', '_values', '_defaults')
+
+    def __init__(self, opcodes: array, args: array, attributes: List[str], constants: List):
+        self.opcodes = opcodes
+        self.args = args
+        self.attributes = attributes
+        self.constants = constants
+        self._values = None
+        self._defaults = None
+
+    def run(self, data):
+        # Same result as app.evaluate_rule on the AST this program was compiled from
+        if self._values is None:
+            # Literals are converted once, on first use rather than on every run
+            self._values = [convert_value(c) for c in self.constants]
+            self._defaults = [convert_value(a) for a in self.attributes]
+        opcodes, args = self.opcodes, self.args
+        attributes, defaults, values = self.attributes, self._defaults, self._values
+        stack = []
+        push, pop = stack.append, stack.pop
+        pc, end = 0, len(opcodes)
+        while pc < end:
+            op = opcodes[pc]
+            arg = args[pc]
+            pc += 1
+            if op == LOAD_ATTR:
+                value = data.get(attributes[arg], _MISSING)
+                push(defaults[arg] if value is _MISSING else convert_value(value))
+            elif op == LOAD_CONST:
+                push(values[arg])
+            elif op == COMPARE:
+                right = pop()
+                stack[-1] = apply_operator(COMPARISON_OPS[arg], stack[-1], right)
+            elif op == AND_JUMP:
+                if not pop():
+                    push(False)
+                    pc = arg
+            elif op == OR_JUMP:
+                if pop():
+                    push(True)
+                    pc = arg
+            else:
+                stack[-1] = bool(stack[-1])
+        return stack[-1]
+
+    def to_ast(self, node_class):
+        # Rebuild the exact tree the program was compiled from
+        stack = []
+        connectives = []
+        for op, arg in zip(self.opcodes, self.args):
+            if op == LOAD_ATTR:
+                stack.append(node_class("operand", value=self.attributes[arg]))
+            elif op == LOAD_CONST:
+                stack.append(node_class("operand", value=self.constants[arg]))
+            elif op == COMPARE:
+                right = stack.pop()
+                stack.append(node_class("operator", value=COMPARISON_OPS[arg], left=stack.pop(), right=right))
+            elif op in (AND_JUMP, OR_JUMP):
+                connectives.append("AND" if op == AND_JUMP else "OR")
+            else:
+                right = stack.pop()
+                stack.append(node_class("operator", value=connectives.pop(), left=stack.pop(), right=right))
+        return stack[0]
+
+    def to_bytes(self, source: Optional[str] = None) -> bytes:
+        # The CRC of the source condition lets a loader detect a blob gone stale
+        crc = zlib.crc32(source.encode('utf-8')) if source is not None else 0
+        # JSON keeps literal types (str, int, float, bool, None) exactly and decodes in C
+        tables = json.dumps([self.attributes, self.constants], separators=(',', ':')).encode('utf-8')
+        args = array('I', self.args)
+        if sys.byteorder == 'big':
+            args.byteswap()
+        body = b''.join((tables, self.opcodes.tobytes(), args.tobytes()))
+        return _HEADER.pack(_MAGIC, crc, zlib.crc32(body), len(tables), len(self.opcodes)) + body
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'RuleProgram':
+        # Blobs also arrive from clients (/evaluate_rule), so nothing is trusted before it is checked
+        if len(blob) < _HEADER.size:
+            raise ValueError("Not a rule program")
+        magic, _, body_crc, tables_size, length = _HEADER.unpack_from(blob, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a rule program")
+        offset = _HEADER.size
+        if len(blob) != offset + tables_size + 5 * length:
+            raise ValueError("Malformed rule program: truncated or oversized")
+        if zlib.crc32(blob[offset:]) != body_crc:
+            raise ValueError("Malformed rule program: checksum mismatch")
+        try:
+            attributes, constants = json.loads(blob[offset:offset + tables_size])
+        except (ValueError, TypeError):
+            raise ValueError("Malformed rule program: bad name/literal tables") from None
+        if not (isinstance(attributes, list) and isinstance(constants, list) and
+                all(isinstance(name, str) for name in attributes) and
+                all(constant is None or isinstance(constant, (str, int, float)) for constant in constants)):
+            raise ValueError("Malformed rule program: bad name/literal tables")
+        offset += tables_size
+        opcodes = array('B', blob[offset:offset + length])
+        offset += length
+        args = array('I')
+        args.frombytes(blob[offset:offset + 4 * length])
+        if sys.byteorder == 'big':
+            args.byteswap()
+        program = cls(opcodes, args, attributes, constants)
+        program.validate()
+        return program
+
+    def validate(self):
+        """Raise ValueError unless the program has the shape compile_program emits.
+
+        Every operand index must fall inside its table, every jump must go
+        forward to just past the TO_BOOL closing its right-hand side, and a
+        single pass over the stack depths must end with exactly one value, so
+        run and to_ast can neither loop, index out of range nor underflow.
+        """
+        opcodes, args = self.opcodes, self.args
+        end = len(opcodes)
+        limits = {LOAD_ATTR: len(self.attributes), LOAD_CONST: len(self.constants),
+                  COMPARE: len(COMPARISON_OPS)}
+        depth = 0
+        jumps = []  # (target, depth after the jump) of AND/OR whose right-hand side is still open
+        for pc in range(end):
+            op, arg = opcodes[pc], args[pc]
+            if op in limits:
+                if arg >= limits[op]:
+                    raise ValueError(f"Malformed rule program: argument {arg} out of range at {pc}")
+                if op == COMPARE:
+                    if depth < 2:
+                        raise ValueError(f"Malformed rule program: stack underflow at {pc}")
+                    depth -= 1
+                else:
+                    depth += 1
+            elif op in (AND_JUMP, OR_JUMP):
+                if not pc < arg <= end:
+                    raise ValueError(f"Malformed rule program: bad jump target {arg} at {pc}")
+                if depth < 1:
+                    raise ValueError(f"Malformed rule program: stack underflow at {pc}")
+                depth -= 1
+                jumps.append((arg, depth))
+            elif op == TO_BOOL:
+                # Closes the innermost AND/OR, whose jump lands right after it with the same depth
+                if not jumps or jumps[-1] != (pc + 1, depth - 1):
+                    raise ValueError(f"Malformed rule program: unmatched TO_BOOL at {pc}")
+                jumps.pop()
+            else:
+                raise ValueError(f"Malformed rule program: unknown opcode {op} at {pc}")
+        if jumps or depth != 1:
+            raise ValueError("Malformed rule program: does not leave exactly one value")
+
+def source_matches(blob: bytes, source: str) -> bool:
+    return (len(blob) >= _HEADER.size and blob[:4] == _MAGIC and
+            _HEADER.unpack_from(blob, 0)[1] == zlib.crc32(source.encode('utf-8')))
+
+def compile_program(ast) -> RuleProgram:
+    opcodes = array('B')
+    args = array('I')
+    attributes: List[str] = []
+    constants: List = []
+    attribute_ids = {}
+
+    def emit(op, arg=0) -> int:
+        opcodes.append(op)
+        args.append(arg)
+        return len(opcodes) - 1
+
+    def compile_node(node):
+        if node.type == "operand":
+            if is_attribute(node.value):
+                if node.value not in attribute_ids:
+                    attribute_ids[node.value] = len(attributes)
+                    attributes.append(node.value)
+                emit(LOAD_ATTR, attribute_ids[node.value])
+            else:
+                constants.append(node.value)
+                emit(LOAD_CONST, len(constants) - 1)
+        elif node.type == "operator" and node.value in ("AND", "OR"):
+            compile_node(node.left)
+            jump = emit(AND_JUMP if node.value == "AND" else OR_JUMP)
+            compile_node(node.right)
+            emit(TO_BOOL)
+            args[jump] = len(opcodes)
+        elif node.type == "operator" and node.value in COMPARISON_OPS:
+            compile_node(node.left)
+            compile_node(node.right)
+            emit(COMPARE, COMPARISON_OPS.index(node.value))
+        elif node.type == "operator":
+            raise ValueError(f"Unknown operator: {node.value}")
+        else:
+            raise ValueError(f"Invalid AST node type: {node.type}")
+
+    compile_node(ast)
+    return RuleProgram(opcodes, args, attributes, constants)
+
+def encode_rule(condition: str, parser) -> Optional[bytes]:
+    # Rules that do not parse are still stored, just without a program
+    try:
+        return compile_program(parser(condition)).to_bytes(condition)
+    except ValueError:
+        return None
+
+def ensure_program_column(conn: sqlite3.Connection, parser=None):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(rules)')}
+    if 'program' not in columns:
+        conn.execute('ALTER TABLE rules ADD COLUMN program BLOB')
+    if parser is not None:
+        # Backfill rules inserted before the column existed or by other writers,
+        # and re-encode blobs that are stale or in an older format
+        rows = conn.execute('SELECT id, condition, program FROM rules').fetchall()
+        updates = [(encode_rule(condition, parser), rule_id) for rule_id, condition, program in rows
+                   if program is None or not source_matches(program, condition)]
+        conn.executemany('UPDATE rules SET program = ? WHERE id = ?',
+                         [update for update in updates if update[0] is not None])
+    conn.commit()
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from rule_network import node_key
+from rule_optimizer import build_balanced, flatten
+
+# Used for predicates that have not been observed yet
+_DEFAULT_PASS_RATE = 0.5
+_DEFAULT_COST_NS = 1000.0
+
+def predicate_name(node) -> str:
+    # Stable across restarts, so it can key the persisted statistics
+    return repr(node_key(node))
+
+def ensure_stats_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS predicate_stats (
+        predicate TEXT PRIMARY KEY,
+        evaluations INTEGER NOT NULL,
+        passes INTEGER NOT NULL,
+        total_ns INTEGER NOT NULL
+    )
+    ''')
+
+def _rates(evaluations: int, passes: int, total_ns: int) -> Tuple[float, float]:
+    if not evaluations:
+        return _DEFAULT_PASS_RATE, _DEFAULT_COST_NS
+    return passes / evaluations, total_ns / evaluations
+
+class PredicateStats:
+    """Per-predicate pass rates and evaluation costs observed on real users.
+
+    Evaluators record one evaluation in every sample_every, so timing and
+    the lock taken by record stay off most predicate calls.
+    """
+
+    def __init__(self, reorder_every: int = 100000, flush_interval: float = 30.0, sample_every: int = 16):
+        self.reorder_every = reorder_every
+        self.flush_interval = flush_interval
+        self.sample_every = sample_every
+        # predicate -> [evaluations, passes, total_ns], persisted and not yet persisted
+        self._totals: Dict[str, List[int]] = {}
+        self._pending: Dict[str, List[int]] = {}
+        self.recorded = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, predicate: str, passed: bool, elapsed_ns: int):
+        with self._lock:
+            pending = self._pending.get(predicate)
+            if pending is None:
+                pending = self._pending[predicate] = [0, 0, 0]
+            pending[0] += 1
+            pending[1] += passed
+            pending[2] += elapsed_ns
+            self.recorded += 1
+
+    @property
+    def epoch(self) -> int:
+        # Advances every reorder_every evaluations (each recorded one stands for sample_every);
+        # rulesets are re-ordered when it changes
+        return self.recorded * self.sample_every // self.reorder_every
+
+    def estimate(self, predicate: str) -> Tuple[float, float]:
+        # (pass rate, mean cost in ns) over persisted and pending observations
+        evaluations = passes = total_ns = 0
+        for counts in (self._totals.get(predicate), self._pending.get(predicate)):
+            if counts:
+                evaluations += counts[0]
+                passes += counts[1]
+                total_ns += counts[2]
+        return _rates(evaluations, passes, total_ns)
+
+    def load(self, conn: sqlite3.Connection):
+        ensure_stats_table(conn)
+        with self._lock:
+            for predicate, evaluations, passes, total_ns in conn.execute(
+                    'SELECT predicate, evaluations, passes, total_ns FROM predicate_stats'):
+                self._totals[predicate] = [evaluations, passes, total_ns]
+
+    def due_for_flush(self) -> bool:
+        return bool(self._pending) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, conn: sqlite3.Connection):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            for predicate, counts in pending.items():
+                totals = self._totals.setdefault(predicate, [0, 0, 0])
+                for i, count in enumerate(counts):
+                    totals[i] += count
+        if not pending:
+            return
+        ensure_stats_table(conn)
+        conn.executemany('''
+            INSERT INTO predicate_stats (predicate, evaluations, passes, total_ns) VALUES (?, ?, ?, ?)
+            ON CONFLICT(predicate) DO UPDATE SET
+                evaluations = evaluations + excluded.evaluations,
+                passes = passes + excluded.passes,
+                total_ns = total_ns + excluded.total_ns
+        ''', [(predicate, *counts) for predicate, counts in pending.items()])
+        conn.commit()
+
+    def snapshot(self) -> List[Dict]:
+        # Copied under the lock, so neither record nor flush can change the counts halfway through
+        with self._lock:
+            counts = {predicate: list(totals) for predicate, totals in self._totals.items()}
+            for predicate, pending in self._pending.items():
+                totals = counts.setdefault(predicate, [0, 0, 0])
+                for i, count in enumerate(pending):
+                    totals[i] += count
+        rows = []
+        for predicate in sorted(counts):
+            pass_rate, cost_ns = _rates(*counts[predicate])
+            rows.append({'predicate': predicate, 'pass_rate': pass_rate, 'cost_ns': cost_ns})
+        return rows
+
+def _estimate(node, stats: PredicateStats) -> Tuple[float, float]:
+    # (pass rate, expected cost) of a subtree, treating predicates as independent
+    if node.type == "operator" and node.value in ("AND", "OR"):
+        children = [_estimate(child, stats) for child in flatten(node, node.value)]
+        if node.value == "AND":
+            children.sort(key=_and_rank)
+        else:
+            children.sort(key=_or_rank)
+        pass_rate, cost, reach = (1.0 if node.value == "AND" else 0.0), 0.0, 1.0
+        for child_pass, child_cost in children:
+            cost += reach * child_cost
+            if node.value == "AND":
+                pass_rate *= child_pass
+                reach = pass_rate
+            else:
+                pass_rate = 1 - (1 - pass_rate) * (1 - child_pass)
+                reach = 1 - pass_rate
+        return pass_rate, cost
+    return stats.estimate(predicate_name(node))
+
+def _and_rank(estimate: Tuple[float, float]) -> float:
+    # Cheap predicates that usually fail should run first in an AND
+    pass_rate, cost = estimate
+    return cost / max(1 - pass_rate, 1e-9)
+
+def _or_rank(estimate: Tuple[float, float]) -> float:
+    # ... and cheap predicates that usually pass first in an OR
+    pass_rate, cost = estimate
+    return cost / max(pass_rate, 1e-9)
+
+def reorder_rule(ast, stats: Optional[PredicateStats]):
+    """Return a copy of the AST with AND/OR operands ordered by observed cost and selectivity.
+
+    Combined with short-circuiting this runs the cheapest, most decisive
+    predicates first. Results are unchanged since AND/OR are commutative here.
+    """
+    if stats is None or ast.type != "operator":
+        return ast
+    if ast.value not in ("AND", "OR"):
+        left = reorder_rule(ast.left, stats)
+        right = reorder_rule(ast.right, stats)
+        if left is ast.left and right is ast.right:
+            return ast
+        return type(ast)("operator", value=ast.value, left=left, right=right)
+
+    rank = _and_rank if ast.value == "AND" else _or_rank
+    children = [reorder_rule(child, stats) for child in flatten(ast, ast.value)]
+    children.sort(key=lambda child: rank(_estimate(child, stats)))
+    return build_balanced(ast.value, children, type(ast))
@@ -10,5 +10,33 @@ CREATE TABLE users (
 CREATE TABLE rules (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
-    condition TEXT NOT NULL
+    condition TEXT NOT NULL,
+    program BLOB
+);
+
+CREATE TABLE predicate_stats (
+    predicate TEXT PRIMARY KEY,
+    evaluations INTEGER NOT NULL,
+    passes INTEGER NOT NULL,
+    total_ns INTEGER NOT NULL
+);
+
+CREATE TABLE eligibility (
+    user_id INTEGER NOT NULL,
+    rule_id INTEGER NOT NULL,
+    matched INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, rule_id)
+) WITHOUT ROWID;
+
+CREATE TABLE eligibility_backfill (
+    rule_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE eligibility_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
 );
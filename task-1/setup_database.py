@@ -1,7 +1,7 @@
 import sqlite3
 
-def create_database():
-    conn = sqlite3.connect('database.db')
+def create_database(path='database.db'):
+    conn = sqlite3.connect(path)
     cur = conn.cursor()
     
     # Create users table
@@ -21,10 +21,47 @@ def create_database():
     CREATE TABLE rules (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
-        condition TEXT NOT NULL
+        condition TEXT NOT NULL,
+        program BLOB
     )
     ''')
     
+    # Create predicate statistics table (pass rates and costs learned by the rule engine)
+    cur.execute('''
+    CREATE TABLE predicate_stats (
+        predicate TEXT PRIMARY KEY,
+        evaluations INTEGER NOT NULL,
+        passes INTEGER NOT NULL,
+        total_ns INTEGER NOT NULL
+    )
+    ''')
+    
+    # Create materialized eligibility tables (maintained by the rule service)
+    cur.execute('''
+    CREATE TABLE eligibility (
+        user_id INTEGER NOT NULL,
+        rule_id INTEGER NOT NULL,
+        matched INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, rule_id)
+    ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+    CREATE TABLE eligibility_backfill (
+        rule_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        complete INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE eligibility_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    cur.execute('INSERT INTO eligibility_version (id, version) VALUES (1, 0)')
+
     # Insert sample data into users table
     users = [
         ('Alice', 25, 'HR', 55000, 7),
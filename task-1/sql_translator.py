@@ -0,0 +1,137 @@
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rule_compiler import convert_value, is_attribute
+
+# Same aliases evaluate_user applies to a user row
+_ALIASES = {'salary': 'income'}
+
+_SQL_OPERATORS = {"==": "=", "=": "=", ">": ">", "<": "<", ">=": ">=", "<=": "<="}
+_FLIPPED = {"=": "=", ">": "<", "<": ">", ">=": "<=", "<=": ">="}
+
+# (where clause or None, parameters, whether the clause alone decides the rule)
+SqlPredicate = Tuple[Optional[str], List, bool]
+
+def get_user_columns(conn: sqlite3.Connection) -> Dict[str, str]:
+    # Map each users column to 'numeric' or 'text' following SQLite's type affinity rules
+    columns = {}
+    for row in conn.execute('PRAGMA table_info(users)'):
+        name, declared = row[1], (row[2] or '').upper()
+        if 'CHAR' in declared or 'CLOB' in declared or 'TEXT' in declared:
+            columns[name] = 'text'
+        elif declared:
+            columns[name] = 'numeric'
+    return columns
+
+def _resolve_column(node, columns: Dict[str, str]) -> Optional[str]:
+    if node.type != "operand" or not is_attribute(node.value):
+        return None
+    if node.value in columns:
+        return node.value
+    alias = _ALIASES.get(node.value)
+    return alias if alias in columns else None
+
+def _literal(node):
+    if node.type != "operand" or is_attribute(node.value):
+        return None, False
+    return convert_value(node.value), True
+
+def _translate_comparison(node, columns: Dict[str, str]) -> Optional[Tuple[str, List]]:
+    op = _SQL_OPERATORS[node.value]
+    left_column = _resolve_column(node.left, columns)
+    right_column = _resolve_column(node.right, columns)
+
+    if left_column and right_column:
+        if columns[left_column] == columns[right_column] == 'numeric':
+            return f'"{left_column}" {op} "{right_column}"', []
+        return None
+
+    if right_column:
+        column, (value, is_literal), op = right_column, _literal(node.left), _FLIPPED[op]
+    elif left_column:
+        column, (value, is_literal) = left_column, _literal(node.right)
+    else:
+        return None
+    if not is_literal:
+        return None
+
+    # Only comparisons where SQLite and the Python evaluator agree are pushed down:
+    # numbers against numeric columns, and string equality on text columns
+    if columns[column] == 'numeric' and isinstance(value, (int, float)):
+        return f'"{column}" {op} ?', [value]
+    if columns[column] == 'text' and isinstance(value, str) and op == "=":
+        return f'"{column}" = ?', [value]
+    return None
+
+def translate_rule(ast, columns: Dict[str, str]) -> SqlPredicate:
+    """Translate a Node tree into a parameterized WHERE clause over the users table.
+
+    When part of an AND cannot be expressed in SQL the other part is still
+    returned as a prefilter, with exact=False so the caller re-checks the
+    candidate rows in Python. A clause of None means no pushdown at all.
+    """
+    if ast.type == "operator" and ast.value in _SQL_OPERATORS:
+        translated = _translate_comparison(ast, columns)
+        if translated is None:
+            return None, [], False
+        return translated[0], translated[1], True
+
+    if ast.type == "operator" and ast.value in ("AND", "OR"):
+        left_sql, left_params, left_exact = translate_rule(ast.left, columns)
+        right_sql, right_params, right_exact = translate_rule(ast.right, columns)
+
+        if ast.value == "OR":
+            if left_sql is None or right_sql is None or not (left_exact and right_exact):
+                return None, [], False
+            return f'({left_sql} OR {right_sql})', left_params + right_params, True
+
+        if left_sql is None and right_sql is None:
+            return None, [], False
+        if left_sql is None:
+            return right_sql, right_params, False
+        if right_sql is None:
+            return left_sql, left_params, False
+        return f'({left_sql} AND {right_sql})', left_params + right_params, left_exact and right_exact
+
+    return None, [], False
+
+def _referenced_columns(ast, columns: Dict[str, str]) -> Iterable[str]:
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node is None or node.type != "operator":
+            continue
+        if node.value in _SQL_OPERATORS:
+            for child in (node.left, node.right):
+                column = _resolve_column(child, columns)
+                if column:
+                    yield column
+        else:
+            stack.extend((node.left, node.right))
+
+def get_indexed_columns(conn: sqlite3.Connection) -> List[str]:
+    indexed = []
+    for index in conn.execute('PRAGMA index_list(users)').fetchall():
+        index_columns = conn.execute(f'PRAGMA index_info("{index[1]}")').fetchall()
+        if index_columns:
+            indexed.append(index_columns[0][2])
+    return indexed
+
+def recommend_indexes(asts: Iterable, columns: Dict[str, str]) -> List[Tuple[str, int]]:
+    # Columns ordered by how many rule predicates reference them
+    counts = Counter()
+    for ast in asts:
+        counts.update(column for column in _referenced_columns(ast, columns) if column != 'id')
+    return counts.most_common()
+
+def create_indexes(conn: sqlite3.Connection, column_names: Iterable[str]) -> List[str]:
+    columns = get_user_columns(conn)
+    created = []
+    for column in column_names:
+        if column not in columns:
+            raise ValueError(f"Unknown users column: {column}")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_users_{column}" ON users ("{column}")')
+        created.append(f'idx_users_{column}')
+    conn.commit()
+    return created
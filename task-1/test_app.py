@@ -0,0 +1,461 @@
+import atexit
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from io import StringIO
+
+from setup_database import create_database
+
+# app opens RULES_DATABASE on import, so give it a scratch database
+if 'RULES_DATABASE' not in os.environ:
+    _workdir = tempfile.mkdtemp(prefix='rules-test-')
+    atexit.register(shutil.rmtree, _workdir, True)
+    os.environ['RULES_DATABASE'] = os.path.join(_workdir, 'database.db')
+    with redirect_stdout(StringIO()):
+        create_database(os.environ['RULES_DATABASE'])
+
+import app as rule_app
+from bulk_ingest import IngestAborted, ingest_users, iter_csv, iter_ndjson
+from eligibility import EligibilityStore
+from result_cache import MemoryBackend, RedisBackend, ResultCache
+from rule_parser import RuleParser, RuleSyntaxError
+
+def user_data(name='Test', age=40, department='Sales', income=60000, experience=3):
+    return {'name': name, 'age': age, 'department': department, 'income': income, 'experience': experience}
+
+class AppTestCase(unittest.TestCase):
+    """Tests share the app and its scratch database, so each one creates the users and rules it reads."""
+
+    def setUp(self):
+        self.client = rule_app.app.test_client()
+
+    def matched(self, user_id):
+        response = self.client.get(f'/evaluate/{user_id}?all=1')
+        self.assertEqual(response.status_code, 200)
+        return set(response.get_json()['matched_rules'])
+
+class TestEvaluateUser(AppTestCase):
+
+    def test_all_flag(self):
+        user_id = rule_app.insert_user(user_data(name='Flag'))
+        for query, listed in (('all=1', True), ('all=true', True), ('all=YES', True),
+                              ('all=0', False), ('all=false', False), ('all=no', False), ('all=', False), ('', False)):
+            body = self.client.get(f'/evaluate/{user_id}?{query}').get_json()
+            self.assertEqual('matched_rules' in body, listed, query)
+
+class TestCaches(AppTestCase):
+
+    def test_rule_cache_is_invalidated_by_a_new_rule(self):
+        cache = rule_app.rule_cache
+        rule_id = rule_app.insert_rule('cached', 'age > 20')
+        ast, fn = cache.get_entry(rule_id, 'age > 20')
+        self.assertIs(cache.get_entry(rule_id, 'age > 20')[1], fn)
+
+        version = cache.version
+        rule_app.insert_rule('another', 'age < 20')
+        self.assertEqual(cache.version, version + 1)
+        self.assertIsNot(cache.get_entry(rule_id, 'age > 20')[1], fn)
+
+    def test_rule_cache_rechecks_the_condition(self):
+        # A row edited outside the app keeps its id but must not be served stale
+        cache = rule_app.rule_cache
+        rule_id = rule_app.insert_rule('edited', 'age > 20')
+        self.assertTrue(cache.get(rule_id, 'age > 20')({'age': 30}))
+        self.assertFalse(cache.get(rule_id, 'age > 40')({'age': 30}))
+
+    def test_rule_parser_shares_trees_by_text_and_tokens(self):
+        parser = rule_app.rule_parser
+        ast = parser.parse("income > 1234 AND department = 'Parser'")
+        self.assertIs(parser.parse("income > 1234 AND department = 'Parser'"), ast)
+        self.assertIs(parser.parse("income  >  1234  AND department='Parser'"), ast)
+        self.assertIsNot(parser.parse("income > 1235 AND department = 'Parser'"), ast)
+
+    def test_result_cache_is_invalidated_by_user_writes(self):
+        rule_id = rule_app.insert_rule('young', 'age < 30')
+        user_id = rule_app.insert_user(user_data(age=40))
+        self.assertNotIn(rule_id, self.matched(user_id))
+        hits = rule_app.result_cache.hits
+        self.assertNotIn(rule_id, self.matched(user_id))
+        self.assertEqual(rule_app.result_cache.hits, hits + 1)
+
+        response = self.client.put(f'/users/{user_id}', json={'data': user_data(age=25)})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(rule_id, self.matched(user_id))
+
+    def test_result_cache_is_invalidated_by_rule_writes(self):
+        user_id = rule_app.insert_user(user_data(department='Cached'))
+        before = self.matched(user_id)
+        response = self.client.post('/rules', json={'data': {'name': 'cached dept',
+                                                             'condition': "department = 'Cached'"}})
+        self.assertEqual(response.status_code, 201)
+        added = self.matched(user_id) - before
+        self.assertEqual(len(added), 1)
+
+class FakeRedis:
+    # The three client methods RedisBackend uses, with expiry ignored
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+        return int(self.values[key])
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.computed = []
+
+    def lookup(self, cache, user_id, result=([1, 2], 7)):
+        def compute():
+            self.computed.append(user_id)
+            return result
+        return cache.get_or_compute(user_id, compute)
+
+    def test_hits_until_invalidated(self):
+        for backend in (MemoryBackend(), RedisBackend(FakeRedis())):
+            self.computed = []
+            cache = ResultCache(backend)
+            self.assertEqual(self.lookup(cache, 1), ([1, 2], 7))
+            self.assertEqual(self.lookup(cache, 1), ([1, 2], 7))
+            self.lookup(cache, 2)
+            self.assertEqual(self.computed, [1, 2])
+
+            cache.invalidate_user(1)                      # only user 1 is recomputed
+            self.lookup(cache, 1)
+            self.lookup(cache, 2)
+            self.assertEqual(self.computed, [1, 2, 1])
+
+            cache.invalidate_rules()                      # everybody is
+            self.lookup(cache, 1)
+            self.lookup(cache, 2)
+            self.assertEqual(self.computed, [1, 2, 1, 1, 2])
+            self.assertEqual((cache.hits, cache.misses), (2, 5))
+
+    def test_unknown_users_are_not_cached(self):
+        cache = ResultCache()
+        self.assertIsNone(self.lookup(cache, 3, result=None))
+        self.assertIsNone(self.lookup(cache, 3, result=None))
+        self.assertEqual(self.computed, [3, 3])
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_entries_expire_after_the_ttl(self):
+        clock = [100.0]
+        with mock.patch('result_cache.time.monotonic', lambda: clock[0]):
+            cache = ResultCache(ttl=30.0)
+            self.lookup(cache, 1)
+            clock[0] += 29.0
+            self.lookup(cache, 1)
+            clock[0] += 1.0
+            self.lookup(cache, 1)
+        self.assertEqual(self.computed, [1, 1])
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(MemoryBackend(max_size=2))
+        for user_id in (1, 2, 1, 3, 1, 2):
+            self.lookup(cache, user_id)
+        self.assertEqual(self.computed, [1, 2, 3, 2])
+        stats = cache.stats()
+        self.assertEqual((stats['size'], stats['evictions'], stats['hits']), (2, 2, 2))
+        self.assertEqual(stats['hit_rate'], 2 / 6)
+
+    def test_version_counters_are_bounded(self):
+        backend = MemoryBackend(max_size=3)
+        cache = ResultCache(backend)
+        self.lookup(cache, 1)
+        for user_id in range(1, 10):
+            cache.invalidate_user(user_id)
+            cache.invalidate_user(user_id)
+        self.assertEqual(len(backend._counters), 3)
+        # User 1's counter was evicted at 2; reading it as 0 again would address the stale entry
+        version = backend.counter('user:1:version')
+        self.assertGreaterEqual(version, 2)
+        self.lookup(cache, 1)
+        self.assertEqual(self.computed, [1, 1])
+        self.assertEqual(backend.incr('user:1:version'), version + 1)
+
+    def test_counts_lookups_from_many_threads(self):
+        cache = ResultCache()
+        self.lookup(cache, 1)
+
+        def look_up():
+            for _ in range(2000):
+                cache.get_or_compute(1, lambda: None)
+        threads = [threading.Thread(target=look_up) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.hits, cache.misses), (8000, 1))
+
+class TestRuleParser(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        parser = RuleParser(rule_app.Node)
+        ast = parser.parse('age > 30')
+        self.assertIs(parser.parse('age > 30'), ast)        # same text
+        self.assertIs(parser.parse('age>30'), ast)          # same tokens
+        self.assertIs(parser.parse('age>30'), ast)
+        # One rule, reachable from two texts
+        self.assertEqual(parser.stats(), {'size': 1, 'texts': 2, 'max_size': 4096, 'hits': 3, 'misses': 1,
+                                          'hit_rate': 0.75})
+
+    def test_max_size_counts_distinct_rules(self):
+        parser = RuleParser(rule_app.Node, max_size=2)
+        first = parser.parse('age > 1')
+        second = parser.parse('age > 2')
+        self.assertIs(parser.parse('age>1'), first)          # a hit by tokens, which keeps the rule recent
+        self.assertEqual((parser.stats()['size'], parser.stats()['texts']), (2, 2))
+        parser.parse('age > 3')                              # evicts 'age > 2', the least recently used rule
+        self.assertEqual(parser.stats()['size'], 2)
+        self.assertIs(parser.parse('age > 1'), first)        # its text was evicted, its tokens were not
+        self.assertEqual(parser.misses, 3)
+        self.assertIsNot(parser.parse('age > 2'), second)
+        self.assertEqual((parser.hits, parser.misses), (2, 4))
+        self.assertEqual((parser.stats()['size'], parser.stats()['texts']), (2, 2))
+
+    def test_syntax_errors_report_a_position_and_are_not_cached(self):
+        parser = RuleParser(rule_app.Node)
+        cases = {'age > 30 AND': 9, '(age > 30': 0, 'age > 30)': 8, 'age  30': 5, '': 0}
+        for rule, position in cases.items():
+            for _ in range(2):
+                with self.assertRaises(RuleSyntaxError) as caught:
+                    parser.parse(rule)
+                self.assertEqual(caught.exception.position, position, rule)
+        self.assertEqual((parser.stats()['size'], parser.hits), (0, 0))
+
+class TestEligibility(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn = rule_app.get_db_connection()
+        self.addCleanup(self.conn.close)
+
+    def stored(self, user_id, rule_id):
+        row = self.conn.execute('SELECT matched, version FROM eligibility WHERE user_id = ? AND rule_id = ?',
+                                (user_id, rule_id)).fetchone()
+        return None if row is None else tuple(row)
+
+    def insert_raw_user(self, **fields):
+        # Written behind the store's back, as a bulk load does
+        cursor = self.conn.execute('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
+                                   tuple(user_data(**fields).values()))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def test_backfill_in_chunks(self):
+        user_ids = [self.insert_raw_user(department='Backfill', age=20 + 10 * i) for i in range(5)]
+        cursor = self.conn.execute("INSERT INTO rules (name, condition) VALUES ('backfill', 'age >= 40')")
+        rule_id = cursor.lastrowid
+        self.conn.commit()
+
+        # A store of its own with no worker thread, so the backfill runs here, two users per transaction
+        store = EligibilityStore(rule_app.get_db_connection, rule_app.rule_cache, rule_app.prepare_user_data,
+                                 chunk_size=2)
+        store.add_rule(self.conn, rule_id)
+        store.backfill_rule(rule_id)
+        self.assertEqual([self.stored(user_id, rule_id)[0] for user_id in user_ids], [0, 0, 1, 1, 1])
+        progress = self.conn.execute('SELECT last_user_id, complete FROM eligibility_backfill WHERE rule_id = ?',
+                                     (rule_id,)).fetchone()
+        self.assertEqual(tuple(progress), (user_ids[-1], 1))
+
+    def test_new_rules_are_backfilled_in_the_background(self):
+        user_id = self.insert_raw_user(department='Background')
+        rule_id = rule_app.insert_rule('background', "department = 'Background'")
+        rule_app.eligibility_store.join()
+        self.assertEqual(self.stored(user_id, rule_id)[0], 1)
+
+    def test_put_refreshes_the_user(self):
+        rule_id = rule_app.insert_rule('senior', 'age > 50')
+        rule_app.eligibility_store.join()
+        user_id = rule_app.insert_user(user_data(age=40))
+        matched, version = self.stored(user_id, rule_id)
+        self.assertEqual(matched, 0)
+
+        response = self.client.put(f'/users/{user_id}', json={'data': user_data(age=60)})
+        self.assertEqual(response.status_code, 200)
+        matched, new_version = self.stored(user_id, rule_id)
+        self.assertEqual(matched, 1)
+        self.assertGreater(new_version, version)
+        self.assertIn(rule_id, self.matched(user_id))
+
+        self.assertEqual(self.client.put('/users/999999', json={'data': user_data()}).status_code, 404)
+        self.assertEqual(self.client.put(f'/users/{user_id}', json={'data': user_data(age='old')}).status_code, 400)
+
+    def test_unmaterialized_results_are_evaluated_on_read(self):
+        rule_id = rule_app.insert_rule('on read', "department = 'OnRead'")
+        rule_app.eligibility_store.join()
+        user_id = self.insert_raw_user(department='OnRead')
+        self.assertIsNone(self.stored(user_id, rule_id))
+        self.assertIn(rule_id, self.matched(user_id))
+        self.assertEqual(self.stored(user_id, rule_id)[0], 1)
+
+class TestConnectionReuse(AppTestCase):
+
+    def test_requests_return_their_connections(self):
+        user_id = rule_app.insert_user(user_data())
+        self.client.get(f'/evaluate/{user_id}?all=1')
+        opened = rule_app.db_pool.opened
+        for _ in range(20):
+            rule_app.result_cache.invalidate_user(user_id)  # so the lookup reaches the database
+            self.assertEqual(self.client.get(f'/evaluate/{user_id}?all=1').status_code, 200)
+            self.assertEqual(self.client.get('/rules/indexes').status_code, 200)
+        self.assertEqual(rule_app.db_pool.opened, opened)
+
+class TestBulkIngest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('''CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, age INTEGER NOT NULL,
+                             department TEXT NOT NULL, income REAL NOT NULL, experience REAL NOT NULL)''')
+        self.commits = 0
+
+        def trace(statement):
+            self.commits += statement == 'COMMIT'
+        self.conn.set_trace_callback(trace)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def test_one_transaction_per_batch(self):
+        lines = [json.dumps(user_data(age=20 + i)) for i in range(25)]
+        report = ingest_users(self.conn, iter_ndjson(lines), batch_size=10)
+        self.assertEqual((report['inserted'], report['failed']), (25, 0))
+        self.assertEqual(self.commits, 3)
+        self.assertEqual(self.count(), 25)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        lines = [json.dumps(user_data()),
+                 '{"name": "Broken"',
+                 json.dumps({'data': user_data(age=30)}),
+                 json.dumps(user_data(age='old')),
+                 '',
+                 json.dumps({k: v for k, v in user_data().items() if k != 'income'}),
+                 json.dumps(user_data(age=True)),
+                 '[1, 2]']
+        report = ingest_users(self.conn, iter_ndjson(lines))
+        self.assertEqual((report['inserted'], report['failed']), (2, 5))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 4, 6, 7, 8])
+        self.assertIn('invalid JSON', report['errors'][0]['error'])
+        self.assertEqual(self.count(), 2)
+
+        rows = ['name,age,department,income,experience', 'Ann,30,Sales,50000,2', 'Bob,x,HR,1,1']
+        report = ingest_users(self.conn, iter_csv(rows))
+        self.assertEqual((report['inserted'], report['errors']), (1, [{'line': 3, 'error': "'age' must be int, got 'x'"}]))
+
+    def test_unreadable_input_keeps_the_rows_before_it(self):
+        def records():
+            for line_no in range(1, 13):
+                yield line_no, user_data(age=20 + line_no)
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        with self.assertRaises(IngestAborted) as caught:
+            ingest_users(self.conn, records(), batch_size=5)
+        report = caught.exception.report
+        self.assertEqual(report['inserted'], 12)
+        self.assertIn('after line 12', report['error'])
+        self.assertEqual(self.count(), 12)
+
+    def test_batch_size_must_be_positive(self):
+        for batch_size in (0, -1):
+            with self.assertRaises(ValueError):
+                ingest_users(self.conn, iter([]), batch_size=batch_size)
+
+    def test_bulk_endpoint(self):
+        for batch_size in ('0', '-5', 'many'):
+            response = self.client.post(f'/users/bulk?batch_size={batch_size}', data=b'')
+            self.assertEqual(response.status_code, 400, batch_size)
+
+        body = 'name,age,department,income,experience\nAnn,30,Bulk,50000,2\nBob,41,Bulk,60000,7\n'
+        response = self.client.post('/users/bulk?format=csv', data=body.encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['inserted'], 2)
+
+    def test_bulk_endpoint_with_a_broken_body(self):
+        # Far more than one decoder chunk of valid rows before the invalid UTF-8
+        lines = ''.join(json.dumps(user_data(name=f'Bulk {i}', department='Broken')) + '\n' for i in range(500))
+        response = self.client.post('/users/bulk?batch_size=50', data=lines.encode() + b'\xff\n')
+        self.assertEqual(response.status_code, 400)
+        report = response.get_json()
+        self.assertIn('error', report)
+        self.assertGreater(report['inserted'], 0)
+        conn = rule_app.get_db_connection()
+        stored = conn.execute("SELECT COUNT(*) FROM users WHERE department = 'Broken'").fetchone()[0]
+        conn.close()
+        self.assertEqual(stored, report['inserted'])
+
+class TestSqlPushdown(AppTestCase):
+
+    RULES = [
+        "age > 30 AND department = 'Sales'",            # full pushdown
+        "(salary >= 50000 OR experience < 2) AND age <= 45",
+        "department > 'M' OR age < 25",                 # string range: finished in Python
+        "name = department",                            # text against text: Python only
+        "age > '30' AND missing = 3",
+        "30 < age AND NOT_A_COLUMN",
+    ]
+
+    def python_matches(self, condition):
+        ast = rule_app.create_rule_fun(condition)
+        conn = rule_app.get_db_connection()
+        rows = conn.execute('SELECT * FROM users ORDER BY id').fetchall()
+        conn.close()
+        return [row['id'] for row in rows if rule_app.evaluate_rule(ast, rule_app.prepare_user_data(row))]
+
+    def test_matches_python_evaluation(self):
+        from test_evaluators import random_rule
+
+        rng = random.Random(1)
+        for _ in range(60):
+            rule_app.insert_user(user_data(name=rng.choice(['Ann', 'Sales']), age=rng.randint(18, 70),
+                                           department=rng.choice(['Sales', 'HR', 'IT', '42']),
+                                           income=rng.randint(20, 90) * 1000, experience=rng.randint(0, 10)))
+        conditions = self.RULES + [random_rule(rng) for _ in range(40)]
+        pushdowns = set()
+        for condition in conditions:
+            rule_id = rule_app.insert_rule('pushdown', condition)
+            response = self.client.get(f'/rules/{rule_id}/users')
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            pushdowns.add(body['pushdown'])
+            self.assertEqual(body['user_ids'], self.python_matches(condition), condition)
+        self.assertEqual(pushdowns, {'full', 'partial', 'none'})
+
+    def test_unknown_rule(self):
+        self.assertEqual(self.client.get('/rules/999999/users').status_code, 404)
+
+    def test_malformed_program_is_a_bad_request(self):
+        program = rule_app.parse_rule('age > 30')['rule_program']
+        response = self.client.post('/evaluate_rule', json={'rule_program': program, 'data': {'age': 40}})
+        self.assertEqual(response.get_json(), {'result': True})
+        loop = 'UlBHMQAAAAAKAAAAAgAAAFtbXSxbIjAiXV0BAgAAAAAAAAAA'
+        response = self.client.post('/evaluate_rule', json={'rule_program': loop, 'data': {'age': 40}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_limit_is_validated(self):
+        for limit in (-1, 'two', 1.5, True):
+            response = self.client.post('/rules/indexes', json={'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+        response = self.client.post('/rules/indexes', json={'limit': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['created'], [])
+
+if __name__ == '__main__':
+    unittest.main()
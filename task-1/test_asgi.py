@@ -0,0 +1,156 @@
+import asyncio
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from setup_database import create_database
+
+# app opens RULES_DATABASE on import, so give it a scratch database
+if 'RULES_DATABASE' not in os.environ:
+    _workdir = tempfile.mkdtemp(prefix='rules-test-')
+    atexit.register(shutil.rmtree, _workdir, True)
+    os.environ['RULES_DATABASE'] = os.path.join(_workdir, 'database.db')
+    with redirect_stdout(StringIO()):
+        create_database(os.environ['RULES_DATABASE'])
+
+import app as rule_app
+import asgi
+
+def call(method, path, body=None, query=b''):
+    """Drive the ASGI app through one request; returns (status, headers, body bytes)."""
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else b''
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': raw, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': []}
+    asyncio.run(asgi.app(scope, receive, send))
+    start, parts = messages[0], messages[1:]
+    assert start['type'] == 'http.response.start'
+    assert not parts[-1].get('more_body')
+    return start['status'], dict(start['headers']), b''.join(part['body'] for part in parts)
+
+def call_json(method, path, body=None, query=b''):
+    status, _, content = call(method, path, body, query)
+    return status, json.loads(content)
+
+USER = {'name': 'Asgi', 'age': 35, 'department': 'Async', 'income': 70000, 'experience': 4}
+
+class TestRouting(unittest.TestCase):
+
+    def test_unknown_path_is_404(self):
+        self.assertEqual(call_json('GET', '/nowhere'), (404, {'error': 'Not found'}))
+        # Bulk loads stream their body and are served by the Flask app only
+        self.assertEqual(call('POST', '/users/bulk')[0], 404)
+
+    def test_wrong_method_is_405(self):
+        for method, path in (('GET', '/users'), ('DELETE', '/rules/indexes'), ('POST', '/evaluate/1'),
+                             ('PUT', '/metrics/profile')):
+            self.assertEqual(call_json(method, path), (405, {'error': 'Method not allowed'}), (method, path))
+
+    def test_cors_headers(self):
+        status, headers, body = call('OPTIONS', '/evaluate/batch')
+        self.assertEqual((status, body), (204, b''))
+        self.assertEqual(headers[b'access-control-allow-origin'], b'*')
+        self.assertIn(b'DELETE', headers[b'access-control-allow-methods'])
+        for method, path in (('GET', '/rules/cache'), ('GET', '/nowhere'), ('POST', '/create_rule')):
+            self.assertEqual(call(method, path)[1][b'access-control-allow-origin'], b'*')
+
+    def test_bad_bodies_are_400(self):
+        self.assertEqual(call('POST', '/create_rule', b'{not json')[0], 400)
+        self.assertEqual(call_json('POST', '/create_rule', [1, 2]),
+                         (400, {'error': 'request body must be a JSON object'}))
+        self.assertEqual(call('POST', '/users', {'no': 'data'})[0], 400)
+
+class TestRoutes(unittest.TestCase):
+    """The ported routes answer like their Flask views."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.flask = rule_app.app.test_client()
+        status, _ = call_json('POST', '/rules', {'data': {'name': 'async', 'condition': "department = 'Async'"}})
+        assert status == 201
+        cls.user_id = rule_app.insert_user(USER)
+        cls.rule_id = rule_app.insert_rule('async range', 'age > 30 AND income >= 70000')
+        # Enough users that a full batch takes several trips to the database executor
+        conn = rule_app.get_db_connection()
+        conn.executemany('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
+                         [(f'Async {i}', 20 + i % 50, 'Async', 50000 + 100 * i, i % 10)
+                          for i in range(2 * asgi.STREAM_LINES)])
+        conn.commit()
+        conn.close()
+
+    def test_users_and_evaluation(self):
+        status, body = call_json('POST', '/users', {'data': dict(USER, age=20)})
+        self.assertEqual(status, 201)
+        status, body = call_json('GET', f'/evaluate/{self.user_id}', query=b'all=1')
+        self.assertEqual(status, 200)
+        self.assertIn(self.rule_id, body['matched_rules'])
+        for query in (b'all=0', b'all=false', b''):
+            status, body = call_json('GET', f'/evaluate/{self.user_id}', query=query)
+            self.assertNotIn('matched_rules', body, query)
+        self.assertEqual(call_json('GET', '/evaluate/999999')[0], 404)
+        self.assertEqual(call_json('PUT', f'/users/{self.user_id}', {'data': dict(USER, age='x')})[0], 400)
+
+    def test_evaluate_batch_streams_ndjson(self):
+        request = {'user_ids': [self.user_id, 999999]}
+        status, headers, body = call('POST', '/evaluate/batch', request)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'application/x-ndjson')
+        expected = self.flask.post('/evaluate/batch', json=request).get_data()
+        self.assertEqual(body, expected)
+        self.assertEqual(json.loads(body.splitlines()[1]), {'user_id': 999999, 'error': 'User not found'})
+
+        status, _, body = call('POST', '/evaluate/batch', {'all': True})
+        self.assertGreater(len(body.splitlines()), 2 * asgi.STREAM_LINES)
+        self.assertEqual(body, self.flask.post('/evaluate/batch', json={'all': True}).get_data())
+        self.assertEqual(call_json('POST', '/evaluate/batch', {'user_ids': 'all'})[0], 400)
+        self.assertEqual(call_json('POST', '/evaluate/batch', {})[0], 400)
+
+    def test_rule_users(self):
+        status, body = call_json('GET', f'/rules/{self.rule_id}/users')
+        self.assertEqual(status, 200)
+        self.assertIn(self.user_id, body['user_ids'])
+        self.assertEqual(body, self.flask.get(f'/rules/{self.rule_id}/users').get_json())
+        self.assertEqual(call_json('GET', '/rules/999999/users'), (404, {'error': 'Rule not found'}))
+
+    def test_rule_indexes(self):
+        status, body = call_json('GET', '/rules/indexes')
+        self.assertEqual((status, body['created']), (200, []))
+        for limit in (-1, 'two', True):
+            self.assertEqual(call_json('POST', '/rules/indexes', {'limit': limit})[0], 400, limit)
+        self.assertEqual(call_json('POST', '/rules/indexes', {'limit': 0}), (200, body))
+
+    def test_statistics_and_caches(self):
+        status, body = call_json('GET', '/rules/stats')
+        self.assertEqual(status, 200)
+        self.assertIsInstance(body['predicates'], list)
+        status, body = call_json('GET', '/rules/cache')
+        self.assertEqual(status, 200)
+        self.assertLessEqual({'parser', 'results'}, set(body))
+        status, headers, body = call('GET', '/metrics')
+        self.assertEqual((status, headers[b'content-type']), (200, b'text/plain; version=0.0.4'))
+
+    def test_profiler(self):
+        try:
+            status, body = call_json('POST', '/metrics/profile', {'interval': 0.001})
+            self.assertEqual((status, body['running']), (200, True))
+            status, body = call_json('GET', '/metrics/profile', query=b'top=3')
+            self.assertEqual(status, 200)
+            self.assertLessEqual(len(body['hottest_functions']), 3)
+            self.assertEqual(call('GET', '/metrics/profile', query=b'top=x')[0], 400)
+        finally:
+            status, body = call_json('DELETE', '/metrics/profile')
+        self.assertEqual((status, body['running']), (200, False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from benchmark import FULL, QUICK, _metric, compare
+
+def report(sizes, seed=0, **results):
+    return {'meta': {'seed': seed, 'sizes': dict(sizes)}, 'results': results}
+
+class TestCompare(unittest.TestCase):
+
+    def test_higher_is_better(self):
+        baseline = report(FULL, parse=_metric(1000, 'rules/s', True), latency=_metric(10, 'ms', False))
+        # Within the threshold, or better
+        self.assertEqual(compare(report(FULL, parse=_metric(850, 'rules/s', True),
+                                        latency=_metric(5, 'ms', False)), baseline, 0.2), [])
+        regressions = compare(report(FULL, parse=_metric(700, 'rules/s', True),
+                                     latency=_metric(13, 'ms', False)), baseline, 0.2)
+        self.assertEqual(regressions, ['parse: 1000 -> 700 rules/s (-30.0%)', 'latency: 10 -> 13 ms (+30.0%)'])
+        # A faster parse is not a regression, however large the change
+        self.assertEqual(compare(report(FULL, parse=_metric(5000, 'rules/s', True)), baseline, 0.2), [])
+
+    def test_zero_baseline(self):
+        baseline = report(QUICK, parse=_metric(0, 'rules/s', True), latency=_metric(0, 'ms', False))
+        self.assertEqual(compare(report(QUICK, parse=_metric(10, 'rules/s', True), latency=_metric(0, 'ms', False)),
+                                 baseline, 0.2), [])
+        self.assertEqual(compare(report(QUICK, latency=_metric(0.5, 'ms', False)), baseline, 0.2),
+                         ['latency: 0 -> 0.5 ms'])
+
+    def test_new_metrics_are_skipped(self):
+        self.assertEqual(compare(report(QUICK, parse=_metric(1, 'rules/s', True)), report(QUICK), 0.2), [])
+
+    def test_mismatched_settings_are_refused(self):
+        baseline = report(FULL, latency=_metric(10, 'ms', False))
+        for current in (report(QUICK, latency=_metric(10, 'ms', False)),
+                        report(dict(FULL, width=3), latency=_metric(10, 'ms', False)),
+                        report(FULL, seed=1, latency=_metric(10, 'ms', False))):
+            with self.assertRaises(ValueError):
+                compare(current, baseline, 0.2)
+        with self.assertRaisesRegex(ValueError, r'overlap 0\.5 -> 0\.25'):
+            compare(report(dict(FULL, overlap=0.25)), baseline, 0.2)
+        # Results written before the sizes were recorded
+        with self.assertRaises(ValueError):
+            compare(report(FULL), {'results': baseline['results']}, 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from db_pool import ConnectionPool
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='pool-test-')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.pool = ConnectionPool(os.path.join(self.workdir, 'pool.db'), max_idle=2)
+        self.addCleanup(self.pool.close_all)
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.commit()
+        conn.close()
+
+    def assertClosed(self, conn):
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+    def test_connections_are_reused(self):
+        first = self.pool.acquire()
+        first.close()
+        second = self.pool.acquire()
+        self.assertIs(second, first)
+        self.assertEqual((self.pool.opened, self.pool.reused), (1, 2))
+        self.assertEqual(second.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertIsInstance(second.execute('SELECT 1 AS one').fetchone(), sqlite3.Row)
+        second.close()
+
+    def test_most_recently_used_first(self):
+        a, b = self.pool.acquire(), self.pool.acquire()
+        a.close()
+        b.close()
+        self.assertIs(self.pool.acquire(), b)
+        self.assertIs(self.pool.acquire(), a)
+
+    def test_only_max_idle_connections_are_kept(self):
+        conns = [self.pool.acquire() for _ in range(3)]
+        for conn in conns:
+            conn.close()
+        self.assertClosed(conns[2])
+        self.assertEqual({id(self.pool.acquire()), id(self.pool.acquire())}, {id(conns[0]), id(conns[1])})
+
+    def test_release_rolls_back_an_open_transaction(self):
+        conn = self.pool.acquire()
+        conn.execute("INSERT INTO items (name) VALUES ('uncommitted')")
+        self.assertTrue(conn.in_transaction)
+        conn.close()
+        conn = self.pool.acquire()
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0], 0)
+        conn.close()
+
+    def test_closing_twice_returns_the_connection_once(self):
+        conn = self.pool.acquire()
+        conn.close()
+        conn.close()
+        self.assertIs(self.pool.acquire(), conn)
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_close_all_discards_idle_connections(self):
+        conn = self.pool.acquire()
+        conn.close()
+        self.pool.close_all()
+        self.assertClosed(conn)
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_observer_times_queries_and_commits(self):
+        timings = []
+        self.pool.observer = timings.append
+        conn = self.pool.acquire()
+        conn.execute("INSERT INTO items (name) VALUES ('timed')")
+        conn.commit()
+        conn.execute('SELECT * FROM items').fetchall()
+        conn.close()
+        self.assertEqual(len(timings), 4)  # execute, commit, execute, fetchall
+        self.assertTrue(all(seconds >= 0 for seconds in timings))
+
+if __name__ == '__main__':
+    unittest.main()
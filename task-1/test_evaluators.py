@@ -0,0 +1,357 @@
+import atexit
+import base64
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from array import array
+from contextlib import redirect_stdout
+from io import StringIO
+
+from setup_database import create_database
+
+# app opens RULES_DATABASE on import, so give it a scratch database
+if 'RULES_DATABASE' not in os.environ:
+    _workdir = tempfile.mkdtemp(prefix='rules-test-')
+    atexit.register(shutil.rmtree, _workdir, True)
+    os.environ['RULES_DATABASE'] = os.path.join(_workdir, 'database.db')
+    with redirect_stdout(StringIO()):
+        create_database(os.environ['RULES_DATABASE'])
+
+import app as rule_app
+from columnar import compile_columnar, load_user_columns
+from rule_bdd import DecisionDiagram, compile_bdd
+from rule_compiler import compile_rule
+from rule_index import RuleIndex
+from rule_network import RuleNetwork, node_key
+from rule_optimizer import optimize_rule
+from rule_program import (AND_JUMP, COMPARE, LOAD_ATTR, LOAD_CONST, OR_JUMP, TO_BOOL, RuleProgram,
+                          compile_program)
+from rule_stats import PredicateStats, reorder_rule
+
+ATTRIBUTES = ['age', 'department', 'income', 'experience', 'salary', 'name', 'missing']
+DEPARTMENTS = ["'Sales'", "'Marketing'", "'HR'", "'IT'"]
+OPERATORS = ['>', '<', '>=', '<=', '=', '==']
+
+def random_literal(rng: random.Random) -> str:
+    return rng.choice([str(rng.randint(0, 80)), str(rng.randint(0, 80) * 1000), rng.choice(DEPARTMENTS),
+                       "'30'", "'true'", "'false'", 'true'])
+
+def random_predicate(rng: random.Random) -> str:
+    op = rng.choice(OPERATORS)
+    kind = rng.random()
+    if kind < 0.65:
+        return f"{rng.choice(ATTRIBUTES)} {op} {random_literal(rng)}"
+    if kind < 0.75:
+        return f"{random_literal(rng)} {op} {rng.choice(ATTRIBUTES)}"
+    if kind < 0.85:
+        return f"{rng.choice(ATTRIBUTES)} {op} {rng.choice(ATTRIBUTES)}"
+    if kind < 0.93:
+        return rng.choice(ATTRIBUTES)  # a bare operand under AND/OR
+    return f"{random_literal(rng)} {op} {random_literal(rng)}"
+
+def random_rule(rng: random.Random, depth: int = 3) -> str:
+    """Random rule text: AND/OR chains of 2-4 operands, some of them nested, over mixed-type predicates."""
+    if depth == 0 or rng.random() < 0.25:
+        return random_predicate(rng)
+    op = rng.choice(['AND', 'OR'])
+    operands = [random_rule(rng, depth - 1) for _ in range(rng.randint(2, 4))]
+    return '(' + f' {op} '.join(operands) + ')'
+
+def random_user(rng: random.Random) -> dict:
+    user = {
+        'name': rng.choice(['Alice', 'Bob', 'age', '30']),
+        'age': rng.choice([rng.randint(18, 70), str(rng.randint(18, 70))]),
+        'department': rng.choice(['Sales', 'Marketing', 'HR', 'IT', 'true', '40']),
+        'income': rng.choice([rng.randint(20, 90) * 1000, rng.randint(20, 90) * 1000 + 0.5]),
+        'experience': rng.randint(0, 40),
+        'salary': rng.randint(20, 90) * 1000,
+    }
+    # Missing attributes compare by their own name
+    for attribute in rng.sample(list(user), rng.randint(0, 2)):
+        del user[attribute]
+    return user
+
+class DifferentialTestCase(unittest.TestCase):
+    """Random rules and users, checked against app.evaluate_rule as the reference."""
+
+    seed = 0
+    rule_count = 300
+    user_count = 40
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(cls.seed)
+        cls.rule_strings = [random_rule(rng) for _ in range(cls.rule_count)]
+        cls.asts = [rule_app.create_rule_fun(rule) for rule in cls.rule_strings]
+        cls.users = [random_user(rng) for _ in range(cls.user_count)]
+
+    def expected(self, ast, user):
+        return rule_app.evaluate_rule(ast, user)
+
+    def assertRulesetAgrees(self, ruleset):
+        # matching_rules and first_match over the whole ruleset at once
+        for user in self.users:
+            expected = [rule_id for rule_id, ast in enumerate(self.asts) if self.expected(ast, user)]
+            self.assertEqual(ruleset.matching_rules(user), expected, repr(user))
+            self.assertEqual(ruleset.first_match(user), expected[0] if expected else None)
+
+    def assertAgrees(self, evaluate, exact=True):
+        # exact: the same value as evaluate_rule; otherwise the same truth value
+        for rule, ast in zip(self.rule_strings, self.asts):
+            for user in self.users:
+                expected = self.expected(ast, user)
+                actual = evaluate(ast, user)
+                if not exact:
+                    expected, actual = bool(expected), bool(actual)
+                self.assertEqual(actual, expected, f"rule {rule!r} on {user!r}")
+
+class TestCompiledRules(DifferentialTestCase):
+
+    def test_compile_rule(self):
+        self.assertAgrees(lambda ast, user: compile_rule(ast)(user))
+
+class TestRuleNetwork(DifferentialTestCase):
+
+    def test_shared_predicate_network(self):
+        network = RuleNetwork(enumerate(self.asts))
+        # Random rules repeat predicates, which the network evaluates once
+        self.assertLess(network.predicate_count, network.predicate_references)
+        self.assertRulesetAgrees(network)
+
+class TestPredicateStats(DifferentialTestCase):
+
+    def test_network_with_sampled_statistics(self):
+        stats = PredicateStats(sample_every=4)
+        network = RuleNetwork(enumerate(self.asts), stats)
+        for _ in range(3):
+            self.assertRulesetAgrees(network)
+        self.assertGreater(stats.recorded, 0)
+        self.assertTrue(all(0.0 <= row['pass_rate'] <= 1.0 for row in stats.snapshot()))
+
+        # Re-ordered by the statistics, the rules still give the same results
+        self.assertAgrees(lambda ast, user: self.expected(reorder_rule(ast, stats), user), exact=False)
+
+    def test_snapshot_while_recording(self):
+        stats = PredicateStats()
+        stop = threading.Event()
+
+        def record(worker):
+            i = 0
+            while not stop.is_set():
+                # New keys keep arriving for a while, then the same ones are updated
+                stats.record(f'predicate {worker} {i % 500}', i % 2 == 0, 100)
+                i += 1
+
+        threads = [threading.Thread(target=record, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(200):
+                stats.snapshot()  # used to fail with "dictionary changed size during iteration"
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        rows = stats.snapshot()
+        self.assertEqual(len(rows), len({row['predicate'] for row in rows}))
+        self.assertLessEqual(len(rows), 4 * 500)
+
+class TestRuleProgram(DifferentialTestCase):
+
+    def test_program_and_blob_round_trip(self):
+        def run(ast, user):
+            blob = compile_program(ast).to_bytes()
+            return RuleProgram.from_bytes(blob).run(user)
+        self.assertAgrees(lambda ast, user: compile_program(ast).run(user))
+        self.assertAgrees(run)
+
+    def assertRejected(self, blob):
+        with self.assertRaises(ValueError):
+            RuleProgram.from_bytes(blob)
+
+    def program_blob(self, code, attributes=(), constants=()):
+        # A blob with a valid header and checksum around arbitrary instructions
+        return RuleProgram(array('B', [op for op, _ in code]), array('I', [arg for _, arg in code]),
+                           list(attributes), list(constants)).to_bytes()
+
+    def test_malformed_programs_are_rejected(self):
+        const, attr = (LOAD_CONST, 0), (LOAD_ATTR, 0)
+        cases = {
+            'backward jump (an endless loop)': [const, (AND_JUMP, 0)],
+            'jump to itself': [const, (OR_JUMP, 1)],
+            'jump past the end': [const, (AND_JUMP, 5), const, (TO_BOOL, 0)],
+            'jump not closed by TO_BOOL': [const, (AND_JUMP, 3), const],
+            'TO_BOOL without a jump': [const, (TO_BOOL, 0)],
+            'constant out of range': [(LOAD_CONST, 1)],
+            'attribute out of range': [(LOAD_ATTR, 1)],
+            'unknown comparison': [attr, const, (COMPARE, 6)],
+            'unknown opcode': [const, (6, 0)],
+            'stack underflow': [const, (COMPARE, 0)],
+            'jump on an empty stack': [(AND_JUMP, 2), const],
+            'two values left': [const, attr],
+            'empty program': [],
+        }
+        for name, code in cases.items():
+            with self.subTest(name):
+                self.assertRejected(self.program_blob(code, ['age'], ['30']))
+
+        # The infinite loop from the review, in the previous format
+        self.assertRejected(base64.b64decode('UlBHMQAAAAAKAAAAAgAAAFtbXSxbIjAiXV0BAgAAAAAAAAAA'))
+
+    def test_damaged_blobs_are_rejected(self):
+        blob = compile_program(rule_app.create_rule_fun("age > 30 AND department = 'Sales'")).to_bytes()
+        RuleProgram.from_bytes(blob)
+        self.assertRejected(b'')
+        self.assertRejected(blob[:10])
+        self.assertRejected(blob[:-1])
+        self.assertRejected(blob + b'\0')
+        # Every byte but the source condition's CRC, which only a loader holding the condition can check
+        for position in [*range(4), *range(8, len(blob))]:
+            damaged = bytearray(blob)
+            damaged[position] ^= 0x01
+            self.assertRejected(bytes(damaged))
+        self.assertRejected(self.program_blob([(LOAD_CONST, 0)], [], [['nested']]))
+
+class TestDecisionDiagram(DifferentialTestCase):
+
+    def test_compile_bdd(self):
+        compiled = {}
+
+        def evaluate(ast, user):
+            if id(ast) not in compiled:
+                compiled[id(ast)] = compile_bdd(ast)
+            return compiled[id(ast)](user)
+        self.assertAgrees(evaluate, exact=False)
+
+    def test_shared_diagram(self):
+        # One diagram for every rule: shared variables and nodes must not change any answer
+        diagram = DecisionDiagram()
+        roots = [diagram.compile(ast) for ast in self.asts]
+        self.assertAgrees(lambda ast, user: diagram.evaluate(roots[self.asts.index(ast)], user), exact=False)
+        for rule, ast, root in zip(self.rule_strings, self.asts, roots):
+            self.assertEqual(diagram.compile(rule_app.create_rule_fun(rule)), root)
+
+    def test_deep_left_leaning_tree(self):
+        # Built without the parser, so nothing balances it
+        ast = rule_app.create_rule_fun('age > 0')
+        for i in range(1, 5000):
+            ast = rule_app.Node("operator", value="AND" if i % 2 else "OR", left=ast,
+                                right=rule_app.create_rule_fun(f'income > {i % 40 * 1000}'))
+        evaluate = compile_bdd(ast)
+        self.assertTrue(evaluate({'age': 30, 'income': 50000}))
+        self.assertFalse(evaluate({'age': 30, 'income': 100}))
+
+class TestRuleIndex(DifferentialTestCase):
+
+    def test_indexed_candidates(self):
+        index = RuleIndex(enumerate(self.asts))
+        self.assertRulesetAgrees(index)
+
+    def test_index_prunes_on_numeric_ranges(self):
+        # Rules over numeric thresholds only, so most of them are ruled out without evaluation
+        rng = random.Random(self.seed)
+        asts = [rule_app.create_rule_fun(f"age > {rng.randint(18, 70)} AND income < {rng.randint(20, 90) * 1000}")
+                for _ in range(100)]
+        index = RuleIndex(enumerate(asts))
+        user = {'age': 30, 'income': 50000}
+        candidates = index.candidates(user)
+        self.assertLess(len(candidates), len(asts))
+        self.assertEqual(index.matching_rules(user),
+                         [rule_id for rule_id, ast in enumerate(asts) if rule_app.evaluate_rule(ast, user)])
+
+class TestCombinedRules(DifferentialTestCase):
+
+    def test_balanced_combination(self):
+        for start in range(0, len(self.rule_strings), 25):
+            rules = self.rule_strings[start:start + 25]
+            asts = self.asts[start:start + 25]
+            for operator, combine in (('OR', any), ('AND', all)):
+                combined = rule_app.combine_rules(rules, operator)
+                left_deep = asts[0]
+                for ast in asts[1:]:
+                    left_deep = rule_app.Node("operator", value=operator, left=left_deep, right=ast)
+                for user in self.users:
+                    expected = combine(bool(self.expected(ast, user)) for ast in asts)
+                    self.assertEqual(bool(self.expected(combined, user)), expected)
+                    self.assertEqual(bool(self.expected(left_deep, user)), expected)
+
+    def test_optimize_rule(self):
+        self.assertAgrees(lambda ast, user: self.expected(optimize_rule(ast), user), exact=False)
+
+    def test_long_chains_stay_shallow(self):
+        # Well past the recursion limit if the parser built these left-deep
+        user = {'age': 60, 'income': 1000}
+        for rule in (' AND '.join(f'age > {i % 50}' for i in range(5000)),
+                     ' OR '.join(f'(age > {i % 50} AND income < {i})' for i in range(5000))):
+            ast = rule_app.create_rule_fun(rule)
+            expected = compile_rule(ast)(user)
+            self.assertEqual(self.expected(ast, user), expected)
+            self.assertEqual(compile_program(ast).run(user), expected)
+            if ' OR ' not in rule:  # 5000 distinct income thresholds make the OR of ANDs too slow to diagram
+                self.assertEqual(compile_bdd(ast)(user), bool(expected))
+            self.assertEqual(bool(self.expected(optimize_rule(ast), user)), bool(expected))
+            self.assertTrue(repr(ast) and node_key(ast))
+
+class TestColumnar(DifferentialTestCase):
+
+    def test_masks_match_per_user_evaluation(self):
+        rng = random.Random(self.seed)
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        conn.execute('''CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, age INTEGER NOT NULL,
+                        department TEXT NOT NULL, income REAL NOT NULL, experience REAL NOT NULL)''')
+        for _ in range(200):
+            # An occasional text value turns a numeric column into a dictionary-encoded one
+            age = rng.choice([rng.randint(18, 70)] * 9 + ['unknown'])
+            conn.execute('INSERT INTO users (name, age, department, income, experience) VALUES (?, ?, ?, ?, ?)',
+                         (rng.choice(['Alice', 'Bob', 'age']), age, rng.choice(['Sales', 'HR', 'IT', 'true']),
+                          rng.randint(20, 90) * 1000 + rng.choice([0, 0.5]), rng.randint(0, 40)))
+        rows = conn.execute('SELECT * FROM users ORDER BY id').fetchall()
+        table = load_user_columns(conn, ['name', 'age', 'department', 'income', 'experience'], chunk_size=64)
+        users = [rule_app.prepare_user_data(row) for row in rows]
+
+        for rule, ast in zip(self.rule_strings, self.asts):
+            mask = compile_columnar(ast)(table)
+            expected = [bool(rule_app.evaluate_rule(ast, user)) for user in users]
+            self.assertEqual([bool(value) for value in mask], expected, rule)
+
+class TestParallel(DifferentialTestCase):
+
+    SCRIPT = '''
+import random, sys
+import numpy as np
+from columnar import ColumnTable
+from parallel_eval import evaluate_parallel
+from rule_engine import create_rule
+from rule_program import compile_program
+
+rng = random.Random(0)
+size = 5000
+table = ColumnTable(np.arange(1, size + 1), {
+    'age': np.array([rng.randint(18, 70) for _ in range(size)]),
+    'income': np.array([rng.randint(20, 90) * 1000.0 for _ in range(size)]),
+})
+programs = [(i, compile_program(create_rule(rule)).to_bytes()) for i, rule in enumerate(sys.argv[1:])]
+single = evaluate_parallel(table, programs, workers=1)
+shared = evaluate_parallel(table, programs, workers=2, chunk_rows=500)
+assert all(np.array_equal(single[i], shared[i]) for i, _ in programs)
+print(sum(len(ids) for ids in shared.values()))
+'''
+
+    def test_workers_leave_shared_memory_to_the_parent(self):
+        # Workers that registered the blocks they attach made the resource tracker complain on exit
+        rules = ['age > 40', 'age <= 30 OR income > 50000', '(age > 25 AND income < 40000) OR age = 60']
+        result = subprocess.run([sys.executable, '-c', self.SCRIPT, *rules], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertGreater(int(result.stdout), 0)
+        self.assertEqual(result.stderr, '')
+
+if __name__ == '__main__':
+    unittest.main()
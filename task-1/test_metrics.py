@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+from metrics import Metrics, SamplingProfiler
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.observe_request('GET', 'evaluate_user', 200, 0.002, cpu_seconds=0.001)
+        metrics.observe_request('GET', 'evaluate_user', 200, 0.3)
+        metrics.record_rule(7, True)
+        metrics.record_rule(7, False)
+        with metrics.phase('evaluate'):
+            metrics.observe_sqlite(0.0)
+        text = metrics.render()
+        labels = 'method="GET",route="evaluate_user",status="200"'
+        self.assertIn(f'rules_request_duration_seconds_bucket{{{labels},le="0.0025"}} 1', text)
+        self.assertIn(f'rules_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'rules_request_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn('rules_request_cpu_seconds_total{method="GET",route="evaluate_user"} 0.001', text)
+        self.assertIn('rules_phase_calls_total{phase="evaluate"} 1', text)
+        self.assertIn('rules_phase_calls_total{phase="sqlite"} 1', text)
+        self.assertIn('rules_rule_evaluations_total{rule_id="7"} 2', text)
+        self.assertIn('rules_rule_matches_total{rule_id="7"} 1', text)
+        self.assertEqual(metrics.hottest_rules(1), [{'rule_id': 7, 'evaluations': 2, 'matches': 1, 'match_rate': 0.5}])
+
+    def test_disabled(self):
+        metrics = Metrics(enabled=False)
+        metrics.observe_request('GET', 'evaluate_user', 200, 0.002)
+        metrics.record_rule(1, True)
+        with metrics.phase('evaluate'):
+            pass
+        self.assertEqual((metrics.requests, metrics.rules, metrics.phases), ({}, {}, {}))
+
+    def test_render_while_recording(self):
+        metrics = Metrics()
+        stop = threading.Event()
+
+        def record(worker):
+            i = 0
+            while not stop.is_set():
+                # New keys keep arriving for a while, then existing ones are updated
+                metrics.record_rule(worker * 1000 + i % 300, i % 2 == 0)
+                metrics.observe_request('GET', f'route {i % 50}', 200 + worker, 0.001, cpu_seconds=0.0)
+                with metrics.phase(f'phase {i % 20}'):
+                    pass
+                i += 1
+
+        threads = [threading.Thread(target=record, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(20):
+                # Iterating the live dicts used to fail with "dictionary changed size during iteration"
+                metrics.render()
+                metrics.hottest_rules(5)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.assertLessEqual(len(metrics.rules), 4 * 300)
+        self.assertLessEqual(len(metrics.requests), 4 * 50)
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_reports_while_sampling(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,))
+        worker.start()
+        profiler = SamplingProfiler(interval=0.0005)
+        profiler.start()
+        try:
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                profiler.hottest_functions(5)
+                profiler.collapsed()
+        finally:
+            profiler.stop()
+            stop.set()
+            worker.join()
+        self.assertFalse(profiler.running)
+        self.assertGreater(profiler.samples, 0)
+        self.assertEqual(sum(profiler.snapshot().values()), profiler.samples)
+        self.assertIn('test_metrics.py:spin', [name for name, _ in profiler.hottest_functions(10)])
+
+    def test_profile_report(self):
+        metrics = Metrics()
+        self.assertIsNone(metrics.profile_report())
+        profiler = metrics.start_profiler(0.001)
+        self.assertIs(metrics.start_profiler(), profiler)  # already running
+        metrics.stop_profiler()
+        report = metrics.profile_report(3)
+        self.assertFalse(report['running'])
+        self.assertLessEqual(len(report['stacks']), 3)
+        self.assertLessEqual(sum(stack['samples'] for stack in report['stacks']), report['samples'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,118 @@
-from config import ALERT_THRESHOLD
+from config import ALERT_THRESHOLD, ALERT_CONSECUTIVE, ALERT_HYSTERESIS
 
-def check_alerts(cursor):
-    cursor.execute('SELECT city, temp FROM weather WHERE temp > ?', (ALERT_THRESHOLD,))
-    alerts = cursor.fetchall()
+FIRED = 'fired'
+RESOLVED = 'resolved'
 
-    # Remove duplicates by using a dictionary with (city, temp) as keys
-    unique_alerts = {}
-    for city, temp in alerts:
-        if (city, temp) not in unique_alerts:
-            unique_alerts[(city, temp)] = True
+def ensure_alert_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_id INTEGER NOT NULL,
+        last_dt INTEGER
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_state (
+        city TEXT PRIMARY KEY,
+        active INTEGER NOT NULL,
+        streak INTEGER NOT NULL,
+        temp REAL,
+        dt INTEGER
+    )
+    ''')
 
-    if unique_alerts:
+class AlertEngine:
+    """Per-city temperature alerts, updated from the weather rows added since the last run.
+
+    An alert fires after `consecutive` readings in a row above the threshold
+    and resolves after as many readings at or below threshold - hysteresis.
+    Only those transitions are reported. A reading counts once per observation:
+    rows whose dt is not newer than the city's last counted one (the API repeats
+    its current observation between updates) are skipped. The id of the last
+    row examined and the per-city state are stored in the database, so each run
+    reads new rows only.
+    """
+
+    def __init__(self, conn, threshold=ALERT_THRESHOLD, consecutive=ALERT_CONSECUTIVE, hysteresis=ALERT_HYSTERESIS,
+                 chunk_size=10000):
+        self.conn = conn
+        self.threshold = threshold
+        self.consecutive = consecutive
+        self.hysteresis = hysteresis
+        self.chunk_size = chunk_size
+        ensure_alert_tables(conn.cursor())
+        conn.commit()
+
+    def _load(self, cursor):
+        row = cursor.execute('SELECT last_id, last_dt FROM alert_checkpoint WHERE id = 1').fetchone()
+        checkpoint = row if row else (0, None)
+        states = {city: [active, streak, temp, dt] for city, active, streak, temp, dt in
+                  cursor.execute('SELECT city, active, streak, temp, dt FROM alert_state')}
+        return checkpoint, states
+
+    def _step(self, state, temp):
+        # Advance one city's state by one reading; returns the transition, if any
+        active, streak = state[:2]
+        if not active:
+            streak = streak + 1 if temp > self.threshold else 0
+            if streak >= self.consecutive:
+                state[:2] = [1, 0]
+                return FIRED
+        else:
+            streak = streak + 1 if temp <= self.threshold - self.hysteresis else 0
+            if streak >= self.consecutive:
+                state[:2] = [0, 0]
+                return RESOLVED
+        state[1] = streak
+        return None
+
+    def process(self):
+        """Examine rows added since the last call and return (city, transition, temp, dt) tuples."""
+        cursor = self.conn.cursor()
+        (last_id, last_dt), states = self._load(cursor)
+        transitions = []
+        changed = {}
+
+        cursor.execute('SELECT id, city, temp, dt FROM weather WHERE id > ? ORDER BY id', (last_id,))
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            for row_id, city, temp, dt in rows:
+                state = states.setdefault(city, [0, 0, None, None])
+                if state[3] is not None and dt <= state[3]:
+                    continue  # the same observation polled again, or an older one
+                transition = self._step(state, temp)
+                if transition:
+                    transitions.append((city, transition, temp, dt))
+                state[2:] = [temp, dt]
+                changed[city] = tuple(state)
+            last_id, last_dt = rows[-1][0], rows[-1][3]
+
+        # State and checkpoint move together, so a crash cannot skip or replay rows
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO alert_state (city, active, streak, temp, dt) VALUES (?, ?, ?, ?, ?)',
+                                  [(city, *values) for city, values in changed.items()])
+            self.conn.execute('INSERT OR REPLACE INTO alert_checkpoint (id, last_id, last_dt) VALUES (1, ?, ?)',
+                              (last_id, last_dt))
+        return transitions
+
+    def active_alerts(self):
+        return self.conn.execute('SELECT city, temp, dt FROM alert_state WHERE active = 1 ORDER BY city').fetchall()
+
+def check_alerts(cursor, engine=None):
+    # Pass the engine along between cycles to avoid re-running its setup every time
+    if engine is None:
+        engine = AlertEngine(cursor.connection)
+    transitions = engine.process()
+
+    if transitions:
         print("Alerts:")
-        for (city, temp) in unique_alerts.keys():
-            print(f"Alert: {city} has exceeded the temperature threshold with {temp:.2f}°C")
+        for city, transition, temp, dt in transitions:
+            if transition == FIRED:
+                print(f"Alert: {city} has exceeded the temperature threshold with {temp:.2f}°C")
+            else:
+                print(f"Resolved: {city} is back down to {temp:.2f}°C")
     else:
-        print("No alerts")
+        print("No new alerts")
+    return transitions
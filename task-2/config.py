@@ -10,3 +10,14 @@ COORDINATES = [
 ]
 INTERVAL = 300  # 5 minutes
 ALERT_THRESHOLD = 35  # Celsius
+
+# Polling many locations
+MAX_CONCURRENCY = 16  # requests in flight at once, and pooled keep-alive connections
+REQUEST_TIMEOUT = (3.05, 10)  # connect and read timeouts in seconds
+MAX_RETRIES = 3  # further attempts after a failed request
+BACKOFF_BASE = 0.5  # seconds; the retry delay is drawn from [0, BACKOFF_BASE * 2 ** attempt]
+BACKOFF_MAX = 8.0
+
+# Alert state changes
+ALERT_CONSECUTIVE = 2  # readings in a row needed to fire an alert, and to resolve it
+ALERT_HYSTERESIS = 2.0  # Celsius below ALERT_THRESHOLD a reading must be to count towards resolving
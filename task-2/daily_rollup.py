@@ -0,0 +1,131 @@
+import sqlite3
+
+# Per (city, UTC day) running aggregates of the weather readings, kept current by triggers in the
+# inserting or deleting transaction. daily_condition counts readings per condition, for the dominant one.
+ROLLUP_TABLES = '''
+CREATE TABLE IF NOT EXISTS daily_summary (
+    city TEXT NOT NULL,
+    date TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sum_temp REAL NOT NULL,
+    min_temp REAL NOT NULL,
+    max_temp REAL NOT NULL,
+    dominant_condition TEXT,
+    PRIMARY KEY (city, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_condition (
+    city TEXT NOT NULL,
+    date TEXT NOT NULL,
+    main TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (city, date, main)
+) WITHOUT ROWID;
+'''
+
+# Trigger bodies; an update runs the delete steps for the old row, then the insert steps for the new one
+ROLLUP_INSERT_STEPS = '''
+    INSERT INTO daily_summary (city, date, count, sum_temp, min_temp, max_temp)
+    VALUES (NEW.city, date(NEW.dt, 'unixepoch'), 1, NEW.temp, NEW.temp, NEW.temp)
+    ON CONFLICT (city, date) DO UPDATE SET
+        count = count + 1,
+        sum_temp = sum_temp + excluded.sum_temp,
+        min_temp = min(min_temp, excluded.min_temp),
+        max_temp = max(max_temp, excluded.max_temp);
+
+    INSERT INTO daily_condition (city, date, main, count)
+    VALUES (NEW.city, date(NEW.dt, 'unixepoch'), NEW.main, 1)
+    ON CONFLICT (city, date, main) DO UPDATE SET count = count + 1;
+
+    -- The most frequent condition, ties going to the first by name (as in rebuild_daily_summary)
+    UPDATE daily_summary SET dominant_condition = NEW.main
+    WHERE city = NEW.city AND date = date(NEW.dt, 'unixepoch') AND (
+        dominant_condition IS NULL OR
+        (SELECT count FROM daily_condition c
+         WHERE c.city = NEW.city AND c.date = daily_summary.date AND c.main = NEW.main) >
+        (SELECT count FROM daily_condition c
+         WHERE c.city = NEW.city AND c.date = daily_summary.date AND c.main = daily_summary.dominant_condition) OR
+        ((SELECT count FROM daily_condition c
+          WHERE c.city = NEW.city AND c.date = daily_summary.date AND c.main = NEW.main) =
+         (SELECT count FROM daily_condition c
+          WHERE c.city = NEW.city AND c.date = daily_summary.date AND c.main = daily_summary.dominant_condition)
+         AND NEW.main < dominant_condition));
+'''
+
+ROLLUP_DELETE_STEPS = '''
+    UPDATE daily_condition SET count = count - 1
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch') AND main = OLD.main;
+    DELETE FROM daily_condition
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch') AND main = OLD.main AND count <= 0;
+
+    UPDATE daily_summary SET count = count - 1, sum_temp = sum_temp - OLD.temp
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch');
+    DELETE FROM daily_summary
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch') AND count <= 0;
+
+    -- Extremes cannot be decremented: rescan the day's readings, but only if the deleted one was an extreme
+    UPDATE daily_summary SET
+        min_temp = (SELECT min(temp) FROM {table}
+                    WHERE city = OLD.city AND dt >= OLD.dt - OLD.dt % 86400 AND dt < OLD.dt - OLD.dt % 86400 + 86400),
+        max_temp = (SELECT max(temp) FROM {table}
+                    WHERE city = OLD.city AND dt >= OLD.dt - OLD.dt % 86400 AND dt < OLD.dt - OLD.dt % 86400 + 86400)
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch') AND (min_temp = OLD.temp OR max_temp = OLD.temp);
+
+    UPDATE daily_summary SET dominant_condition = (
+        SELECT main FROM daily_condition c
+        WHERE c.city = OLD.city AND c.date = daily_summary.date
+        ORDER BY count DESC, main LIMIT 1)
+    WHERE city = OLD.city AND date = date(OLD.dt, 'unixepoch') AND dominant_condition = OLD.main;
+'''
+
+# Installed on every table holding raw readings: weather itself, or each of its partitions (weather_storage.py)
+ROLLUP_TRIGGERS = f'''
+CREATE TRIGGER IF NOT EXISTS {{table}}_daily_insert AFTER INSERT ON {{table}}
+BEGIN{ROLLUP_INSERT_STEPS}END;
+
+CREATE TRIGGER IF NOT EXISTS {{table}}_daily_delete AFTER DELETE ON {{table}}
+BEGIN{ROLLUP_DELETE_STEPS}END;
+
+CREATE TRIGGER IF NOT EXISTS {{table}}_daily_update AFTER UPDATE OF city, temp, main, dt ON {{table}}
+BEGIN{ROLLUP_DELETE_STEPS}{ROLLUP_INSERT_STEPS}END;
+'''
+
+def rollup_triggers(table):
+    return ROLLUP_TRIGGERS.format(table=table)
+
+def ensure_daily_summary(cursor):
+    # Creates the rollup and fills it from existing rows the first time; afterwards the triggers keep it current
+    objects = dict(cursor.execute(
+        "SELECT name, type FROM sqlite_master WHERE name IN ('daily_summary', 'weather', 'weather_daily_update')"))
+    if objects.get('weather') == 'table' and 'weather_daily_update' not in objects:
+        # An unpartitioned weather table; partitions get their triggers when they are created
+        cursor.connection.executescript(rollup_triggers('weather'))
+    if 'daily_summary' not in objects:
+        rebuild_daily_summary(cursor.connection)
+
+def rebuild_daily_summary(conn):
+    """Recompute the rollup from the weather table, e.g. after rows were changed with the triggers missing."""
+    with conn:
+        conn.executescript('BEGIN;' + ROLLUP_TABLES + '''
+            DELETE FROM daily_summary;
+            DELETE FROM daily_condition;
+
+            INSERT INTO daily_condition (city, date, main, count)
+            SELECT city, date(dt, 'unixepoch'), main, COUNT(*) FROM weather
+            GROUP BY city, date(dt, 'unixepoch'), main;
+
+            INSERT INTO daily_summary (city, date, count, sum_temp, min_temp, max_temp, dominant_condition)
+            SELECT city, date(dt, 'unixepoch'), COUNT(*), SUM(temp), MIN(temp), MAX(temp),
+                   (SELECT main FROM daily_condition c
+                    WHERE c.city = weather.city AND c.date = date(weather.dt, 'unixepoch')
+                    ORDER BY count DESC, main LIMIT 1)
+            FROM weather
+            GROUP BY city, date(dt, 'unixepoch');
+            COMMIT;
+        ''')
+    return conn.execute('SELECT COUNT(*) FROM daily_summary').fetchone()[0]
+
+if __name__ == "__main__":
+    conn = sqlite3.connect('weather_data.db')
+    print(f"Rebuilt daily_summary: {rebuild_daily_summary(conn)} city-days")
+    conn.close()
@@ -1,15 +1,18 @@
 import sqlite3
 from datetime import datetime
 import matplotlib.pyplot as plt
+from daily_rollup import ensure_daily_summary
 
 def calculate_daily_summary(cursor):
+    ensure_daily_summary(cursor)
+    # Reads one row per city and day from the rollup instead of aggregating every reading
     cursor.execute('''
-        SELECT city, strftime('%Y-%m-%d', datetime(dt, 'unixepoch')) as date,
-               AVG(temp) as avg_temp,
-               MAX(temp) as max_temp,
-               MIN(temp) as min_temp
-        FROM weather
-        GROUP BY city, date
+        SELECT city, date,
+               sum_temp / count as avg_temp,
+               max_temp,
+               min_temp
+        FROM daily_summary
+        ORDER BY city, date
     ''')
     
     data = cursor.fetchall()
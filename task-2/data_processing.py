@@ -1,30 +1,83 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from config import API_KEY, BASE_URL, COORDINATES
+from requests.adapters import HTTPAdapter
+from config import (API_KEY, BASE_URL, COORDINATES, MAX_CONCURRENCY, REQUEST_TIMEOUT, MAX_RETRIES,
+                    BACKOFF_BASE, BACKOFF_MAX)
+from weather_writer import WeatherWriter
 import sqlite3
 from datetime import datetime, timedelta
 
-def fetch_weather_data(lat, lon, api_key):
-    url = f"{BASE_URL}?key={api_key}&q={lat},{lon}"
-    response = requests.get(url)
-    data = response.json()
-
-    if response.status_code != 200:
-        print(f"Error fetching data: {data.get('error', {}).get('message', 'Unknown error')}")
-        return None
-    
-    return data
-
-def store_weather_data(conn, cursor, city, temp, feels_like, condition, dt, avg_temp=None, min_temp=None, max_temp=None):
-    cursor.execute('''
-    INSERT INTO weather (city, temp, feels_like, main, dt, avg_temp, min_temp, max_temp) 
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (city, temp, feels_like, condition, dt, avg_temp, min_temp, max_temp))
-    conn.commit()
-
-def process_weather_data(conn, cursor):
-    for city, lat, lon in COORDINATES:
-        data = fetch_weather_data(lat, lon, API_KEY)
-        
+# Worth another attempt: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def create_session(pool_size=MAX_CONCURRENCY):
+    # One keep-alive connection per concurrent request, reused across polling cycles
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # "Full jitter": spreads out the retries of locations that failed together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def fetch_weather_data(lat, lon, api_key, session=None, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES,
+                       base_url=BASE_URL):
+    url = f"{base_url}?key={api_key}&q={lat},{lon}"
+    http = session or requests
+    for attempt in range(retries + 1):
+        try:
+            response = http.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                try:
+                    return response.json()
+                except ValueError:
+                    error = 'Invalid JSON in response'
+            else:
+                try:
+                    error = response.json().get('error', {}).get('message', 'Unknown error')
+                except (ValueError, AttributeError):
+                    error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+        if attempt < retries:
+            time.sleep(backoff_delay(attempt))
+
+    print(f"Error fetching data: {error}")
+    return None
+
+def fetch_all_weather_data(locations, api_key, session=None, max_workers=MAX_CONCURRENCY, **kwargs):
+    """Fetch every (city, lat, lon) location at most max_workers at a time.
+
+    Returns (city, data) pairs in the order of locations, with data None where the fetch failed.
+    """
+    own_session = session is None
+    if own_session:
+        session = create_session(max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda location: fetch_weather_data(location[1], location[2], api_key,
+                                                                       session=session, **kwargs),
+                                   locations)
+            return [(city, data) for (city, lat, lon), data in zip(locations, results)]
+    finally:
+        if own_session:
+            session.close()
+
+def process_weather_data(conn, cursor, session=None, locations=COORDINATES, max_workers=MAX_CONCURRENCY,
+                         writer=None):
+    # Fetches run concurrently; rows are written from this thread, which owns the connection,
+    # and the whole cycle is committed in one transaction
+    if writer is None:
+        writer = WeatherWriter(conn)
+    written = writer.rows_written
+    for city, data in fetch_all_weather_data(locations, API_KEY, session=session, max_workers=max_workers):
         if data is None or 'current' not in data:
             print(f"Invalid data received for {city}. Skipping.")
             continue
@@ -40,4 +93,7 @@ def process_weather_data(conn, cursor):
         min_temp = temp - 5  # Example value, replace with actual logic if needed
         max_temp = temp + 5  # Example value, replace with actual logic if needed
         
-        store_weather_data(conn, cursor, city, temp, feels_like, condition, dt, avg_temp, min_temp, max_temp)
+        writer.add(city, temp, feels_like, condition, dt, avg_temp, min_temp, max_temp)
+
+    writer.flush()
+    print(f"Stored {writer.rows_written - written} observations ({writer.rows_per_second:.0f} rows/sec)")
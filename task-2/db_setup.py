@@ -1,24 +1,22 @@
 import sqlite3
+from alerting import ensure_alert_tables
+from daily_rollup import ensure_daily_summary
+from weather_storage import ensure_storage
 
 def setup_database():
     conn = sqlite3.connect('weather_data.db')
     cursor = conn.cursor()
+    # WAL lets readers (summaries, plots) run alongside the writer, and with
+    # synchronous=NORMAL a commit no longer waits for an fsync
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
     
-    # Create table with additional fields for average, min, and max temperature
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS weather (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        city TEXT NOT NULL,
-        temp REAL NOT NULL,
-        feels_like REAL NOT NULL,
-        main TEXT NOT NULL,
-        dt INTEGER NOT NULL,
-        avg_temp REAL,
-        min_temp REAL,
-        max_temp REAL
-    )
-    ''')
-    
+    # Readings are stored in monthly partitions behind the weather view (an older
+    # weather table is migrated into them), with avg, min and max temperature fields
+    ensure_storage(conn)
+    ensure_alert_tables(cursor)
+    ensure_daily_summary(cursor)
+
     conn.commit()
     print("Database Created or Updated Successfully")
     return conn, cursor
@@ -1,20 +1,23 @@
 import time
 from db_setup import setup_database
-from data_processing import process_weather_data
-from alerting import check_alerts
+from data_processing import create_session, process_weather_data
+from alerting import AlertEngine, check_alerts
 from daily_summary import calculate_daily_summary, plot_daily_summaries
 from config import INTERVAL
 
 def main():
     conn, cursor = setup_database()
+    # Keep-alive connections to the weather API are reused from one cycle to the next
+    session = create_session()
+    alerts = AlertEngine(conn)
 
     try:
         while True:
             print(f"Fetching and processing weather data at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            process_weather_data(conn, cursor)
+            process_weather_data(conn, cursor, session)
             
             print("Checking alerts...")
-            check_alerts(cursor)
+            check_alerts(cursor, alerts)
             
             print("Calculating daily summaries...")
             summaries = calculate_daily_summary(cursor)
@@ -32,6 +35,7 @@ def main():
         print(f"An error occurred: {e}")
     
     finally:
+        session.close()
         conn.close()
         print("Database connection closed.")
 
@@ -1,5 +1,6 @@
 import sqlite3
 import random
+from weather_storage import ensure_storage, insert_rows
 from datetime import datetime, timedelta
 
 def generate_simulated_data(start_date, days, cities):
@@ -25,15 +26,13 @@ def generate_simulated_data(start_date, days, cities):
     return simulated_data
 
 def insert_simulated_data(conn, cursor, data):
-    cursor.executemany('''
-        INSERT INTO weather (city, temp, feels_like, main, dt, avg_temp, min_temp, max_temp) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', data)
+    insert_rows(conn, data)
     conn.commit()
 
 def main():
     conn = sqlite3.connect('weather_data.db')
     cursor = conn.cursor()
+    ensure_storage(conn)
 
     cities = ["Delhi", "Mumbai", "Chennai", "Bangalore", "Kolkata", "Hyderabad"]
     start_date = datetime.now() - timedelta(days=30)  # Simulate data for the last 30 days
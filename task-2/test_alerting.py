@@ -0,0 +1,96 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from alerting import AlertEngine, FIRED, RESOLVED
+from weather_storage import ensure_storage, insert_rows
+
+JULY = 1719792000  # 2024-07-01 00:00 UTC
+STEP = 300
+
+class TestAlertEngine(unittest.TestCase):
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix='alerts-test-')
+        self.addCleanup(shutil.rmtree, workdir, True)
+        self.path = os.path.join(workdir, 'weather.db')
+        self.conn = self.connect()
+        ensure_storage(self.conn)
+        self.next_dt = {}
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def engine(self, conn=None):
+        return AlertEngine(conn or self.conn, threshold=35, consecutive=2, hysteresis=2, chunk_size=3)
+
+    def add(self, city, *temps, dt=None):
+        rows = []
+        for temp in temps:
+            if dt is None:
+                self.next_dt[city] = self.next_dt.get(city, JULY) + STEP
+            rows.append((city, temp, temp, 'Clear', dt or self.next_dt[city], None, None, None))
+        with self.conn:
+            insert_rows(self.conn, rows)
+
+    def test_fires_after_consecutive_readings(self):
+        engine = self.engine()
+        self.add('Delhi', 36, 34, 36)
+        self.add('Mumbai', 30)
+        self.assertEqual(engine.process(), [])
+        self.add('Delhi', 37)
+        self.assertEqual(engine.process(), [('Delhi', FIRED, 37, self.next_dt['Delhi'])])
+        self.assertEqual(engine.active_alerts(), [('Delhi', 37, self.next_dt['Delhi'])])
+        # Still above the threshold: no new transition
+        self.add('Delhi', 38, 39)
+        self.assertEqual(engine.process(), [])
+
+    def test_resolves_with_hysteresis(self):
+        engine = self.engine()
+        self.add('Delhi', 36, 36)
+        self.assertEqual([transition for city, transition, temp, dt in engine.process()], [FIRED])
+        # At or below the threshold but inside the hysteresis band, the alert stays
+        self.add('Delhi', 35, 34, 33.5, 34)
+        self.assertEqual(engine.process(), [])
+        self.add('Delhi', 33, 36, 32, 33)
+        self.assertEqual(engine.process(), [('Delhi', RESOLVED, 33, self.next_dt['Delhi'])])
+        self.assertEqual(engine.active_alerts(), [])
+
+    def test_repeated_observations_count_once(self):
+        engine = self.engine()
+        self.add('Delhi', 36)
+        dt = self.next_dt['Delhi']
+        # The API returned the same observation on the next polls, and an older one once
+        self.add('Delhi', 36, 36, dt=dt)
+        self.add('Delhi', 37, dt=dt - STEP)
+        self.assertEqual(engine.process(), [])
+        self.add('Delhi', 36, dt=dt)
+        self.assertEqual(engine.process(), [])
+        self.add('Delhi', 36)
+        self.assertEqual(engine.process(), [('Delhi', FIRED, 36, self.next_dt['Delhi'])])
+
+    def test_resumes_from_the_checkpoint_after_a_restart(self):
+        self.add('Delhi', 36)
+        self.add('Mumbai', 36, 36)
+        self.assertEqual([city for city, *_ in self.engine().process()], ['Mumbai'])
+        self.conn.close()
+
+        self.conn = self.connect()
+        engine = self.engine()
+        # Rows already examined are not replayed
+        self.assertEqual(engine.process(), [])
+        # Delhi's streak and last observation survived the restart
+        self.add('Delhi', 36, dt=self.next_dt['Delhi'])
+        self.assertEqual(engine.process(), [])
+        self.add('Delhi', 36)
+        self.add('Mumbai', 30, 30)
+        self.assertEqual([(city, transition) for city, transition, temp, dt in engine.process()],
+                         [('Delhi', FIRED), ('Mumbai', RESOLVED)])
+        last_id = self.conn.execute('SELECT max(id) FROM weather').fetchone()[0]
+        self.assertEqual(self.conn.execute('SELECT last_id FROM alert_checkpoint').fetchone()[0], last_id)
+
+if __name__ == '__main__':
+    unittest.main()
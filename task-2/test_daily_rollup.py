@@ -0,0 +1,119 @@
+import random
+import sqlite3
+import unittest
+from daily_rollup import ensure_daily_summary, rebuild_daily_summary
+from weather_storage import create_partition, ensure_storage
+
+JULY = 1719792000  # 2024-07-01 00:00 UTC
+DAY = 86400
+CONDITIONS = ('Clear', 'Clouds', 'Haze', 'Rain')
+
+RECOMPUTE = '''
+SELECT city, date(dt, 'unixepoch') AS day, COUNT(*), round(SUM(temp), 6), MIN(temp), MAX(temp),
+       (SELECT main FROM weather w
+        WHERE w.city = weather.city AND date(w.dt, 'unixepoch') = date(weather.dt, 'unixepoch')
+        GROUP BY main ORDER BY COUNT(*) DESC, main LIMIT 1)
+FROM weather
+GROUP BY city, day
+ORDER BY city, day
+'''
+
+ROLLUP = '''
+SELECT city, date, count, round(sum_temp, 6), min_temp, max_temp, dominant_condition
+FROM daily_summary
+ORDER BY city, date
+'''
+
+LEGACY_SCHEMA = '''
+CREATE TABLE weather (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    city TEXT NOT NULL,
+    temp REAL NOT NULL,
+    feels_like REAL NOT NULL,
+    main TEXT NOT NULL,
+    dt INTEGER NOT NULL,
+    avg_temp REAL,
+    min_temp REAL,
+    max_temp REAL
+)
+'''
+
+def readings(rng, count, days=3):
+    return [(rng.choice(('Delhi', 'Mumbai')), rng.randint(20, 40) + rng.choice((0, 0.5)), 30.0,
+             rng.choice(CONDITIONS), JULY + rng.randrange(days * DAY)) for _ in range(count)]
+
+class RollupChecks:
+    """Changes a table of raw readings and compares daily_summary with a GROUP BY over weather."""
+
+    table = 'weather'
+
+    def assertRollupMatches(self):
+        self.assertEqual(self.conn.execute(ROLLUP).fetchall(), self.conn.execute(RECOMPUTE).fetchall())
+
+    def insert(self, rows):
+        with self.conn:
+            self.conn.executemany('INSERT INTO weather (city, temp, feels_like, main, dt) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def ids(self):
+        return [row_id for (row_id,) in self.conn.execute('SELECT id FROM weather ORDER BY id')]
+
+    def test_insert(self):
+        rng = random.Random(1)
+        for _ in range(5):
+            self.insert(readings(rng, 40))
+            self.assertRollupMatches()
+
+    def test_update(self):
+        rng = random.Random(2)
+        self.insert(readings(rng, 200))
+        for row_id in rng.sample(self.ids(), 60):
+            city, temp, feels_like, main, dt = readings(rng, 1)[0]
+            column, value = rng.choice((('temp', temp), ('main', main), ('city', city), ('dt', dt)))
+            with self.conn:
+                self.conn.execute(f'UPDATE {self.table} SET {column} = ? WHERE id = ?', (value, row_id))
+            self.assertRollupMatches()
+        # Every reading of a day becomes the same: min, max and the dominant condition collapse
+        with self.conn:
+            self.conn.execute(f"UPDATE {self.table} SET temp = 25, main = 'Rain' WHERE dt < ?", (JULY + DAY,))
+        self.assertRollupMatches()
+
+    def test_delete(self):
+        rng = random.Random(3)
+        self.insert(readings(rng, 200))
+        ids = self.ids()
+        rng.shuffle(ids)
+        for row_id in ids[:150]:
+            with self.conn:
+                self.conn.execute('DELETE FROM weather WHERE id = ?', (row_id,))
+            self.assertRollupMatches()
+        with self.conn:
+            self.conn.execute('DELETE FROM weather')
+        self.assertEqual(self.conn.execute(ROLLUP).fetchall(), [])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM daily_condition').fetchone()[0], 0)
+
+    def test_rebuild(self):
+        self.insert(readings(random.Random(4), 100))
+        expected = self.conn.execute(ROLLUP).fetchall()
+        self.assertEqual(rebuild_daily_summary(self.conn), len(expected))
+        self.assertEqual(self.conn.execute(ROLLUP).fetchall(), expected)
+
+class TestPartitionedRollup(RollupChecks, unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        ensure_storage(self.conn)
+        # The weather view has no UPDATE trigger; updates go to the partition holding the rows
+        self.table = create_partition(self.conn, '2024-07')
+
+class TestUnpartitionedRollup(RollupChecks, unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.conn.execute(LEGACY_SCHEMA)
+        ensure_daily_summary(self.conn.cursor())
+        self.conn.commit()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from data_processing import fetch_weather_data, fetch_all_weather_data
+
+class StubWeatherServer:
+    """Local stand-in for the weather API, answering current.json requests."""
+
+    def __init__(self, delay=0.0, failures=0, status=503):
+        self.delay = delay
+        self.failures = failures  # requests answered with status before succeeding
+        self.status = status
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/current.json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    failing = stub.requests <= stub.failures
+                time.sleep(stub.delay)
+                if failing:
+                    status, body = stub.status, {'error': {'message': 'Service unavailable'}}
+                else:
+                    status, body = 200, {'current': {'temp_c': 30.0, 'feelslike_c': 32.0,
+                                                     'condition': {'text': 'Clear'},
+                                                     'last_updated_epoch': 1672531200}}
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except ConnectionError:
+                    pass  # the client timed out and hung up
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class TestConcurrentFetch(unittest.TestCase):
+
+    def setUp(self):
+        # No real waiting between retries
+        patcher = mock.patch('data_processing.backoff_delay', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _server(self, **kwargs):
+        server = StubWeatherServer(**kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def test_fetches_concurrently_within_the_limit(self):
+        server = self._server(delay=0.1)
+        locations = [(f'City{i}', i, i) for i in range(40)]
+
+        start = time.perf_counter()
+        results = fetch_all_weather_data(locations, 'key', max_workers=8, base_url=server.url)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([city for city, data in results], [city for city, lat, lon in locations])
+        self.assertTrue(all(data['current']['temp_c'] == 30.0 for city, data in results))
+        self.assertLessEqual(server.max_in_flight, 8)
+        # Serially this would take 40 * 0.1 seconds
+        self.assertLess(elapsed, 2.0)
+        # Keep-alive: connections are reused rather than opened per request
+        self.assertLessEqual(server.connections, 8)
+
+    def test_retries_server_errors(self):
+        server = self._server(failures=2)
+        data = fetch_weather_data(1, 2, 'key', retries=3, base_url=server.url)
+        self.assertEqual(data['current']['condition']['text'], 'Clear')
+        self.assertEqual(server.requests, 3)
+
+    def test_gives_up_after_retries(self):
+        server = self._server(failures=10)
+        self.assertIsNone(fetch_weather_data(1, 2, 'key', retries=2, base_url=server.url))
+        self.assertEqual(server.requests, 3)
+
+    def test_does_not_retry_client_errors(self):
+        server = self._server(failures=10, status=400)
+        self.assertIsNone(fetch_weather_data(1, 2, 'key', retries=3, base_url=server.url))
+        self.assertEqual(server.requests, 1)
+
+    def test_times_out(self):
+        server = self._server(delay=0.5)
+        start = time.perf_counter()
+        self.assertIsNone(fetch_weather_data(1, 2, 'key', timeout=0.1, retries=1, base_url=server.url))
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from daily_rollup import ensure_daily_summary
+from weather_storage import (DEFAULT_PARTITION, create_partition, drop_partition, ensure_storage, list_partitions,
+                             repartition_default)
+
+JULY = 1719792000     # 2024-07-01 00:00 UTC
+AUGUST = 1722470400   # 2024-08-01 00:00 UTC
+SEPTEMBER = 1725148800
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='storage-test-')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.conn = sqlite3.connect(os.path.join(self.workdir, 'weather.db'))
+        self.addCleanup(self.conn.close)
+
+    def insert(self, *rows):
+        with self.conn:
+            self.conn.executemany('INSERT INTO weather (city, temp, feels_like, main, dt) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def rows(self, table):
+        return self.conn.execute(f'SELECT id, city, dt, date FROM {table} ORDER BY id').fetchall()
+
+    def months(self):
+        return [month for month, name, start, end in list_partitions(self.conn)]
+
+class TestPartitionRouting(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_storage(self.conn)
+
+    def test_view_inserts_go_to_their_month(self):
+        self.assertEqual(create_partition(self.conn, '2024-07'), 'weather_2024_07')
+        self.insert(('Delhi', 30, 31, 'Clear', JULY),
+                    ('Delhi', 31, 32, 'Clear', AUGUST - 1),
+                    ('Mumbai', 29, 30, 'Rain', AUGUST),
+                    ('Mumbai', 28, 29, 'Rain', JULY - 1))
+        self.assertEqual(self.rows('weather_2024_07'), [(1, 'Delhi', JULY, '2024-07-01'),
+                                                        (2, 'Delhi', AUGUST - 1, '2024-07-31')])
+        self.assertEqual(self.rows(DEFAULT_PARTITION), [(3, 'Mumbai', AUGUST, '2024-08-01'),
+                                                        (4, 'Mumbai', JULY - 1, '2024-06-30')])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM weather').fetchone()[0], 4)
+
+        # An explicit id moves the sequence past it
+        self.insert(('Delhi', 30, 31, 'Clear', JULY + 60))
+        with self.conn:
+            self.conn.execute("INSERT INTO weather (id, city, temp, feels_like, main, dt) VALUES (10, 'Delhi', 30, 31, 'Clear', ?)",
+                              (JULY + 120,))
+        self.insert(('Delhi', 30, 31, 'Clear', JULY + 180))
+        self.assertEqual([row[0] for row in self.rows('weather_2024_07')], [1, 2, 5, 10, 11])
+
+    def test_new_partitions_take_their_rows_from_the_default(self):
+        self.insert(('Delhi', 30, 31, 'Clear', JULY), ('Delhi', 31, 32, 'Clear', AUGUST),
+                    ('Mumbai', 29, 30, 'Rain', AUGUST + 60))
+        create_partition(self.conn, '2024-08')
+        self.assertEqual([row[0] for row in self.rows('weather_2024_08')], [2, 3])
+        self.assertEqual([row[0] for row in self.rows(DEFAULT_PARTITION)], [1])
+        # The rebuilt view routes the month to its new partition
+        self.insert(('Delhi', 32, 33, 'Clear', AUGUST + 120))
+        self.assertEqual([row[0] for row in self.rows('weather_2024_08')], [2, 3, 4])
+
+        self.assertEqual(repartition_default(self.conn), ['2024-07'])
+        self.assertEqual(self.months(), ['2024-07', '2024-08'])
+        self.assertEqual(self.rows(DEFAULT_PARTITION), [])
+        with self.conn:
+            self.conn.execute('DELETE FROM weather WHERE id = 3')
+        self.assertEqual([row[0] for row in self.rows('weather')], [1, 2, 4])
+
+    def test_months_must_be_zero_padded(self):
+        create_partition(self.conn, '2024-07')
+        for month in ('2024-7', '24-07', '2024-13', '2024/07', 'July'):
+            with self.assertRaises(ValueError, msg=month):
+                create_partition(self.conn, month)
+            with self.assertRaises(ValueError, msg=month):
+                drop_partition(self.conn, month)
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.months(), ['2024-07'])
+        # One reading through the view is stored once, and counted once
+        self.insert(('Delhi', 31, 32, 'Clear', JULY))
+        self.assertEqual(self.rows('weather'), [(1, 'Delhi', JULY, '2024-07-01')])
+        self.assertEqual(self.conn.execute('SELECT count, sum_temp FROM daily_summary').fetchall(), [(1, 31.0)])
+
+class TestMigration(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The schema written by earlier versions of db_setup.py
+        self.conn.execute('''
+        CREATE TABLE weather (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            temp REAL NOT NULL,
+            feels_like REAL NOT NULL,
+            main TEXT NOT NULL,
+            dt INTEGER NOT NULL,
+            avg_temp REAL,
+            min_temp REAL,
+            max_temp REAL
+        )
+        ''')
+        ensure_daily_summary(self.conn.cursor())
+        self.insert(('Delhi', 30, 31, 'Clear', JULY), ('Mumbai', 29, 30, 'Rain', AUGUST),
+                    ('Delhi', 34, 35, 'Haze', JULY + 3600))
+        with self.conn:
+            self.conn.execute('DELETE FROM weather WHERE id = 1')
+        self.insert(('Delhi', 32, 33, 'Clear', SEPTEMBER))
+        self.before = self.conn.execute('SELECT * FROM weather ORDER BY id').fetchall()
+        self.summary = self.conn.execute('SELECT * FROM daily_summary ORDER BY city, date').fetchall()
+
+    def test_table_is_moved_into_partitions(self):
+        ensure_storage(self.conn)
+        self.assertEqual(self.conn.execute("SELECT type FROM sqlite_master WHERE name = 'weather'").fetchone(),
+                         ('view',))
+        self.assertIsNone(self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'weather_unpartitioned'").fetchone())
+        self.assertEqual(self.months(), ['2024-07', '2024-08', '2024-09'])
+        # Same rows and ids, now with their date
+        columns = 'id, city, temp, feels_like, main, dt, avg_temp, min_temp, max_temp'
+        self.assertEqual(self.conn.execute(f'SELECT {columns} FROM weather ORDER BY id').fetchall(), self.before)
+        self.assertEqual(self.rows('weather_2024_07'), [(3, 'Delhi', JULY + 3600, '2024-07-01')])
+        self.assertEqual(self.rows('weather_2024_08'), [(2, 'Mumbai', AUGUST, '2024-08-01')])
+        self.assertEqual(self.conn.execute('SELECT * FROM daily_summary ORDER BY city, date').fetchall(),
+                         self.summary)
+
+        # New ids continue after the migrated ones, and a second call changes nothing
+        self.insert(('Delhi', 33, 34, 'Clear', SEPTEMBER + 60))
+        self.assertEqual(self.conn.execute('SELECT max(id) FROM weather_2024_09').fetchone()[0], 5)
+        ensure_storage(self.conn)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM weather').fetchone()[0], 4)
+
+class TestDropPartition(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_storage(self.conn)
+        self.insert(('Delhi', 30, 31, 'Clear', JULY), ('Delhi', 34, 35, 'Clear', JULY + 60),
+                    ('Delhi', 31, 32, 'Rain', AUGUST))
+        repartition_default(self.conn)
+
+    def test_drop_keeps_the_rollup(self):
+        summary = self.conn.execute('SELECT * FROM daily_summary ORDER BY date').fetchall()
+        drop_partition(self.conn, '2024-07')
+        self.assertEqual(self.months(), ['2024-08'])
+        self.assertIsNone(self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'weather_2024_07'").fetchone())
+        self.assertEqual([row[0] for row in self.rows('weather')], [3])
+        self.assertEqual(self.conn.execute('SELECT * FROM daily_summary ORDER BY date').fetchall(), summary)
+        # Readings for the dropped month land in the default partition again
+        self.insert(('Delhi', 29, 30, 'Clear', JULY + 120))
+        self.assertEqual([row[0] for row in self.rows(DEFAULT_PARTITION)], [4])
+
+    def test_drop_with_archive(self):
+        archive = os.path.join(self.workdir, 'archive.db')
+        drop_partition(self.conn, '2024-07', archive)
+        self.assertNotIn('archive', [name for seq, name, path in self.conn.execute('PRAGMA database_list')])
+        self.assertEqual(self.months(), ['2024-08'])
+        archived = sqlite3.connect(archive)
+        self.addCleanup(archived.close)
+        self.assertEqual(archived.execute('SELECT id, temp FROM weather_2024_07 ORDER BY id').fetchall(),
+                         [(1, 30), (2, 34)])
+
+    def test_archive_needs_a_committed_connection(self):
+        archive = os.path.join(self.workdir, 'archive.db')
+        self.conn.execute('DELETE FROM weather WHERE id = 3')
+        with self.assertRaises(sqlite3.ProgrammingError):
+            drop_partition(self.conn, '2024-07', archive)
+        # The caller's transaction is left open and uncommitted
+        self.assertTrue(self.conn.in_transaction)
+        self.conn.rollback()
+        self.assertEqual([row[0] for row in self.rows('weather')], [1, 2, 3])
+        self.assertEqual(self.months(), ['2024-07', '2024-08'])
+        self.assertFalse(os.path.exists(archive))
+
+    def test_unknown_month(self):
+        with self.assertRaises(ValueError):
+            drop_partition(self.conn, '2023-01')
+        self.assertEqual(self.months(), ['2024-07', '2024-08'])
+
+if __name__ == '__main__':
+    unittest.main()
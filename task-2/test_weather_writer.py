@@ -0,0 +1,96 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from weather_storage import ensure_storage
+from weather_writer import WeatherWriter
+
+JULY = 1719792000  # 2024-07-01 00:00 UTC
+
+class TestWeatherWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        ensure_storage(self.conn)
+        self.addCleanup(self.conn.close)
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM weather').fetchone()[0]
+
+    def test_flushes_when_max_rows_are_buffered(self):
+        writer = WeatherWriter(self.conn, max_rows=3, max_delay=60)
+        writer.add('Delhi', 30, 32, 'Clear', JULY)
+        writer.add('Delhi', 31, 33, 'Clear', JULY + 300)
+        self.assertEqual((self.count(), len(writer.rows)), (0, 2))
+        writer.add('Mumbai', 29, 31, 'Rain', JULY + 600)
+        self.assertEqual((self.count(), writer.rows), (3, []))
+        self.assertEqual((writer.rows_written, writer.flushes), (3, 1))
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_flushes_when_the_oldest_row_is_max_delay_old(self):
+        writer = WeatherWriter(self.conn, max_rows=100, max_delay=5.0)
+        with mock.patch('weather_writer.time.monotonic', side_effect=[100.0, 100.0, 104.9, 105.0]):
+            writer.add('Delhi', 30, 32, 'Clear', JULY)  # buffered at 100.0
+            writer.add('Delhi', 31, 33, 'Clear', JULY + 300)
+            self.assertEqual(self.count(), 0)
+            writer.add('Delhi', 32, 34, 'Clear', JULY + 600)
+        self.assertEqual((self.count(), writer.flushes), (3, 1))
+
+    def test_flush_and_context_manager(self):
+        writer = WeatherWriter(self.conn)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.flushes, 0)
+        with writer:
+            writer.add('Delhi', 30, 32, 'Clear', JULY)
+            self.assertEqual(writer.flush(), 1)
+            writer.add('Chennai', 33, 36, 'Haze', JULY + 40 * 86400)  # next month
+            self.assertEqual(self.count(), 1)
+        self.assertEqual((self.count(), writer.rows_written, writer.flushes), (2, 2, 2))
+        months = [month for (month,) in self.conn.execute('SELECT month FROM weather_partitions ORDER BY month')]
+        self.assertEqual(months, ['2024-07', '2024-08'])
+        self.assertGreater(writer.rows_per_second, 0)
+
+    def test_invalid_rows_are_dropped(self):
+        writer = WeatherWriter(self.conn)
+        writer.add('Delhi', 30, 32, 'Clear', JULY)
+        writer.add('Delhi', None, 33, 'Clear', JULY + 300)  # temp is NOT NULL
+        writer.add('Mumbai', 29, 31, 'Rain', JULY + 600)
+        with mock.patch('builtins.print') as printed:
+            self.assertEqual(writer.flush(), 2)
+        self.assertIn('Delhi', printed.call_args[0][0])
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.conn.execute('SELECT city, temp FROM weather ORDER BY dt').fetchall(),
+                         [('Delhi', 30), ('Mumbai', 29)])
+        self.assertEqual(self.conn.execute('SELECT count FROM daily_summary ORDER BY city').fetchall(), [(1,), (1,)])
+        self.assertEqual((writer.rows, writer.rows_written, writer.rows_rejected, writer.flushes), ([], 2, 1, 1))
+        # The writer keeps going afterwards
+        writer.add('Delhi', 31, 33, 'Clear', JULY + 900)
+        self.assertEqual(writer.flush(), 1)
+
+    def test_locked_database_keeps_the_rows(self):
+        workdir = tempfile.mkdtemp(prefix='writer-test-')
+        self.addCleanup(shutil.rmtree, workdir, True)
+        path = os.path.join(workdir, 'weather.db')
+        conn = sqlite3.connect(path, timeout=0)
+        self.addCleanup(conn.close)
+        ensure_storage(conn)
+        other = sqlite3.connect(path)
+        self.addCleanup(other.close)
+
+        writer = WeatherWriter(conn)
+        writer.add('Delhi', 30, 32, 'Clear', JULY)
+        other.execute('BEGIN IMMEDIATE')
+        with self.assertRaises(sqlite3.OperationalError):
+            writer.flush()
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual((len(writer.rows), writer.rows_written, writer.flushes), (1, 0, 0))
+
+        other.rollback()
+        writer.add('Delhi', 31, 33, 'Clear', JULY + 300)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(other.execute('SELECT temp FROM weather ORDER BY dt').fetchall(), [(30,), (31,)])
+
+if __name__ == '__main__':
+    unittest.main()
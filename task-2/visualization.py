@@ -2,7 +2,8 @@ import matplotlib.pyplot as plt
 import sqlite3
 
 def plot_weather_summary(cursor):
-    cursor.execute('SELECT city, AVG(temp) FROM weather GROUP BY city')
+    # From the daily rollup, which also covers months whose raw readings were dropped
+    cursor.execute('SELECT city, SUM(sum_temp) / SUM(count) FROM daily_summary GROUP BY city')
     data = cursor.fetchall()
     
     if not data:
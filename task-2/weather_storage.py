@@ -0,0 +1,271 @@
+import argparse
+import sqlite3
+from datetime import datetime, timezone
+from daily_rollup import ROLLUP_TABLES, rollup_triggers
+
+# Raw readings live in one table per UTC month (weather_2024_07, ...) plus weather_default for
+# months without a partition yet. The weather view unions them, and its INSTEAD OF triggers route
+# inserts and deletes, so code written against the old weather table keeps working.
+
+COLUMNS = ('id', 'city', 'temp', 'feels_like', 'main', 'dt', 'avg_temp', 'min_temp', 'max_temp', 'date')
+DEFAULT_PARTITION = 'weather_default'
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS weather_partitions (
+    month TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    start_dt INTEGER NOT NULL,
+    end_dt INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS weather_sequence (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO weather_sequence (id, seq) VALUES (1, 0);
+'''
+
+PARTITION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    temp REAL NOT NULL,
+    feels_like REAL NOT NULL,
+    main TEXT NOT NULL,
+    dt INTEGER NOT NULL,
+    avg_temp REAL,
+    min_temp REAL,
+    max_temp REAL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {table}_city_dt ON {table} (city, dt);
+CREATE INDEX IF NOT EXISTS {table}_date ON {table} (date, city);
+'''
+
+def month_of(dt):
+    return datetime.fromtimestamp(dt, timezone.utc).strftime('%Y-%m')
+
+def date_of(dt):
+    # Same as SQLite's date(dt, 'unixepoch')
+    return datetime.fromtimestamp(dt, timezone.utc).strftime('%Y-%m-%d')
+
+def month_bounds(month):
+    year, number = map(int, month.split('-'))
+    start = datetime(year, number, 1, tzinfo=timezone.utc)
+    end = datetime(year + number // 12, number % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+def check_month(month):
+    # Only the zero-padded form, so '2024-7' cannot add a second partition for the same range
+    parsed = datetime.strptime(month, '%Y-%m')
+    if month != f'{parsed.year:04d}-{parsed.month:02d}':
+        raise ValueError(f"Month must be YYYY-MM, not {month!r}")
+    return month
+
+def partition_name(month):
+    return 'weather_' + month.replace('-', '_')
+
+def _run_script(conn, script):
+    # Like executescript, but inside the caller's transaction
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+
+def _begin(conn):
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+def list_partitions(conn):
+    return conn.execute('SELECT month, name, start_dt, end_dt FROM weather_partitions ORDER BY month').fetchall()
+
+def _create_table(conn, table):
+    _run_script(conn, PARTITION_SCHEMA.format(table=table))
+    _run_script(conn, rollup_triggers(table))
+
+def _rebuild_view(conn):
+    partitions = list_partitions(conn)
+    names = [DEFAULT_PARTITION] + [name for month, name, start, end in partitions]
+    columns = ', '.join(COLUMNS)
+    new_values = ', '.join(['coalesce(NEW.id, (SELECT seq FROM weather_sequence WHERE id = 1))'] +
+                           [f'NEW.{column}' for column in COLUMNS[1:-1]] + ["date(NEW.dt, 'unixepoch')"])
+
+    # Dropping the view drops its triggers with it
+    conn.execute('DROP VIEW IF EXISTS weather')
+    conn.execute('CREATE VIEW weather AS ' + ' UNION ALL '.join(f'SELECT {columns} FROM {name}' for name in names))
+
+    routes = ''.join(f'''
+        INSERT INTO {name} ({columns}) SELECT {new_values} WHERE NEW.dt >= {start} AND NEW.dt < {end};'''
+                     for month, name, start, end in partitions)
+    conn.execute(f'''
+    CREATE TRIGGER weather_insert INSTEAD OF INSERT ON weather
+    BEGIN
+        UPDATE weather_sequence SET seq = CASE WHEN NEW.id IS NULL THEN seq + 1 ELSE max(seq, NEW.id) END
+        WHERE id = 1;{routes}
+        INSERT INTO {DEFAULT_PARTITION} ({columns}) SELECT {new_values}
+        WHERE NOT EXISTS (SELECT 1 FROM weather_partitions WHERE NEW.dt >= start_dt AND NEW.dt < end_dt);
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER weather_delete INSTEAD OF DELETE ON weather
+    BEGIN{''.join(f"""
+        DELETE FROM {name} WHERE id = OLD.id;""" for name in names)}
+    END
+    ''')
+
+def _move_rows(conn, source, target, start, end):
+    # Delete before inserting, so the rollup triggers never see a day split across two tables
+    columns = ', '.join(COLUMNS)
+    conn.execute('DROP TABLE IF EXISTS temp.weather_moving')
+    conn.execute(f'CREATE TEMP TABLE weather_moving AS SELECT {columns} FROM {source} WHERE dt >= ? AND dt < ?',
+                 (start, end))
+    conn.execute(f'DELETE FROM {source} WHERE dt >= ? AND dt < ?', (start, end))
+    conn.execute(f'INSERT INTO {target} ({columns}) SELECT {columns} FROM temp.weather_moving ORDER BY id')
+    conn.execute('DROP TABLE temp.weather_moving')
+
+def _create_partition(conn, month, rebuild_view=True):
+    name = partition_name(check_month(month))
+    if conn.execute('SELECT 1 FROM weather_partitions WHERE month = ?', (month,)).fetchone():
+        return name
+    start, end = month_bounds(month)
+    _create_table(conn, name)
+    conn.execute('INSERT INTO weather_partitions (month, name, start_dt, end_dt) VALUES (?, ?, ?, ?)',
+                 (month, name, start, end))
+    # Readings for this month that arrived before the partition existed
+    _move_rows(conn, DEFAULT_PARTITION, name, start, end)
+    if rebuild_view:
+        _rebuild_view(conn)
+    return name
+
+def create_partition(conn, month):
+    check_month(month)
+    _begin(conn)
+    name = _create_partition(conn, month)
+    conn.commit()
+    return name
+
+def repartition_default(conn):
+    """Create partitions for every month found in weather_default, moving its rows into them."""
+    _begin(conn)
+    months = [month for (month,) in conn.execute(
+        f"SELECT DISTINCT strftime('%Y-%m', dt, 'unixepoch') FROM {DEFAULT_PARTITION}")]
+    for month in months:
+        _create_partition(conn, month, rebuild_view=False)
+    _rebuild_view(conn)
+    conn.commit()
+    return months
+
+def drop_partition(conn, month, archive_path=None):
+    """Remove a month of raw readings by dropping its table; the daily_summary rollup keeps those days.
+
+    With archive_path the partition is first copied into that database file. ATTACH is not
+    allowed inside a transaction, so the caller must commit or roll back first.
+    """
+    name = partition_name(check_month(month))
+    if not conn.execute('SELECT 1 FROM weather_partitions WHERE month = ?', (month,)).fetchone():
+        raise ValueError(f"No partition for {month}")
+    if archive_path:
+        if conn.in_transaction:
+            raise sqlite3.ProgrammingError("Commit or roll back the open transaction before archiving a partition")
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+        try:
+            conn.execute(f'CREATE TABLE archive.{name} AS SELECT * FROM main.{name}')
+            conn.commit()
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    _begin(conn)
+    conn.execute('DELETE FROM weather_partitions WHERE month = ?', (month,))
+    # No row-level triggers fire: the table and its indexes are released as a whole
+    conn.execute(f'DROP TABLE {name}')
+    _rebuild_view(conn)
+    conn.commit()
+
+def _migrate_table(conn):
+    # Move the rows of an unpartitioned weather table into partitions, keeping their ids
+    conn.execute('DROP TRIGGER IF EXISTS weather_daily_insert')
+    conn.execute('DROP TRIGGER IF EXISTS weather_daily_delete')
+    conn.execute('DROP TRIGGER IF EXISTS weather_daily_update')
+    conn.execute('ALTER TABLE weather RENAME TO weather_unpartitioned')
+    # The partitions' triggers rebuild the rollup as the rows are copied in
+    conn.execute('DELETE FROM daily_summary')
+    conn.execute('DELETE FROM daily_condition')
+    months = [month for (month,) in conn.execute(
+        "SELECT DISTINCT strftime('%Y-%m', dt, 'unixepoch') FROM weather_unpartitioned")]
+    source_columns = ', '.join(COLUMNS[:-1]) + ", date(dt, 'unixepoch')"
+    for month in months:
+        name = _create_partition(conn, month, rebuild_view=False)
+        start, end = month_bounds(month)
+        conn.execute(f'''INSERT INTO {name} ({', '.join(COLUMNS)})
+                         SELECT {source_columns} FROM weather_unpartitioned WHERE dt >= ? AND dt < ? ORDER BY id''',
+                     (start, end))
+    conn.execute('UPDATE weather_sequence SET seq = max(seq, (SELECT coalesce(max(id), 0) FROM weather_unpartitioned))')
+    conn.execute('DROP TABLE weather_unpartitioned')
+
+def ensure_storage(conn):
+    """Create the partition catalog and the weather view, migrating an existing weather table."""
+    _begin(conn)
+    _run_script(conn, ROLLUP_TABLES)
+    _run_script(conn, CATALOG_SCHEMA)
+    _create_table(conn, DEFAULT_PARTITION)
+    for month, name, start, end in list_partitions(conn):
+        # Partitions created before a trigger was added to the rollup get it here
+        _run_script(conn, rollup_triggers(name))
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'weather'").fetchone()
+    if kind and kind[0] == 'table':
+        _migrate_table(conn)
+    if not kind or kind[0] == 'table':
+        _rebuild_view(conn)
+    conn.commit()
+
+def insert_rows(conn, rows):
+    """Insert (city, temp, feels_like, main, dt, avg_temp, min_temp, max_temp) rows straight into their partitions.
+
+    Runs in the caller's transaction, creating missing month partitions first.
+    """
+    _begin(conn)
+    by_partition = {}
+    for row in rows:
+        by_partition.setdefault(month_of(row[4]), []).append(row)
+    known = {month for month, name, start, end in list_partitions(conn)}
+    for month in by_partition:
+        if month not in known:
+            _create_partition(conn, month)
+
+    seq = conn.execute('SELECT seq FROM weather_sequence WHERE id = 1').fetchone()[0]
+    conn.execute('UPDATE weather_sequence SET seq = ? WHERE id = 1', (seq + len(rows),))
+    placeholders = ', '.join('?' * len(COLUMNS))
+    for month, partition_rows in by_partition.items():
+        values = []
+        for row in partition_rows:
+            seq += 1
+            values.append((seq, *row, date_of(row[4])))
+        conn.executemany(f"INSERT INTO {partition_name(month)} ({', '.join(COLUMNS)}) VALUES ({placeholders})", values)
+    return len(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage the monthly partitions of weather_data.db.')
+    parser.add_argument('command', choices=['list', 'create', 'drop', 'repartition'])
+    parser.add_argument('month', nargs='?', help='YYYY-MM, for create and drop')
+    parser.add_argument('--archive', help='database file to copy a dropped partition into')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect('weather_data.db')
+    ensure_storage(conn)
+    if args.command in ('create', 'drop') and not args.month:
+        parser.error(f"{args.command} needs a month")
+    try:
+        if args.command == 'create':
+            print(f"Created {create_partition(conn, args.month)}")
+        elif args.command == 'drop':
+            drop_partition(conn, args.month, args.archive)
+            print(f"Dropped {partition_name(args.month)}")
+        elif args.command == 'repartition':
+            print(f"Partitioned months: {', '.join(repartition_default(conn)) or 'none'}")
+    except ValueError as e:
+        parser.error(str(e))
+    for month, name, start, end in list_partitions(conn):
+        count = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+        print(f"{month}  {name}  {count} rows")
+    conn.close()
@@ -0,0 +1,81 @@
+import sqlite3
+import time
+from weather_storage import insert_rows
+
+class WeatherWriter:
+    """Buffers weather observations and writes them with executemany, one transaction per flush.
+
+    A flush happens when max_rows observations are buffered, when flush() is
+    called, e.g. at the end of a polling cycle, or when a row is added after
+    the oldest buffered one has waited max_delay seconds. The delay is only
+    checked in add(): a writer that receives no more rows holds its buffer
+    until the next flush(). Rows go straight to their monthly partitions (see
+    weather_storage.py).
+
+    If the database is locked or busy (sqlite3.OperationalError) the batch is
+    kept for the next flush. Observations that violate a constraint, e.g. a
+    missing temperature, are dropped and counted in rows_rejected, so one bad
+    row cannot block the rest of the buffer for good.
+    """
+
+    def __init__(self, conn, max_rows=500, max_delay=5.0):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.rows = []
+        self.first_buffered = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.rows_rejected = 0
+        self.write_seconds = 0.0
+
+    def add(self, city, temp, feels_like, condition, dt, avg_temp=None, min_temp=None, max_temp=None):
+        if not self.rows:
+            self.first_buffered = time.monotonic()
+        self.rows.append((city, temp, feels_like, condition, dt, avg_temp, min_temp, max_temp))
+        if len(self.rows) >= self.max_rows or time.monotonic() - self.first_buffered >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        rows, self.rows = self.rows, []
+        start = time.perf_counter()
+        try:
+            try:
+                with self.conn:  # commits, or rolls back on error
+                    written = insert_rows(self.conn, rows)
+            except sqlite3.IntegrityError:
+                written = self._insert_valid(rows)
+        except sqlite3.OperationalError:
+            # Locked or busy: keep the observations for the next attempt
+            self.rows = rows + self.rows
+            raise
+        self.write_seconds += time.perf_counter() - start
+        self.rows_written += written
+        self.flushes += 1
+        return written
+
+    def _insert_valid(self, rows):
+        # One invalid observation fails the whole executemany; write the rows one by one instead.
+        # A failed INSERT only undoes its own statement, so the transaction carries on.
+        written = 0
+        with self.conn:
+            for row in rows:
+                try:
+                    insert_rows(self.conn, [row])
+                    written += 1
+                except sqlite3.IntegrityError as e:
+                    self.rows_rejected += 1
+                    print(f"Dropped invalid observation for {row[0]}: {e}")
+        return written
+
+    @property
+    def rows_per_second(self):
+        return self.rows_written / self.write_seconds if self.write_seconds else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()